@@ -1,35 +1,62 @@
-from flask import Flask, render_template
-from services.loadDataFirebaseServices import push_data_to_firebase, get_weather_data
+from flask import Flask, Response, render_template, request
+from services.loadDataFirebaseServices import push_forecasts_to_firebase, get_weather_data, get_stations_data
 from models.rain_model import get_24h_forecast, get_7day_forecast, get_weather_summary
-from config.server_config import FIREBASE_PATHS
+from config.server_config import FIREBASE_PATHS, RETENTION, SERVING, STREAM
+from services.forecastSchedulerServices import ForecastScheduler
+from services.forecastCacheServices import (forecast_response, get_station_cache, publish_shared,
+                                            response_cache, use_shared_file)
+from services.stationServices import DEFAULT_STATION, check_station, list_stations, station_path
 import threading
 import time
 import requests
 import os
 from datetime import datetime
 import logging
-from tensorflow.keras.models import load_model
-from models.rain_model import get_24h_forecast as rain_24h, get_7day_forecast as rain_7d
-from models.temp_humidity_model import forecast_24h as temp_24h, forecast_7d as temp_7d
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from models.rain_model import get_predictor
+from models.temp_humidity_model import get_temp_model, temp_models_loaded
+from models.forecast_tasks import submit_forecasts
+from models.forecast_memo import forecast_memo
+from models.forecast_simulate import BodyTooLarge, build_datas, parse_horizons, parse_windows, read_body, simulate
+from services.metricsServices import metrics
+from services.firebaseStreamServices import get_streams_data, start_streams, stream_status
+from services.retentionServices import run_retention
+from services.leaderServices import LeaderLock
 from datetime import datetime
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger(__name__)
-model_24h = load_model("data/models/temp-humidity/best_model.keras")
-model_7d = load_model("data/models/temp-humidity/best_model_7d.keras")
+# Thread đẩy kết quả lên Firebase, chạy chồng lên việc cập nhật cache (publish)
+push_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='push')
 
-def du_bao(data):
-    print("Bắt đầu quá trình dự báo ")
+# Trạng thái sẵn sàng: HTTP chạy ngay, model được load ở thread khởi động
+readiness = {
+    'models_loaded': False,
+    'models_loaded_at': None,
+    'first_forecast_at': None,
+    'error': None,
+}
 
-    temp_forecast_24h = temp_24h(model_24h,data)
-    temp_forecast_7d = temp_7d(model_7d,data)
-    rain_forecast_24h = rain_24h(data)
-    rain_forecast_7d = rain_7d(data)
+def khoi_dong_model():
+    """Load trước các model trong thread nền để request đầu tiên không phải chờ"""
+    started = time.perf_counter()
+    try:
+        get_temp_model('24h')
+        get_temp_model('7d')
+        get_predictor()
+        readiness['models_loaded'] = temp_models_loaded()
+        readiness['models_loaded_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        logger.info(f"Đã load model sau {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        readiness['error'] = str(e)
+        logger.error(f"Lỗi load model: {e}")
 
-    # Gộp dữ liệu 
+def merge_24h(temp_forecast_24h, rain_forecast_24h):
+    """Gộp dự báo nhiệt độ và mưa 24h của một trạm"""
     rain_24h_dict = {
-        datetime.strptime(entry['time'], '%Y-%m-%d %H:%M:%S'): entry['probability']
+        datetime.fromisoformat(entry['time']): entry['probability']
         for entry in rain_forecast_24h
     }
 
@@ -42,7 +69,10 @@ def du_bao(data):
             'temp': round(entry['temp'], 2),
             'rain_probability': round(rain_prob, 1)
         })
+    return merged_24h
 
+def merge_7d(temp_forecast_7d, rain_forecast_7d):
+    """Gộp dự báo nhiệt độ và mưa 7 ngày của một trạm"""
     rain_7d_dict = {
         entry['date']: entry['max_probability']
         for entry in rain_forecast_7d
@@ -58,20 +88,80 @@ def du_bao(data):
             'temp_min': entry['temp_min'],
             'max_rain_probability': round(rain_prob, 1)
         })
-    push_forecast_to_firebase(merged_24h, merged_7d)
-    return {
-        'forecast_24h': merged_24h,
-        'forecast_7d': merged_7d
+    return merged_7d
+
+def merge_horizon(futures, horizon, merge):
+    """Chờ 2 tác vụ của một horizon rồi gộp theo trạm; trạm thiếu dữ liệu nhiệt độ bị bỏ qua"""
+    temp, rain = futures[f'temp_{horizon}'].result(), futures[f'rain_{horizon}'].result()
+    merged = {}
+    for station, forecast in temp.items():
+        if 'error' in forecast:
+            # Một trạm thiếu dữ liệu không làm hỏng dự báo của các trạm khác
+            print(f"❌ Bỏ qua dự báo {horizon} trạm {station}: {forecast['error']}")
+            continue
+        merged[station] = merge(forecast, rain[station])
+    return merged
+
+def merge_simulation(results):
+    """{horizon: {id: (nhiệt độ, mưa)}} -> danh sách theo id; cửa sổ không đủ dữ liệu cho horizon nào
+    thì horizon đó là null, lý do nằm trong 'errors'"""
+    merges = {'24h': merge_24h, '7d': merge_7d}
+    entries = {}
+    for horizon, pairs in results.items():
+        for key, (temp, rain) in pairs.items():
+            entry = entries.setdefault(key, {'id': key})
+            error = temp['error'] if 'error' in temp else str(rain) if isinstance(rain, Exception) else None
+            if error:
+                entry[f'forecast_{horizon}'] = None
+                entry.setdefault('errors', {})[horizon] = error
+            else:
+                entry[f'forecast_{horizon}'] = merges[horizon](temp, rain)
+    return list(entries.values())
+
+def du_bao(datas):
+    """Dự báo cho mọi trạm; 4 tác vụ chạy song song, mỗi model chỉ gọi một lần cho cả batch trạm
+
+    datas: {mã trạm: DataFrame} (một DataFrame được hiểu là trạm mặc định); các tác vụ
+    chỉ đọc datas. Cả hai node được đẩy lên Firebase trong một PATCH (atomic); việc đẩy chỉ
+    chạy chồng lên bước cập nhật cache.
+    """
+    print("Bắt đầu quá trình dự báo ")
+    if isinstance(datas, pd.DataFrame):
+        datas = {DEFAULT_STATION: datas}
+
+    futures = submit_forecasts(datas)
+    merged_24h = merge_horizon(futures, '24h', merge_24h)
+    merged_7d = merge_horizon(futures, '7d', merge_7d)
+    nodes = {**forecast_nodes('weather_24h', merged_24h, node_24h), **forecast_nodes('weather_7d', merged_7d, node_7d)}
+    push = push_executor.submit(push_forecast_to_firebase, nodes, len(merged_24h))
+
+    results = {
+        station: {'forecast_24h': merged_24h[station], 'forecast_7d': merged_7d[station]}
+        for station in datas if station in merged_24h and station in merged_7d
     }
-def push_forecast_to_firebase(merged_24h, merged_7d):
-    data_24h = {
+    # API đọc từ cache trong bộ nhớ, không cần chờ Firebase
+    for station, result in results.items():
+        get_station_cache(station).publish(result)
+    # Chế độ nhiều worker: ghi ra file để các worker khác trả cùng kết quả
+    publish_shared()
+    push.result()
+    if not results:
+        raise ValueError("Không trạm nào đủ dữ liệu để dự báo")
+
+    readiness['first_forecast_at'] = readiness['first_forecast_at'] or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return results
+
+def node_24h(merged_24h):
+    return {
         entry['time']: {
             'temp': entry['temp'],
             'rain': entry['rain_probability']
         }
         for entry in merged_24h
     }
-    data_7d = {
+
+def node_7d(merged_7d):
+    return {
         entry['date']: {
             'temp_max': entry['temp_max'],
             'temp_min': entry['temp_min'],
@@ -79,11 +169,18 @@ def push_forecast_to_firebase(merged_24h, merged_7d):
         }
         for entry in merged_7d
     }
-    push_data_to_firebase("weather_24h", data_24h)
-    print("Đã đẩy dữ liệu 24h lên Firebase")
 
-    push_data_to_firebase("weather_7d", data_7d)
-    print("Đã đẩy dữ liệu 7 ngày lên Firebase")
+def forecast_nodes(node, merged, to_node):
+    """{đường dẫn node của từng trạm: dữ liệu node} cho một loại dự báo"""
+    return {station_path(node, station).lstrip('/'): to_node(forecast) for station, forecast in merged.items()}
+
+def push_forecast_to_firebase(nodes, stations):
+    """Đẩy weather_24h và weather_7d của mọi trạm trong một multi-path PATCH, chỉ gồm các key thay đổi"""
+    if not nodes:
+        return 0
+    changed = push_forecasts_to_firebase(nodes)
+    print(f"Đã đẩy weather_24h, weather_7d của {stations} trạm lên Firebase ({changed} key thay đổi)")
+    return changed
 
 # hàm dự báo thời tiết với hiển thị chi tiết
 # def du_bao():
@@ -176,14 +273,34 @@ def push_forecast_to_firebase(merged_24h, merged_7d):
 #         logger.error(f"❌ Lỗi dự báo: {e}")
 #         print(f"❌ Exception: {e}")
 
+# Chỉ chạy lại dự báo khi dữ liệu đầu vào thay đổi
+# Mỗi chu kỳ lấy dữ liệu của mọi trạm đã đăng ký và dự báo chung một batch
+def lay_du_lieu():
+    """Chế độ stream đọc dữ liệu đã nhận qua luồng SSE, không gọi Firebase"""
+    return get_streams_data() if STREAM['enabled'] else get_stations_data()
+
+scheduler = ForecastScheduler(lay_du_lieu, du_bao)
+
 def lap_du_bao():
-    """Lặp dự báo mỗi 1 phút"""
-    logger.info("Bắt đầu dự báo tự động mỗi 1 phút")
-    
+    """Lặp kiểm tra dữ liệu theo TIMER, chỉ dự báo khi có dữ liệu mới"""
+    if STREAM['enabled']:
+        # Mỗi khi một giờ của trạm nào đó đủ dữ liệu thì chạy dự báo ngay
+        start_streams(on_hour_closed=lambda station, hour: scheduler.trigger())
+        logger.info("Nhận dữ liệu qua luồng Firebase, dự báo khi mỗi giờ đủ dữ liệu")
+    logger.info(f"Bắt đầu dự báo tự động, kiểm tra mỗi {scheduler.check_interval // 60} phút")
+    scheduler.run_forever()
+def lap_luu_tru():
+    """Định kỳ lưu trữ và xóa bản ghi cảm biến cũ trên Firebase (RETENTION)"""
+    if not RETENTION['enabled']:
+        return
+    logger.info(f"Lưu trữ dữ liệu cũ hơn {RETENTION['keepHours']}h, mỗi {RETENTION['intervalHours']}h")
     while True:
-        data = get_weather_data()
-        du_bao(data)
-        time.sleep(60)  # Đợi 1 phút
+        try:
+            run_retention()
+        except Exception as e:
+            logger.error(f"Lỗi lưu trữ: {e}")
+        time.sleep(RETENTION['intervalHours'] * 3600)
+
 def tu_ping():
     """Tự ping để không ngủ (chỉ trên Render)"""
     if not os.environ.get('RENDER_EXTERNAL_HOSTNAME'):
@@ -204,9 +321,70 @@ def tu_ping():
         except Exception as e:
             logger.error(f"Ping lỗi: {e}")
 
-# Khởi động các thread nền
-threading.Thread(target=lap_du_bao, daemon=True).start()
-threading.Thread(target=tu_ping, daemon=True).start()
+_background_started = False
+_background_lock = threading.Lock()
+
+def start_background():
+    """Khởi động các thread nền (gọi một lần khi chạy server, không chạy lúc import)"""
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+    threading.Thread(target=khoi_dong_model, daemon=True).start()
+    threading.Thread(target=lap_du_bao, daemon=True).start()
+    threading.Thread(target=tu_ping, daemon=True).start()
+    threading.Thread(target=lap_luu_tru, daemon=True).start()
+
+# ===== NHIỀU WORKER (gunicorn) =====
+# role: None khi chạy một process (python app.py), 'leader' / 'follower' khi chạy qua gunicorn
+serving = {'role': None, 'pid': os.getpid(), 'leader_since': None}
+leader_lock = None
+
+def cho_lam_leader():
+    """Thử giữ khóa leader định kỳ; leader chết thì worker đầu tiên khóa được sẽ chạy dự báo thay"""
+    while not leader_lock.acquire():
+        time.sleep(SERVING['leaderRetrySeconds'])
+    serving['role'] = 'leader'
+    serving['leader_since'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    logger.info(f"Worker {os.getpid()} là leader: load model và chạy dự báo")
+    mo_cong_leader()
+    start_background()
+
+def mo_cong_leader():
+    """Cổng HTTP nội bộ của leader (chỉ 127.0.0.1) để worker thường chuyển các request cần model sang"""
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True, name='leader-http').start()
+    path = SERVING['leaderAddressFile']
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        f.write(f"127.0.0.1:{server.server_port}")
+    os.replace(f"{path}.tmp", path)
+    logger.info(f"Leader nhận request chuyển tiếp tại 127.0.0.1:{server.server_port}")
+
+def chuyen_cho_leader(path, body):
+    """Worker thường: gửi request (đã đọc body) sang cổng nội bộ của leader, trả nguyên phản hồi"""
+    try:
+        with open(SERVING['leaderAddressFile'], 'r', encoding='utf-8') as f:
+            address = f.read().strip()
+        resp = requests.post(f"http://{address}{path}", params=request.args, data=body,
+                             headers={'Content-Type': request.content_type or ''},
+                             timeout=SERVING['forwardTimeoutSeconds'])
+    except (OSError, requests.RequestException) as e:
+        # Chưa có leader (đang bầu lại) hoặc leader vừa chết: file địa chỉ cũ không kết nối được
+        return {'error': f"Không chuyển được sang worker leader: {e}"}, 503
+    return Response(resp.content, status=resp.status_code, mimetype=resp.headers.get('Content-Type'))
+
+def start_serving():
+    """Gọi trong mỗi worker gunicorn (post_worker_init): chỉ leader load model và chạy các thread nền,
+    mọi worker trả API từ file kết quả của leader"""
+    global leader_lock
+    serving['pid'] = os.getpid()
+    serving['role'] = 'follower'
+    use_shared_file(SERVING['resultFile'])
+    leader_lock = LeaderLock(SERVING['lockFile'])
+    threading.Thread(target=cho_lam_leader, daemon=True, name='leader-election').start()
 
 # Routes
 @app.route("/")
@@ -221,10 +399,79 @@ def about():
 def health():
     return f"OK - {datetime.now().strftime('%H:%M:%S')}"
 
+@app.route("/ready")
+def ready():
+    # 200 khi model đã load xong, 503 khi vẫn đang khởi động
+    if serving['role'] == 'follower':
+        # Worker thường không load model: sẵn sàng khi đã có kết quả của leader để trả
+        available = response_cache().snapshot() is not None
+        return {**serving, 'forecast_available': available}, 200 if available else 503
+    return {**readiness, **serving}, 200 if readiness['models_loaded'] else 503
+
+@app.route("/api/forecast")
+@app.route("/api/forecast/<view>")
+def api_forecast(view='all'):
+    return forecast_response(request, view)
+
+@app.route("/api/forecast/simulate", methods=["POST"])
+def api_forecast_simulate():
+    """Dự báo trên các cửa sổ do người gọi gửi lên (JSON hoặc .npy), không đụng dữ liệu/kết quả của trạm"""
+    try:
+        body = read_body(request.stream, request.content_length)
+        horizons = parse_horizons(request.args.get('horizons'))
+        datas = build_datas(parse_windows(body, request.mimetype))
+    except BodyTooLarge as e:
+        return {'error': str(e)}, 413
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    if serving['role'] == 'follower':
+        # Worker thường không load model (xem start_serving): leader chấm thay
+        return chuyen_cho_leader(request.path, body)
+    return {'horizons': horizons, 'results': merge_simulation(simulate(datas, horizons))}
+
+@app.route("/api/stations")
+def api_stations():
+    return {'default': DEFAULT_STATION, 'stations': list_stations()}
+
+@app.route("/api/stations/<station>/forecast")
+@app.route("/api/stations/<station>/forecast/<view>")
+def api_station_forecast(station, view='all'):
+    try:
+        check_station(station)
+    except ValueError as e:
+        return {'error': str(e)}, 404
+    return forecast_response(request, view, response_cache(station))
+
+@app.route("/memo")
+def memo_status():
+    return forecast_memo.metrics()
+
+def memo_counters():
+    stats = forecast_memo.metrics()
+    return {
+        ('forecast_memo_lookups_total', (('result', result),)): stats[result]
+        for result in ('hits', 'disk_hits', 'misses')
+    }
+
+metrics.add_collector(memo_counters)
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route("/stream")
+def stream_endpoint():
+    return {'enabled': STREAM['enabled'], 'stations': stream_status()}
+
+@app.route("/scheduler")
+def scheduler_status():
+    return dict(scheduler.metrics)
+
 if __name__ == "__main__":
     port = int(os.environ.get('PORT', 5000))
     logger.info(f"🚀 Khởi động app cổng {port}")
-    logger.info("🔮 Dự báo tự động mỗi 1 phút")
+    logger.info(f"🔮 Kiểm tra dữ liệu dự báo mỗi {scheduler.check_interval // 60} phút")
     logger.info("🔄 Tự ping mỗi 14 phút (chỉ trên Render)")
+    start_background()
     
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,137 @@
+"""Đo độ trễ phần dự báo của một chu kỳ du_bao
+
+Chạy: python -m benchmarks.bench_du_bao --repeat 20
+      python -m benchmarks.bench_du_bao --cycle --latency 0.15   (cả chu kỳ du_bao, so sánh các executor)
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generate_hourly_frame
+from models.rain_model import WeatherPredictor, get_predictor
+
+
+def legacy_rain_cycle(data):
+    """Cách cũ: load model mỗi lần gọi và predict_proba từng giờ một"""
+    for horizon in (24, 168):
+        predictor = WeatherPredictor()
+        df = predictor.create_features(predictor.get_firebase_data(data.copy())).dropna()
+        X = np.tile(predictor.base_vector(df.iloc[-1]), (horizon, 1))
+        for row in X:
+            predictor.model.predict_proba(row.reshape(1, -1))
+
+
+def rain_cycle(data):
+    predictor = get_predictor()
+    predictor.predict_24h(data.copy())
+    predictor.predict_7days(data.copy())
+
+
+def legacy_du_bao(datas):
+    """Chu kỳ trước đây: 4 tác vụ tuần tự rồi một PATCH cho cả 24h và 7 ngày"""
+    import app
+    from models.forecast_tasks import FORECAST_TASKS
+    from services.loadDataFirebaseServices import push_forecasts_to_firebase
+
+    results = {name: task(datas) for name, task in FORECAST_TASKS.items()}
+    nodes = {}
+    for station in datas:
+        nodes[app.station_path('weather_24h', station).lstrip('/')] = app.node_24h(
+            app.merge_24h(results['temp_24h'][station], results['rain_24h'][station]))
+        nodes[app.station_path('weather_7d', station).lstrip('/')] = app.node_7d(
+            app.merge_7d(results['temp_7d'][station], results['rain_7d'][station]))
+    push_forecasts_to_firebase(nodes)
+
+
+def station_datas(data, stations):
+    """{mã trạm: DataFrame} cho `stations` trạm (trạm đầu là trạm mặc định)"""
+    from config.server_config import STATIONS
+    datas = {STATIONS['default']: data}
+    for i in range(1, stations):
+        station = f"st{i:03d}"
+        STATIONS['stations'].setdefault(station, {'name': f"Trạm thử {i}"})
+        datas[station] = data.assign(T2M=data['T2M'] + 0.05 * i)
+    return datas
+
+
+def cycle_benchmark(data, args):
+    """Cả chu kỳ app.du_bao (4 tác vụ + đẩy lên Firebase giả lập có độ trễ) theo từng executor"""
+    import app
+    import services.loadDataFirebaseServices as firebase
+    from benchmarks.fake_rtdb import FakeRTDB
+    from config.server_config import FORECAST
+    from models.forecast_tasks import shutdown_executor
+
+    db = FakeRTDB(latency=args.latency)
+    firebase.client.base_url = db.start()
+    datas = station_datas(data, args.stations)
+    checksums = {station: pd.util.hash_pandas_object(df).sum() for station, df in datas.items()}
+    print(f"{args.stations} trạm, độ trễ Firebase {args.latency * 1000:.0f} ms/request")
+    try:
+        for executor in args.executors:
+            shutdown_executor()
+            FORECAST['executor'] = 'serial' if executor == 'legacy' else executor
+            run = legacy_du_bao if executor == 'legacy' else app.du_bao
+            firebase._pushed_snapshots.clear()
+            run(datas)  # làm nóng: load model, dựng bộ đặc trưng, snapshot Firebase
+            times = []
+            for i in range(args.repeat):
+                # Đổi nhẹ giờ cuối để mỗi lần đẩy đều có key thay đổi
+                cycle_datas = {station: df.copy() for station, df in datas.items()}
+                for df in cycle_datas.values():
+                    df.loc[df.index[-1], 'T2M'] += 0.1 * (i + 1)
+                start = time.perf_counter()
+                run(cycle_datas)
+                times.append((time.perf_counter() - start) * 1000)
+            print(f"du_bao {executor:<8} p50 = {np.percentile(times, 50):8.1f} ms   p99 = {np.percentile(times, 99):8.1f} ms")
+    finally:
+        shutdown_executor()
+        db.stop()
+    for station, df in datas.items():
+        assert pd.util.hash_pandas_object(df).sum() == checksums[station], "du_bao không được sửa DataFrame đầu vào"
+
+
+def timeit(fn, data, repeat):
+    fn(data)  # làm nóng
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(data)
+        times.append((time.perf_counter() - start) * 1000)
+    return np.percentile(times, 50), np.percentile(times, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', type=int, default=400)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--with-temp', action='store_true', help='Đo cả hai model nhiệt độ')
+    parser.add_argument('--cycle', action='store_true', help='Đo cả chu kỳ app.du_bao với Firebase giả lập')
+    parser.add_argument('--executors', nargs='+', default=['legacy', 'serial', 'thread', 'process'])
+    parser.add_argument('--stations', type=int, default=1, help='số trạm trong mỗi chu kỳ (--cycle)')
+    parser.add_argument('--latency', type=float, default=0.15, help='độ trễ mỗi request tới Firebase giả lập (giây)')
+    args = parser.parse_args()
+
+    data = generate_hourly_frame(args.hours)
+    cycles = {'rain (cũ)': legacy_rain_cycle, 'rain (mới)': rain_cycle}
+
+    if args.with_temp:
+        from models.temp_humidity_model import forecast_24h, forecast_7d, get_temp_model
+
+        def full_cycle(df):
+            forecast_24h(get_temp_model('24h'), df)
+            forecast_7d(get_temp_model('7d'), df)
+            rain_cycle(df)
+        cycles['du_bao (mới)'] = full_cycle
+
+    if args.cycle:
+        return cycle_benchmark(data, args)
+
+    for name, fn in cycles.items():
+        p50, p99 = timeit(fn, data, args.repeat)
+        print(f"{name:<14} p50 = {p50:8.1f} ms   p99 = {p99:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""So sánh ghi dự báo kiểu cũ (DELETE + PATCH) với multi-path PATCH theo diff
+
+Chạy: python -m benchmarks.bench_firebase_writes --cycles 30
+Đếm số request mỗi chu kỳ và số lần một reader đọc thấy node dự báo bị trống
+"""
+import argparse
+import threading
+from datetime import datetime, timedelta
+import requests
+
+from benchmarks.fake_rtdb import FakeRTDB
+import services.loadDataFirebaseServices as firebase
+
+
+def forecast_nodes(cycle):
+    """Dự báo giả: cửa sổ 24h trượt 1 giờ mỗi chu kỳ, 7 ngày chỉ đổi giá trị ngày đầu"""
+    start = datetime(2025, 1, 1) + timedelta(hours=cycle)
+    data_24h = {
+        (start + timedelta(hours=h)).strftime('%Y-%m-%d %H:%M:%S'): {'temp': 27.0 + h % 5, 'rain': 10.0}
+        for h in range(24)
+    }
+    data_7d = {
+        (start + timedelta(days=d)).strftime('%Y-%m-%d'): {
+            'temp_max': 31.0, 'temp_min': 24.0, 'rain': float(cycle % 3 if d == 0 else 20)}
+        for d in range(7)
+    }
+    return {'weather_24h': data_24h, 'weather_7d': data_7d}
+
+
+def run(fake, url, push, cycles):
+    empty_reads = 0
+    stop = threading.Event()
+
+    def reader():
+        nonlocal empty_reads
+        while not stop.is_set():
+            if not requests.get(f"{url}/weather_24h.json").json():
+                empty_reads += 1
+
+    push(forecast_nodes(0))
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    fake.reset_stats()
+    for cycle in range(1, cycles + 1):
+        push(forecast_nodes(cycle))
+    stop.set()
+    thread.join()
+
+    final = forecast_nodes(cycles)
+    assert all(fake.get(f"/{node}") == data for node, data in final.items()), "Dữ liệu cuối không khớp"
+
+    writes = [r for r in fake.requests if r[0] != 'GET' or 'shallow' in r[1]]
+    return len(writes) / cycles, empty_reads
+
+
+def legacy_push(nodes):
+    for node, data in nodes.items():
+        firebase.push_data_to_firebase(node, data)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cycles', type=int, default=30)
+    args = parser.parse_args()
+
+    for name, push in [('DELETE + PATCH', legacy_push), ('multi-path diff', firebase.push_forecasts_to_firebase)]:
+        fake = FakeRTDB()
+        url = fake.start()
+        firebase.client.base_url = url
+        firebase._pushed_snapshots.clear()
+        try:
+            per_cycle, empty_reads = run(fake, url, push, args.cycles)
+        finally:
+            fake.stop()
+        print(f"{name:<16} {per_cycle:4.1f} request/chu kỳ, reader thấy node trống {empty_reads} lần")
+
+
+if __name__ == '__main__':
+    main()
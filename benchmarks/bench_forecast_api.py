@@ -0,0 +1,72 @@
+"""Đo số request/giây của /api/forecast/* phục vụ từ cache trong bộ nhớ
+
+Chạy: python -m benchmarks.bench_forecast_api --threads 8 --seconds 5
+Dùng app Flask tối giản với cùng hàm forecast_response nên không cần TensorFlow hay mạng
+"""
+import argparse
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+import requests
+from flask import Flask, request
+from werkzeug.serving import make_server
+
+from services.forecastCacheServices import forecast_cache, forecast_response
+
+
+def sample_result():
+    start = datetime(2025, 1, 1)
+    return {
+        'forecast_24h': [
+            {'time': (start + timedelta(hours=h)).strftime('%Y-%m-%d %H:%M:%S'),
+             'temp': 27.5, 'rain_probability': 12.3} for h in range(24)],
+        'forecast_7d': [
+            {'date': (start + timedelta(days=d)).strftime('%Y-%m-%d'),
+             'temp_max': 31.2, 'temp_min': 24.1, 'max_rain_probability': 40.0} for d in range(7)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app = Flask(__name__)
+
+    @app.route("/api/forecast")
+    @app.route("/api/forecast/<view>")
+    def api_forecast(view='all'):
+        return forecast_response(request, view)
+
+    forecast_cache.publish(sample_result())
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/api/forecast/24h"
+
+    for name, conditional in [('GET 200', False), ('GET 304 (If-None-Match)', True)]:
+        counts = [0] * args.threads
+        deadline = time.perf_counter() + args.seconds
+
+        def worker(i):
+            session = requests.Session()
+            etag = session.get(url).headers['ETag']
+            headers = {'If-None-Match': etag} if conditional else {}
+            while time.perf_counter() < deadline:
+                resp = session.get(url, headers=headers)
+                assert resp.status_code == (304 if conditional else 200)
+                counts[i] += 1
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        print(f"{name:<24} {sum(counts) / args.seconds:8.0f} request/giây ({args.threads} luồng)")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""So sánh số byte mỗi chu kỳ giữa tải toàn bộ và đồng bộ tăng dần
+
+Chạy: python -m benchmarks.bench_incremental_sync --hours 2000
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.fake_rtdb import FakeRTDB
+from benchmarks.synthetic import generate_readings, generate_weather_current
+from config.server_config import STORE, SYNC
+import services.loadDataFirebaseServices as firebase
+
+
+def dir_bytes(path, newer_than=None):
+    """(tổng byte, mtime mới nhất) của các file trong thư mục; newer_than: chỉ tính file sửa sau mốc đó"""
+    total, latest = 0, 0.0
+    for root, _, files in os.walk(path):
+        for name in files:
+            st = os.stat(os.path.join(root, name))
+            latest = max(latest, st.st_mtime)
+            if newer_than is None or st.st_mtime > newer_than:
+                total += st.st_size
+    return total if newer_than is not None else (total, latest)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', type=int, default=2000)
+    parser.add_argument('--per-hour', type=int, default=12)
+    parser.add_argument('--new-readings', type=int, default=1)
+    args = parser.parse_args()
+
+    start = datetime(2025, 1, 1)
+    tree = generate_readings(args.hours, args.per_hour, start=start)
+    tree['weather_data'] = generate_weather_current(start + timedelta(hours=args.hours))
+    fake = FakeRTDB(tree)
+    firebase.client.base_url = fake.start()
+    SYNC['cacheDir'] = tempfile.mkdtemp(prefix='rtdb-cache-')
+    STORE['dir'] = tempfile.mkdtemp(prefix='hourly-store-')
+
+    try:
+        fake.reset_stats()
+        firebase.get_weather_data(incremental=False)
+        full_bytes = fake.bytes_sent()
+
+        # Chu kỳ đầu tiên: cache trống nên phải tải toàn bộ lịch sử
+        firebase.get_weather_data(incremental=True)
+
+        # Thêm vài bản ghi mới rồi đo một chu kỳ ổn định
+        extra = generate_readings(1, args.new_readings, start=start + timedelta(hours=args.hours), seed=1)
+        for node, records in extra.items():
+            tree[node].update(records)
+        fake.reset_stats()
+        disk_before = dir_bytes(SYNC['cacheDir'])
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            firebase.get_weather_data(incremental=True)
+        tick_seconds = time.perf_counter() - started
+        tick_bytes = fake.bytes_sent()
+        disk_written = dir_bytes(SYNC['cacheDir'], newer_than=disk_before[1])
+        disk_total = dir_bytes(SYNC['cacheDir'])[0]
+    finally:
+        fake.stop()
+
+    records = sum(len(tree[node]) for node in SYNC['nodes'])
+    print(f"Lịch sử: {records} bản ghi")
+    print(f"Tải toàn bộ : {full_bytes:>12,} bytes/chu kỳ")
+    print(f"Tăng dần    : {tick_bytes:>12,} bytes/chu kỳ ({args.new_readings} bản ghi mới/node), "
+          f"{tick_seconds * 1000:.0f} ms, ghi cache {disk_written:,} bytes")
+    print(f"Cache node  : {disk_total:>12,} bytes trên đĩa (đọc lại khi khởi động ấm)")
+    assert tick_bytes * 50 < full_bytes, "Chu kỳ tăng dần vẫn tải O(lịch sử)"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""So sánh backend suy luận cho model LSTM nhiệt độ/độ ẩm: độ trễ p50/p99, sai số và bộ nhớ
+
+Chạy: python -m benchmarks.bench_inference --runs 200
+Mỗi backend chạy trong một tiến trình con riêng để đo RSS không bị lẫn với backend khác
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+
+from models.temp_humidity_model import TEMP_MODEL_PATHS
+
+CASES = [('keras', False), ('tflite', False), ('tflite', True), ('onnx', False)]
+
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    return pages * resource.getpagesize() / 2**20
+
+
+def run_case(backend, quantize, runs, export_dir):
+    """Chạy trong tiến trình con: load backend, đo độ trễ batch 1 và sai số so với Keras"""
+    from models.inference_backend import KerasBackend, load_backend
+    from tensorflow.keras.models import load_model
+
+    report = {}
+    models = {}
+    rng = np.random.default_rng(0)
+    for horizon, path in TEMP_MODEL_PATHS.items():
+        started = time.perf_counter()
+        model = models[horizon] = load_backend(path, backend=backend, quantize=quantize, export_dir=export_dir)
+        load_seconds = time.perf_counter() - started
+
+        X = rng.standard_normal((1,) + tuple(model.input_shape)).astype(np.float32)
+        model.predict(X)   # làm nóng
+        timings = []
+        for _ in range(runs):
+            t = time.perf_counter()
+            model.predict(X)
+            timings.append((time.perf_counter() - t) * 1000)
+        report[horizon] = {
+            'backend': model.name,
+            'load_seconds': load_seconds,
+            'p50_ms': float(np.percentile(timings, 50)),
+            'p99_ms': float(np.percentile(timings, 99)),
+        }
+    # Đo bộ nhớ trước khi load model Keras tham chiếu để so sai số
+    report['rss_mb'] = rss_mb()
+    report['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    for horizon, path in TEMP_MODEL_PATHS.items():
+        samples = rng.standard_normal((8,) + tuple(models[horizon].input_shape)).astype(np.float32)
+        reference = load_model(path).predict(samples, verbose=0)
+        report[horizon]['max_abs_error'] = float(np.max(np.abs(models[horizon].predict(samples) - reference)))
+    return report
+
+
+def legacy_predict(runs):
+    """Đường cũ: model.predict của Keras cho từng mẫu"""
+    from tensorflow.keras.models import load_model
+    report = {}
+    rng = np.random.default_rng(0)
+    for horizon, path in TEMP_MODEL_PATHS.items():
+        model = load_model(path)
+        X = rng.standard_normal((1,) + tuple(model.input_shape[1:])).astype(np.float32)
+        model.predict(X, verbose=0)
+        timings = []
+        for _ in range(runs):
+            t = time.perf_counter()
+            model.predict(X, verbose=0)
+            timings.append((time.perf_counter() - t) * 1000)
+        report[horizon] = {'backend': 'keras.predict', 'p50_ms': float(np.percentile(timings, 50)),
+                           'p99_ms': float(np.percentile(timings, 99)), 'max_abs_error': 0.0}
+    report['rss_mb'] = rss_mb()
+    report['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--export-dir', default=None, help='thư mục chứa file export (mặc định INFERENCE["exportDir"])')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--json', help='ghi kết quả ra file JSON')
+    args = parser.parse_args()
+
+    if args.case:
+        if args.case == 'legacy':
+            report = legacy_predict(args.runs)
+        else:
+            backend, quantize = args.case.split(':')
+            report = run_case(backend, quantize == '1', args.runs, args.export_dir)
+        print(json.dumps(report))
+        return
+
+    results = {}
+    for backend, quantize in [('legacy', False)] + CASES:
+        case = 'legacy' if backend == 'legacy' else f"{backend}:{int(quantize)}"
+        command = [sys.executable, '-m', 'benchmarks.bench_inference', '--case', case, '--runs', str(args.runs)]
+        if args.export_dir:
+            command += ['--export-dir', args.export_dir]
+        proc = subprocess.run(command, capture_output=True, text=True)
+        if proc.returncode:
+            print(f"{case}: lỗi\n{proc.stderr[-1000:]}")
+            continue
+        results[case] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    print(f"{'backend':<16}{'model':<6}{'p50 ms':>9}{'p99 ms':>9}{'lệch max':>11}{'RSS MB':>9}")
+    for case, report in results.items():
+        for horizon in TEMP_MODEL_PATHS:
+            r = report[horizon]
+            print(f"{r['backend']:<16}{horizon:<6}{r['p50_ms']:9.2f}{r['p99_ms']:9.2f}"
+                  f"{r['max_abs_error']:11.2e}{report['rss_mb']:9.0f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
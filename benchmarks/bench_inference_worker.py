@@ -0,0 +1,175 @@
+"""Độ trễ HTTP khi đang chạy dự báo: suy luận trong process web và trong tiến trình suy luận riêng
+
+Chạy: python -m benchmarks.bench_inference_worker --seconds 10
+Mỗi chế độ là một tiến trình con chạy app (werkzeug, nhiều thread) trên FakeRTDB; tiến trình cha
+gọi GET /api/forecast/24h liên tục và đo độ trễ, trước và trong khi app chạy du_bao liên tục.
+Phần 2: nhiều thread cùng gửi cửa sổ đơn lẻ tới tiến trình suy luận, so sánh maxWaitMs = 0 và mặc định.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import requests
+
+MODES = {'in-process': False, 'worker': True}
+
+
+def serve(worker):
+    """Trong tiến trình con: app + vòng du_bao liên tục khi nhận 'load' trên stdin"""
+    from werkzeug.serving import make_server
+    from config.server_config import INFERENCE_WORKER, MEMO, STORE, SYNC
+    INFERENCE_WORKER['enabled'] = worker
+    MEMO['enabled'] = False
+    SYNC['cacheDir'] = tempfile.mkdtemp(prefix='rtdb-cache-')
+    STORE['dir'] = tempfile.mkdtemp(prefix='hourly-store-')
+    import app
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        datas = app.get_stations_data()
+        app.khoi_dong_model()
+        app.du_bao(datas)
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"READY {server.server_port}", flush=True)
+
+    stop, cycles = threading.Event(), []
+
+    def forecast_loop():
+        while not stop.is_set():
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                app.du_bao(datas)
+            cycles.append(time.perf_counter() - start)
+
+    for line in sys.stdin:
+        if line.strip() == 'load':
+            threading.Thread(target=forecast_loop, daemon=True).start()
+        elif line.strip() == 'stop':
+            stop.set()
+            break
+    time.sleep(0.5)
+    print(json.dumps({'cycles': len(cycles), 'cycle_ms': float(np.median(cycles)) * 1000 if cycles else None}),
+          flush=True)
+    server.shutdown()
+
+
+def hammer(url, seconds):
+    """Gọi tuần tự trong `seconds` giây, trả về danh sách độ trễ (giây)"""
+    session = requests.Session()
+    latencies, deadline = [], time.time() + seconds
+    while time.time() < deadline:
+        start = time.perf_counter()
+        resp = session.get(url, timeout=30)
+        latencies.append(time.perf_counter() - start)
+        assert resp.status_code == 200
+    return latencies
+
+
+def summary(latencies):
+    ms = np.array(latencies) * 1000
+    return f"p50 {np.percentile(ms, 50):6.1f} ms  p99 {np.percentile(ms, 99):7.1f} ms  max {ms.max():7.1f} ms  ({len(ms)} req)"
+
+
+def latency_under_load(url, worker, seconds):
+    env = {**os.environ, 'FIREBASE_DATABASE_URL': url, 'TF_CPP_MIN_LOG_LEVEL': '3'}
+    proc = subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_inference_worker', '--serve',
+                             '1' if worker else '0'], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, text=True, env=env)
+    try:
+        line = proc.stdout.readline()
+        while line and not line.startswith('READY'):
+            line = proc.stdout.readline()
+        target = f"http://127.0.0.1:{int(line.split()[1])}/api/forecast/24h"
+        idle = hammer(target, seconds / 2)
+        proc.stdin.write('load\n')
+        proc.stdin.flush()
+        loaded = hammer(target, seconds)
+        proc.stdin.write('stop\n')
+        proc.stdin.flush()
+        stats = json.loads(proc.stdout.readline())
+    finally:
+        proc.wait(timeout=60)
+    return idle, loaded, stats
+
+
+def batching(threads, calls, backend):
+    """Nhiều thread gửi cửa sổ (1, 72, 9) cùng lúc: số lần gọi model và thông lượng"""
+    from config.server_config import INFERENCE, INFERENCE_WORKER
+    from models.inference_worker import InferenceWorker
+
+    INFERENCE['backend'] = backend
+    X = np.random.default_rng(0).standard_normal((1, 72, 9)).astype(np.float32)
+    results = {}
+    for wait_ms in (0, INFERENCE_WORKER['maxWaitMs']):
+        worker = InferenceWorker(max_wait_ms=wait_ms).start()
+        try:
+            worker.predict('temp_24h', X)
+            before = dict(worker.stats)
+
+            def client():
+                for _ in range(calls):
+                    worker.predict('temp_24h', X)
+
+            pool = [threading.Thread(target=client) for _ in range(threads)]
+            start = time.perf_counter()
+            for t in pool:
+                t.start()
+            for t in pool:
+                t.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            worker.stop()
+        requests_done = worker.stats['requests'] - before['requests']
+        batches = worker.stats['batches'] - before['batches']
+        results[wait_ms] = (requests_done / elapsed, requests_done / max(batches, 1))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--hours', type=int, default=400)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--serve', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        return serve(args.serve == '1')
+
+    from benchmarks.fake_rtdb import FakeRTDB
+    from benchmarks.synthetic import generate_readings, generate_weather_current
+
+    start = datetime(2025, 1, 1)
+    tree = generate_readings(args.hours, 1, start=start)
+    tree['weather_data'] = generate_weather_current(start + timedelta(hours=args.hours))
+    db = FakeRTDB(tree)
+    url = db.start()
+    try:
+        print("1. GET /api/forecast/24h trong khi du_bao chạy liên tục")
+        for label, worker in MODES.items():
+            idle, loaded, stats = latency_under_load(url, worker, args.seconds)
+            print(f"   {label:<11} rảnh:      {summary(idle)}")
+            print(f"   {label:<11} dự báo:    {summary(loaded)}  "
+                  f"[{stats['cycles']} chu kỳ, p50 {stats['cycle_ms'] or 0:.0f} ms]")
+    finally:
+        db.stop()
+
+    print(f"2. {args.threads} thread × {args.calls} cửa sổ đơn lẻ gửi tới tiến trình suy luận")
+    # tflite chạy từng mẫu (batch cố định 1) nên gom batch chỉ bớt số lần qua hàng đợi; keras tính cả batch một lần
+    for backend in ('tflite', 'keras'):
+        for wait_ms, (throughput, per_batch) in batching(args.threads, args.calls, backend).items():
+            print(f"   {backend:<7} maxWaitMs={wait_ms:<3} {throughput:8.0f} cửa sổ/s, "
+                  f"trung bình {per_batch:.1f} request mỗi lần gọi model")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Đo tác dụng của forecast_memo: lần đầu (tính) so với lần sau cùng cửa sổ đầu vào (trúng cache)
+
+Chạy: python -m benchmarks.bench_memo --repeat 50
+      python -m benchmarks.bench_memo --persist   (thêm bước đọc lại từ đĩa như sau khi khởi động lại)
+"""
+import argparse
+import shutil
+import tempfile
+import time
+import numpy as np
+
+from benchmarks.synthetic import generate_hourly_frame
+from models.forecast_tasks import FORECAST_TASKS
+from models.forecast_memo import ForecastMemo
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', type=int, default=400)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--persist', action='store_true', help='đo cả trường hợp chỉ còn bản trên đĩa')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='forecast_memo_') if args.persist else None
+    memo = ForecastMemo(path=tmp_dir)
+    # Các model tham chiếu forecast_memo lúc chạy, thay bằng bản riêng của benchmark
+    import models.temp_humidity_model as temp_model
+    import models.rain_model as rain_model
+    temp_model.forecast_memo = rain_model.forecast_memo = memo
+
+    data = generate_hourly_frame(args.hours)
+    datas = {'main': data}
+    for task in FORECAST_TASKS.values():
+        task(datas)  # load model, dựng bộ đặc trưng
+    memo.clear()
+
+    try:
+        print(f"{'tác vụ':<10}{'tính (ms)':>12}{'trúng p50 (µs)':>18}{'trúng p99 (µs)':>18}{'từ đĩa (µs)':>14}")
+        for name, task in FORECAST_TASKS.items():
+            # Mỗi tác vụ một cửa sổ riêng để lần đầu chắc chắn phải tính
+            fresh = {'main': data.assign(T2M=data['T2M'] + np.random.default_rng().normal(0, 0.01, len(data)))}
+            cold_result, cold = timed(lambda: task(fresh))
+            hits = []
+            for _ in range(args.repeat):
+                result, elapsed = timed(lambda: task(fresh))
+                hits.append(elapsed * 1000)
+            assert result == cold_result, f"{name}: kết quả từ cache khác lần tính"
+            disk = ''
+            if args.persist:
+                memo.clear()
+                _, elapsed = timed(lambda: task(fresh))
+                disk = f"{elapsed * 1000:14.0f}"
+            print(f"{name:<10}{cold:12.1f}{np.percentile(hits, 50):18.0f}{np.percentile(hits, 99):18.0f}{disk}")
+        print(memo.metrics())
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Đo chi phí của lớp đo đạc (metricsServices) so với thời gian một chu kỳ dự báo
+
+Chạy: python -m benchmarks.bench_metrics --repeat 20
+- Chi phí một span / inc / observe (ns) và số lần gọi trong một chu kỳ
+- Chu kỳ scheduler.tick(force=True) qua FakeRTDB khi bật và tắt METRICS, chạy xen kẽ
+"""
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+from datetime import datetime, timedelta
+import numpy as np
+
+from benchmarks.fake_rtdb import FakeRTDB
+from benchmarks.synthetic import generate_readings, generate_weather_current
+from config.server_config import MEMO, METRICS, STORE, SYNC
+from services.metricsServices import MetricsRegistry, metrics
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def call_cost_ns(n=200000):
+    registry = MetricsRegistry()
+
+    def span():
+        with registry.span('fetch'):
+            pass
+
+    costs = {}
+    for name, fn in {
+        'span': span,
+        'inc': lambda: registry.inc('firebase_bytes_total', 100, request='data_temp'),
+        'observe': lambda: registry.observe('firebase_request_seconds', 0.01, request='data_temp'),
+    }.items():
+        start = time.perf_counter()
+        for _ in range(n):
+            fn()
+        costs[name] = (time.perf_counter() - start) / n * 1e9
+    return costs
+
+
+def count_calls():
+    """Bọc inc/set/observe của registry dùng chung để đếm số lần gọi"""
+    counts = {'calls': 0}
+    for method in ('inc', 'set', 'observe'):
+        original = getattr(metrics, method)
+
+        def wrapped(*args, _original=original, **kwargs):
+            counts['calls'] += 1
+            return _original(*args, **kwargs)
+        setattr(metrics, method, wrapped)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', type=int, default=720)
+    parser.add_argument('--per-hour', type=int, default=12)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    costs = call_cost_ns()
+    print("Chi phí mỗi lần gọi: " + ", ".join(f"{name} {ns:.0f} ns" for name, ns in costs.items()))
+
+    import app
+    import services.loadDataFirebaseServices as firebase
+
+    MEMO['enabled'] = False
+    SYNC['cacheDir'] = tempfile.mkdtemp(prefix='rtdb-cache-')
+    STORE['dir'] = tempfile.mkdtemp(prefix='hourly-store-')
+    start = datetime(2025, 1, 1)
+    tree = generate_readings(args.hours, args.per_hour, start=start)
+    tree['weather_data'] = generate_weather_current(start + timedelta(hours=args.hours))
+    db = FakeRTDB(tree)
+    firebase.client.base_url = db.start()
+
+    def cycle():
+        firebase._pushed_snapshots.clear()   # mỗi chu kỳ đều ghi đủ, không phụ thuộc lần trước
+        with contextlib.redirect_stdout(io.StringIO()):
+            status = app.scheduler.tick(force=True)
+        assert status == 'executed', app.scheduler.metrics['last_error']
+
+    try:
+        cycle()   # làm nóng: load model, dựng kho theo giờ
+        counts = count_calls()
+        cycle()
+        calls = counts['calls']
+
+        timings = {True: [], False: []}
+        for _ in range(args.repeat):
+            for enabled in (True, False):
+                METRICS['enabled'] = enabled
+                t = time.perf_counter()
+                cycle()
+                timings[enabled].append(time.perf_counter() - t)
+        METRICS['enabled'] = True
+        render_ms = min(_timed(metrics.render) for _ in range(20)) * 1000
+    finally:
+        db.stop()
+
+    on, off = (np.percentile(timings[flag], 50) * 1000 for flag in (True, False))
+    estimated = calls * max(costs.values()) / 1e6
+    print(f"{calls} lần ghi số liệu mỗi chu kỳ -> ước tính {estimated:.3f} ms ({estimated / off:.3%} chu kỳ)")
+    print(f"Chu kỳ p50: bật {on:.1f} ms, tắt {off:.1f} ms (chênh {(on - off) / off:+.2%}, gồm cả nhiễu đo)")
+    print(f"Render /metrics: {render_ms:.2f} ms, {len(metrics.render().splitlines())} dòng")
+
+
+if __name__ == '__main__':
+    main()
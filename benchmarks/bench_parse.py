@@ -0,0 +1,139 @@
+"""So sánh gộp dữ liệu cảm biến kiểu cũ (strptime từng key) với bản vector hóa
+
+Chạy: python -m benchmarks.bench_parse --sizes 10000 100000 1000000
+Kiểm tra hai cách cho cùng kết quả rồi in thời gian ở từng cỡ dữ liệu
+"""
+import argparse
+import contextlib
+import io
+import time
+from datetime import datetime
+import pandas as pd
+
+from benchmarks.synthetic import generate_readings, generate_weather_current
+from services.loadDataFirebaseServices import merge_sensor_records
+
+
+def legacy_merge(temp_data, humidity_data, other_data, weather_data):
+    """Bản dict-merge trước khi vector hóa, giữ lại để so kết quả"""
+    combined = {}
+
+    # Xử lý dữ liệu nhiệt độ
+    for key, val in temp_data.items():
+        if not isinstance(val, dict) or 'temp' not in val:
+            continue
+        try:
+            ts = key.replace("-temp","")
+            dt = datetime.strptime(ts,"%Y%m%d%H%M%S")
+            time_key = dt.strftime("%Y%m%d%H")
+            combined[time_key] = combined.get(time_key, {})
+            combined[time_key].update({
+                'YEAR': dt.year, 'MO': dt.month, 'DY': dt.day, 'HR': dt.hour,
+                'T2M': val['temp']
+            })
+        except:
+            continue
+
+    # Xử lý dữ liệu độ ẩm
+    for key, val in humidity_data.items():
+        if not isinstance(val, dict) or 'humidity' not in val:
+            continue
+        try:
+            ts = key.replace("-humidity", "")
+            dt = datetime.strptime(ts, "%Y%m%d%H%M%S")
+            time_key = dt.strftime("%Y%m%d%H")
+            if time_key in combined:
+                combined[time_key]['QV2M'] = val['humidity']
+        except:
+            continue
+
+    # Xử lý dữ liệu khác
+    for key, val in other_data.items():
+        if not isinstance(val, dict):
+            continue
+        try:
+            ts = key.replace("-other", "")
+            dt = datetime.strptime(ts, "%Y%m%d%H%M%S")
+            time_key = dt.strftime("%Y%m%d%H")
+            if time_key in combined:
+                combined[time_key].update({
+                    'PRECTOTCORR': val.get('PRECTOTCORR'),
+                    'PS': val.get('PS'),
+                    'ALLSKY_SFC_PAR_TOT': val.get('ALLSKY_SFC_PAR_TOT')
+                })
+        except:
+            continue
+
+    # Xử lý dữ liệu thời tiết hiện tại
+    if isinstance(weather_data, dict):
+        for key, val in weather_data.items():
+            if not isinstance(val, dict) or 'last_update' not in val:
+                continue
+            try:
+                dt = datetime.strptime(val['last_update'], "%Y-%m-%d %H:%M:%S")
+                dt = dt.replace(minute=0, second=0)  # Làm tròn phút giây về 0
+                time_key = dt.strftime("%Y%m%d%H")
+                
+                if time_key not in combined:
+                    combined[time_key] = {
+                        'YEAR': dt.year, 'MO': dt.month, 'DY': dt.day, 'HR': dt.hour
+                    }
+                
+                # Cập nhật với giá trị từ weather_data
+                if 'temperature' in val and isinstance(val['temperature'], (int, float)):
+                    combined[time_key]['T2M'] = val['temperature']
+                if 'humidity' in val and isinstance(val['humidity'], (int, float)):
+                    combined[time_key]['QV2M'] = val['humidity']
+                if 'ALLSKY_SFC_PAR_TOT' in val and isinstance(val['ALLSKY_SFC_PAR_TOT'], (int, float)):
+                    combined[time_key]['ALLSKY_SFC_PAR_TOT'] = val['ALLSKY_SFC_PAR_TOT']
+                if 'PRECTOTCORR' in val and isinstance(val['PRECTOTCORR'], (int, float)):
+                    combined[time_key]['PRECTOTCORR'] = val['PRECTOTCORR']
+                if 'pressure' in val and isinstance(val['pressure'], (int, float)):
+                    combined[time_key]['PS'] = val['pressure'] * 100  # Chuyển đổi hPa sang Pa
+            except:
+                continue
+
+    # Tạo DataFrame
+    records = [data for data in combined.values() if len(data) == 9]
+    df = pd.DataFrame(records)
+        
+    if df.empty:
+        print("⚠️ Không có dữ liệu!")
+        return df
+        
+    # Sắp xếp và định thứ tự cột
+    df = df.sort_values(['YEAR', 'MO', 'DY', 'HR'])
+    column_order = ['YEAR', 'MO', 'DY', 'HR', 'QV2M', 'PRECTOTCORR', 'PS', 'T2M', 'ALLSKY_SFC_PAR_TOT']
+    df = df[column_order]
+        
+    print(f" Trả về {len(df)} records với 9 columns")
+    return df
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--per-hour', type=int, default=12)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        hours = max(1, size // args.per_hour)
+        nodes = generate_readings(hours, args.per_hour)
+        weather = {'current': generate_weather_current(datetime(2025, 1, 1) + pd.Timedelta(hours=hours - 1))}
+        inputs = (nodes['data_temp'], nodes['data_humidity'], nodes['data_other'], weather)
+
+        old, t_old = timed(legacy_merge, *inputs)
+        new, t_new = timed(merge_sensor_records, *inputs)
+        pd.testing.assert_frame_equal(old.reset_index(drop=True), new, check_dtype=False)
+        print(f"{size:>9,} bản ghi/node: cũ {t_old:7.2f}s   mới {t_new:7.2f}s   nhanh hơn {t_old / t_new:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""Đo từng giai đoạn của chu kỳ dự báo: lấy dữ liệu -> gộp -> đặc trưng -> suy luận -> đẩy lên Firebase
+
+Chạy: python -m benchmarks.bench_pipeline --hours 720 2160 --per-hour 1 12 --json out.json
+      python -m benchmarks.bench_pipeline --compare truoc.json sau.json
+Dữ liệu giả phục vụ qua FakeRTDB; mỗi cấu hình (số giờ × số bản ghi/giờ) chạy trong một tiến trình
+con riêng để peak RSS không lẫn nhau. File JSON ghi kèm commit để so sánh giữa các lần chạy.
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+import numpy as np
+
+STAGES = ['fetch', 'merge', 'sync', 'features', 'inference', 'push']
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def time_stage(fn, repeat):
+    """Chạy fn() `repeat` lần (sau một lần làm nóng); fn trả về số phần tử đã xử lý"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+        timings, items = [], 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            items = fn()
+            timings.append(time.perf_counter() - start)
+    p50 = float(np.percentile(timings, 50))
+    return {
+        'p50_ms': p50 * 1000,
+        'p99_ms': float(np.percentile(timings, 99)) * 1000,
+        'mean_ms': float(np.mean(timings)) * 1000,
+        'items': items,
+        'throughput': items / p50 if p50 else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_config(hours, per_hour, dropout, jitter, repeat, latency):
+    """Trong tiến trình con: dựng FakeRTDB với dữ liệu giả rồi đo từng giai đoạn"""
+    from benchmarks.fake_rtdb import FakeRTDB
+    from benchmarks.synthetic import generate_readings, generate_weather_current
+    from config.server_config import MEMO, STORE, SYNC
+    import services.loadDataFirebaseServices as firebase
+    from services.hourlyAggregationServices import fill_gaps
+
+    MEMO['enabled'] = False
+    SYNC['cacheDir'] = tempfile.mkdtemp(prefix='rtdb-cache-')
+    STORE['dir'] = tempfile.mkdtemp(prefix='hourly-store-')
+
+    start = datetime(2025, 1, 1)
+    tree = generate_readings(hours, per_hour, start=start, dropout=dropout, jitter=jitter)
+    tree['weather_data'] = generate_weather_current(start + timedelta(hours=hours))
+    readings = sum(len(tree[node]) for node in ('data_temp', 'data_humidity', 'data_other'))
+    db = FakeRTDB(tree, latency=latency)
+    firebase.client.base_url = db.start()
+    nodes = ['data_temp', 'data_humidity', 'data_other', 'weather_data']
+    stages, state = {}, {}
+
+    def fetch():
+        state['raw'] = firebase.client.run_concurrently(
+            {node: (lambda node=node: firebase.fetch_node(node)) for node in nodes})
+        return readings
+
+    def merge():
+        raw = state['raw']
+        merged = firebase.merge_sensor_records(raw['data_temp'], raw['data_humidity'], raw['data_other'],
+                                               {'current': raw['weather_data']}, complete_only=False)
+        state['df'], _ = fill_gaps(merged)
+        return readings
+
+    sync_hour = [hours]
+
+    def sync():
+        # Chu kỳ ổn định: mỗi lần có thêm một giờ bản ghi mới trên Firebase
+        extra = generate_readings(1, per_hour, start=start + timedelta(hours=sync_hour[0]),
+                                  seed=sync_hour[0], dropout=dropout, jitter=jitter)
+        sync_hour[0] += 1
+        with db.lock:
+            for node, records in extra.items():
+                db.tree[node].update(records)
+        firebase.get_weather_data(incremental=True)
+        return sum(len(records) for records in extra.values())
+
+    try:
+        stages['fetch'] = time_stage(fetch, repeat)
+        stages['merge'] = time_stage(merge, repeat)
+        with contextlib.redirect_stdout(io.StringIO()):
+            firebase.get_weather_data(incremental=True)   # khởi động lạnh: dựng kho theo giờ
+        stages['sync'] = time_stage(sync, repeat)
+        stages.update(model_stages(state['df'], repeat))
+    finally:
+        db.stop()
+    return {'hours': hours, 'per_hour': per_hour, 'dropout': dropout, 'jitter': jitter,
+            'readings': readings, 'stages': stages, 'peak_rss_mb': peak_rss_mb()}
+
+
+def model_stages(df, repeat):
+    """Đặc trưng (72h mưa + cửa sổ LSTM), suy luận (2 LSTM + 2 lần predict_proba) và đẩy kết quả"""
+    import app
+    from models.rain_features import RainFeatureEngine
+    from models.rain_model import get_predictor
+    from models.scaler_bundle import get_scaler
+    from models.temp_humidity_model import (HORIZONS, INPUT_FEATURES, OUTPUT_FEATURES, TEMP_MODEL_PATHS,
+                                            decode_prediction, get_temp_model, prepare_dataframe, scale_window)
+    import services.loadDataFirebaseServices as firebase
+
+    predictor = get_predictor()
+    models = {horizon: get_temp_model(horizon) for horizon in HORIZONS}
+    state = {}
+
+    def features():
+        # Bộ đặc trưng mới mỗi lần để đo đủ 72h, không chỉ phần tăng thêm
+        rows = RainFeatureEngine(predictor.selected_features).update(predictor.get_firebase_data(df))
+        state['rain'] = {'24h': predictor.matrix_24h(rows), '7d': predictor.matrix_7days(rows)}
+        state['temp'] = {}
+        for horizon, (input_steps, _, _, _) in HORIZONS.items():
+            df_all = prepare_dataframe(df, input_steps)
+            scaler = get_scaler(TEMP_MODEL_PATHS[horizon], df_all, INPUT_FEATURES, input_steps)
+            state['temp'][horizon] = scale_window(df_all, INPUT_FEATURES, input_steps, scaler) + (df_all.index[-1],)
+        return 4
+
+    def inference():
+        outputs = {}
+        for horizon, (window, scaler, last_time) in state['temp'].items():
+            _, output_steps, convert, _ = HORIZONS[horizon]
+            y_pred = models[horizon].predict(window[None])[0]
+            outputs[f'temp_{horizon}'] = convert(decode_prediction(y_pred, scaler, last_time,
+                                                                   OUTPUT_FEATURES, output_steps))
+        for horizon, (pred_times, X) in state['rain'].items():
+            probs = predictor.model.predict_proba(X)[:, 1]
+            finish = predictor.format_24h if horizon == '24h' else predictor.format_7days
+            outputs[f'rain_{horizon}'] = finish(pred_times, probs)
+        state['outputs'] = outputs
+        return len(outputs)
+
+    def push():
+        # Xóa snapshot để mỗi lần là một lần ghi đầy đủ (trường hợp xấu nhất, như sau khởi động)
+        firebase._pushed_snapshots.clear()
+        outputs = state['outputs']
+        return firebase.push_forecasts_to_firebase({
+            app.station_path('weather_24h', None).lstrip('/'): app.node_24h(
+                app.merge_24h(outputs['temp_24h'], outputs['rain_24h'])),
+            app.station_path('weather_7d', None).lstrip('/'): app.node_7d(
+                app.merge_7d(outputs['temp_7d'], outputs['rain_7d'])),
+        })
+
+    return {'features': time_stage(features, repeat), 'inference': time_stage(inference, repeat),
+            'push': time_stage(push, repeat)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_runs(runs):
+    print(f"{'cấu hình':<18}{'giai đoạn':<11}{'p50 ms':>10}{'p99 ms':>10}{'phần tử/s':>12}{'peak RSS MB':>13}")
+    for run in runs:
+        label = f"{run['hours']}h×{run['per_hour']}/h"
+        for stage in STAGES:
+            r = run['stages'][stage]
+            print(f"{label:<18}{stage:<11}{r['p50_ms']:10.1f}{r['p99_ms']:10.1f}"
+                  f"{r['throughput'] or 0:12.0f}{r['peak_rss_mb']:13.0f}")
+
+
+def compare(before_path, after_path):
+    """In tỉ lệ p50 sau/trước cho từng cấu hình và giai đoạn có ở cả hai file"""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{before['meta'].get('commit')} -> {after['meta'].get('commit')}")
+    key = lambda run: (run['hours'], run['per_hour'], run['dropout'], run['jitter'])
+    old_runs = {key(run): run for run in before['runs']}
+    for run in after['runs']:
+        old = old_runs.get(key(run))
+        if not old:
+            continue
+        for stage in STAGES:
+            if stage in old['stages'] and stage in run['stages']:
+                a, b = old['stages'][stage]['p50_ms'], run['stages'][stage]['p50_ms']
+                print(f"{run['hours']}h×{run['per_hour']}/h {stage:<10} {a:9.1f} -> {b:9.1f} ms  ×{b / a:5.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', type=int, nargs='+', default=[720])
+    parser.add_argument('--per-hour', type=int, nargs='+', default=[1, 12], help='số bản ghi mỗi giờ của mỗi node')
+    parser.add_argument('--dropout', type=float, default=0.02, help='tỉ lệ bản ghi bị mất')
+    parser.add_argument('--jitter', type=int, default=20, help='lệch tối đa (giây) của thời điểm gửi')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.0, help='độ trễ mỗi request tới Firebase giả lập (giây)')
+    parser.add_argument('--json', help='ghi kết quả ra file JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('TRUOC', 'SAU'), help='so sánh hai file JSON')
+    parser.add_argument('--config', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        return compare(*args.compare)
+
+    if args.config:
+        hours, per_hour = map(int, args.config.split(':'))
+        print(json.dumps(run_config(hours, per_hour, args.dropout, args.jitter, args.repeat, args.latency)))
+        return
+
+    runs = []
+    for hours in args.hours:
+        for per_hour in args.per_hour:
+            command = [sys.executable, '-m', 'benchmarks.bench_pipeline', '--config', f"{hours}:{per_hour}",
+                       '--dropout', str(args.dropout), '--jitter', str(args.jitter),
+                       '--repeat', str(args.repeat), '--latency', str(args.latency)]
+            proc = subprocess.run(command, capture_output=True, text=True)
+            if proc.returncode:
+                print(f"{hours}h×{per_hour}/h: lỗi\n{proc.stderr[-1000:]}")
+                continue
+            runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    print_runs(runs)
+
+    if args.json:
+        meta = {'commit': git_commit(), 'time': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(), 'machine': platform.machine(),
+                'repeat': args.repeat, 'latency': args.latency}
+        with open(args.json, 'w') as f:
+            json.dump({'meta': meta, 'runs': runs}, f, indent=2)
+        print(f"Đã ghi {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Đo peak RSS của đường lấy dữ liệu theo tuổi hệ thống, khi bật và tắt RETENTION
+
+Chạy: python -m benchmarks.bench_retention --days 30 90 365 --per-hour 12
+FakeRTDB chạy ở tiến trình cha; mỗi phép đo là một tiến trình con riêng, đặt lại peak RSS
+(VmHWM) ngay trước khi gọi và báo phần peak tăng thêm so với RSS lúc đó, cùng số KB tải từ Firebase
+(FakeRTDB xếp key như Firebase nên startAt sai vẫn lộ ra ở cột này):
+- tắt:      khởi động lạnh get_weather_data tải cả node (như hiện nay)
+- bật:      khởi động lạnh chỉ tải keepHours giờ gần nhất
+- lưu trữ:  archive_station gộp theo giờ + xóa, từng khúc chunkHours giờ
+- sau:      khởi động lạnh (tắt RETENTION) sau khi đã lưu trữ, node trên Firebase đã nhỏ lại
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+MODES = {'off': 'tắt', 'on': 'bật', 'archive': 'lưu trữ', 'after': 'sau'}
+
+
+def reset_peak_rss():
+    """Đặt lại VmHWM (Linux >= 4.0) để peak chỉ tính từ lúc này; không có thì dùng ru_maxrss"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def run_child(mode, url):
+    """Trong tiến trình con: một lần đo với Firebase giả ở `url`"""
+    from config.server_config import RETENTION, STORE, SYNC
+    import services.loadDataFirebaseServices as firebase
+    from services.metricsServices import metrics
+    from services.retentionServices import archive_station
+
+    firebase.client.base_url = url
+    SYNC['cacheDir'] = tempfile.mkdtemp(prefix='rtdb-cache-')
+    STORE['dir'] = tempfile.mkdtemp(prefix='hourly-store-')
+    RETENTION['archiveDir'] = tempfile.mkdtemp(prefix='archive-')
+    RETENTION['enabled'] = mode in ('on', 'archive')
+
+    before = rss_mb() if reset_peak_rss() else peak_rss_mb()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == 'archive':
+            report = archive_station()
+            result = {'hours': report['hours'], 'deleted': report['deleted'], 'chunks': report['chunks'],
+                      'archive_kb': dir_size(RETENTION['archiveDir']) / 1024}
+        else:
+            df = firebase.get_weather_data(incremental=True)
+            result = {'rows': len(df), 'cached': sum(len(firebase.load_node_cache(node).records)
+                                                     for node in SYNC['nodes'])}
+    result['seconds'] = time.perf_counter() - start
+    result['downloaded_kb'] = sum(value for (name, _), value in metrics.counters.items()
+                                  if name == 'firebase_bytes_total') / 1024
+    result['peak_delta_mb'] = peak_rss_mb() - before
+    return result
+
+
+def measure(mode, url):
+    command = [sys.executable, '-m', 'benchmarks.bench_retention', '--child', mode, '--url', url]
+    proc = subprocess.run(command, capture_output=True, text=True)
+    if proc.returncode:
+        raise RuntimeError(proc.stderr[-1000:])
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, nargs='+', default=[30, 90, 365], help='tuổi hệ thống (ngày dữ liệu)')
+    parser.add_argument('--per-hour', type=int, default=12, help='số bản ghi mỗi giờ của mỗi node')
+    parser.add_argument('--child', choices=list(MODES), help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.url)))
+        return
+
+    from benchmarks.fake_rtdb import FakeRTDB
+    from benchmarks.synthetic import generate_readings, generate_weather_current
+
+    print(f"{'tuổi':>6}{'bản ghi':>10}  {'chế độ':<9}{'Δ peak RSS MB':>14}{'giây':>8}{'tải KB':>9}  kết quả")
+    for days in args.days:
+        start = datetime(2025, 1, 1)
+        tree = generate_readings(days * 24, args.per_hour, start=start)
+        tree['weather_data'] = generate_weather_current(start + timedelta(days=days))
+        readings = sum(len(tree[node]) for node in ('data_temp', 'data_humidity', 'data_other'))
+        db = FakeRTDB(tree)
+        url = db.start()
+        try:
+            for mode, label in MODES.items():
+                r = measure(mode, url)
+                if mode == 'archive':
+                    detail = f"{r['hours']} giờ, xóa {r['deleted']} bản ghi, {r['chunks']} khúc, {r['archive_kb']:.0f} KB"
+                else:
+                    detail = f"{r['rows']} giờ, cache {r['cached']} bản ghi"
+                print(f"{days:>5}d{readings:>10}  {label:<9}{r['peak_delta_mb']:14.1f}{r['seconds']:8.2f}"
+                      f"{r['downloaded_kb']:9.0f}  {detail}")
+        finally:
+            db.stop()
+
+
+if __name__ == '__main__':
+    main()
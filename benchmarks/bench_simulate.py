@@ -0,0 +1,96 @@
+"""Thông lượng POST /api/forecast/simulate theo số cửa sổ mỗi request (1 - 1024)
+
+Chạy: python -m benchmarks.bench_simulate --sizes 1 4 16 64 256 1024 [--horizons 24h]
+Gọi qua Flask test client (không tính mạng), body JSON và .npy; mỗi cửa sổ 168 giờ nên đủ cho cả 24h
+và 7 ngày. Đếm số lần gọi model (predict nhiệt độ, predict_proba mưa) trong mỗi request.
+"""
+import argparse
+import contextlib
+import io
+import json
+import time
+import numpy as np
+
+
+class CallCounter:
+    """Bọc hàm của model để đếm số lần gọi"""
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.calls = 0
+
+    def __call__(self, X):
+        self.calls += 1
+        return self.fn(X)
+
+
+def make_windows(count, hours):
+    """`count` cửa sổ `hours` giờ liên tục, cửa sổ sau lệch cửa sổ trước 1 giờ"""
+    from benchmarks.synthetic import generate_hourly_frame
+    from models.forecast_simulate import SCHEMA
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        frame = generate_hourly_frame(count + hours)
+    values = frame[SCHEMA].to_numpy(dtype=float)
+    return np.lib.stride_tricks.sliding_window_view(values, (hours, len(SCHEMA)))[:count, 0]
+
+
+def encode(windows, fmt):
+    """Tham số cho client.post: body JSON hoặc .npy float32"""
+    if fmt == 'json':
+        return {'data': json.dumps({'windows': windows.tolist()}), 'content_type': 'application/json'}
+    buf = io.BytesIO()
+    np.save(buf, windows.astype(np.float32))
+    return {'data': buf.getvalue(), 'content_type': 'application/x-npy'}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 4, 16, 64, 256, 1024])
+    parser.add_argument('--hours', type=int, default=168)
+    parser.add_argument('--horizons', default='24h,7d')
+    parser.add_argument('--seconds', type=float, default=3, help='thời gian chạy tối thiểu mỗi cỡ batch')
+    args = parser.parse_args()
+
+    from config.server_config import MEMO
+    MEMO['enabled'] = False
+    import app
+    from models.rain_model import get_predictor
+    from models.temp_humidity_model import HORIZONS, get_temp_model
+
+    counters = []
+    for horizon in HORIZONS:
+        model = get_temp_model(horizon)
+        model.predict = CallCounter(model.predict)
+        counters.append(model.predict)
+    predictor = get_predictor()
+    predictor.model.predict_proba = CallCounter(predictor.model.predict_proba)
+    counters.append(predictor.model.predict_proba)
+
+    client = app.app.test_client()
+    url = f'/api/forecast/simulate?horizons={args.horizons}'
+    horizons = args.horizons.split(',')
+    all_windows = make_windows(max(args.sizes), args.hours)
+    print(f"{'cửa sổ':>7} {'body':>5} {'MB':>6} {'ms/request':>11} {'cửa sổ/s':>9} {'gọi model/request':>18}")
+    for size in args.sizes:
+        windows = all_windows[:size]
+        for fmt in ('json', 'npy'):
+            body = encode(windows, fmt)
+            mb = len(body['data']) / 1e6
+            resp = client.post(url, **body)     # làm nóng
+            assert resp.status_code == 200, resp.json
+            assert all(r[f'forecast_{h}'] for r in resp.json['results'] for h in horizons)
+
+            before = sum(c.calls for c in counters)
+            latencies, deadline = [], time.time() + args.seconds
+            while time.time() < deadline or len(latencies) < 3:
+                start = time.perf_counter()
+                client.post(url, **body)
+                latencies.append(time.perf_counter() - start)
+            calls = (sum(c.calls for c in counters) - before) / len(latencies)
+            ms = float(np.median(latencies)) * 1000
+            print(f"{size:>7} {fmt:>5} {mb:>6.2f} {ms:>11.1f} {size / ms * 1000:>9.0f} {calls:>18.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Thông lượng dự báo khi số trạm tăng: batch một lần gọi model cho mọi trạm vs lặp từng trạm
+
+Chạy: python -m benchmarks.bench_stations --stations 1 10 50 100 500 --loop-max 100
+Dữ liệu các trạm là một chuỗi tổng hợp được dịch/nhiễu riêng cho từng trạm
+"""
+import argparse
+import time
+import numpy as np
+
+from benchmarks.synthetic import generate_hourly_frame
+from config.server_config import INFERENCE, STATIONS
+from models.rain_model import get_predictor
+from models.temp_humidity_model import forecast_24h, forecast_7d, forecast_batch, get_temp_model
+
+
+def station_frames(n, hours, seed=0):
+    """n DataFrame khác nhau: mỗi trạm lệch nhiệt độ/độ ẩm/áp suất một lượng cố định + nhiễu"""
+    base = generate_hourly_frame(hours, seed=seed)
+    rng = np.random.default_rng(seed)
+    frames = {}
+    for i in range(n):
+        station = f"st{i:03d}"
+        STATIONS['stations'].setdefault(station, {'name': f"Trạm thử {i}"})
+        df = base.copy()
+        df['T2M'] += rng.normal(0, 2) + rng.normal(0, 0.3, len(df))
+        df['QV2M'] = (df['QV2M'] + rng.normal(0, 5) + rng.normal(0, 1, len(df))).clip(0, 100)
+        df['PS'] += rng.normal(0, 150) + rng.normal(0, 20, len(df))
+        frames[station] = df
+    return frames
+
+
+def copies(frames):
+    return {station: df.copy() for station, df in frames.items()}
+
+
+def batched_cycle(frames):
+    predictor = get_predictor()
+    return {
+        'temp_24h': forecast_batch(get_temp_model('24h'), copies(frames), '24h'),
+        'temp_7d': forecast_batch(get_temp_model('7d'), copies(frames), '7d'),
+        'rain_24h': predictor.predict_24h_batch(copies(frames)),
+        'rain_7d': predictor.predict_7days_batch(copies(frames)),
+    }
+
+
+def loop_cycle(frames):
+    predictor = get_predictor()
+    results = {'temp_24h': {}, 'temp_7d': {}, 'rain_24h': {}, 'rain_7d': {}}
+    for station, df in frames.items():
+        results['temp_24h'][station] = forecast_24h(get_temp_model('24h'), df.copy(), station)
+        results['temp_7d'][station] = forecast_7d(get_temp_model('7d'), df.copy(), station)
+        results['rain_24h'][station] = predictor.predict_24h(df.copy(), station)
+        results['rain_7d'][station] = predictor.predict_7days(df.copy(), station)
+    return results
+
+
+def max_difference(a, b):
+    """Sai khác lớn nhất giữa hai kết quả (nhiệt độ và xác suất mưa) trên mọi trạm"""
+    worst = 0.0
+    for station in a['temp_24h']:
+        for x, y in zip(a['temp_24h'][station], b['temp_24h'][station]):
+            worst = max(worst, abs(x['temp'] - y['temp']))
+        for x, y in zip(a['temp_7d'][station], b['temp_7d'][station]):
+            worst = max(worst, abs(x['temp_max'] - y['temp_max']), abs(x['temp_min'] - y['temp_min']))
+        for key, field in (('rain_24h', 'probability'), ('rain_7d', 'max_probability')):
+            for x, y in zip(a[key][station], b[key][station]):
+                worst = max(worst, abs(x[field] - y[field]))
+    return worst
+
+
+def timed(fn, frames):
+    np.random.seed(0)  # nhiễu của dự báo mưa 7 ngày giống nhau giữa hai cách chạy
+    started = time.perf_counter()
+    result = fn(frames)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stations', type=int, nargs='+', default=[1, 10, 50, 100, 500])
+    parser.add_argument('--loop-max', type=int, default=100, help='chỉ chạy kiểu lặp từng trạm tới số trạm này')
+    parser.add_argument('--hours', type=int, default=200)
+    parser.add_argument('--backend', choices=['keras', 'tflite'], default=INFERENCE['backend'])
+    args = parser.parse_args()
+
+    INFERENCE['backend'] = args.backend
+    frames_all = station_frames(max(args.stations), args.hours)
+    first = dict(list(frames_all.items())[:1])
+    batched_cycle(first)  # làm nóng: load model, trace tf.function
+    loop_cycle(first)
+
+    print(f"backend {get_temp_model('24h').name}")
+    print(f"{'trạm':>6}{'batch s':>10}{'trạm/s':>10}{'lặp s':>10}{'trạm/s':>10}{'nhanh hơn':>11}{'lệch max':>10}")
+    for n in args.stations:
+        frames = dict(list(frames_all.items())[:n])
+        # Lần chạy đầu của mỗi trạm phải dựng bộ đặc trưng mưa từ đầu; đo chu kỳ ổn định
+        batched_cycle(frames)
+        batch_seconds, batch_result = timed(batched_cycle, frames)
+        line = f"{n:6d}{batch_seconds:10.3f}{n / batch_seconds:10.1f}"
+        if n <= args.loop_max:
+            loop_seconds, loop_result = timed(loop_cycle, frames)
+            line += (f"{loop_seconds:10.3f}{n / loop_seconds:10.1f}{loop_seconds / batch_seconds:10.1f}x"
+                     f"{max_difference(batch_result, loop_result):10.2f}")
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""So sánh các chế độ chuẩn hóa của model LSTM nhiệt độ/độ ẩm
+
+Chạy: python -m benchmarks.check_normalization --days 60 --cycles 48
+- 'window' phải cho kết quả giống đường cũ (StandardScaler fit trên từng cửa sổ)
+- thời gian chuẩn hóa mỗi lần gọi: fit StandardScaler vs phép affine đã gộp
+- độ lệch dự báo giữa 'window', 'bundle' (fit trên lịch sử) và 'streaming'
+"""
+import argparse
+import tempfile
+import time
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+
+from benchmarks.synthetic import generate_hourly_frame
+from config.server_config import NORMALIZATION
+from models import scaler_bundle
+from models.scaler_bundle import ScalerBundle, get_scaler
+from models.temp_humidity_model import INPUT_FEATURES, TEMP_MODEL_PATHS, get_temp_model, prepare_dataframe
+
+
+def legacy_scaled(window, model):
+    """Đường cũ: StandardScaler fit trên cửa sổ, inverse qua mảng dummy"""
+    scaler = StandardScaler()
+    X = np.expand_dims(scaler.fit_transform(window), axis=0)
+    y = model.predict(X).reshape(-1, 2)
+    dummy = np.zeros((len(y), window.shape[1]))
+    dummy[:, :2] = y
+    return scaler.inverse_transform(dummy)[:, :2]
+
+
+def fused_scaled(window, model, scaler):
+    X = np.expand_dims(scaler.transform(window), axis=0)
+    return scaler.inverse(model.predict(X).reshape(-1, 2))
+
+
+def time_call(fn, repeat=2000):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--cycles', type=int, default=48, help='số giờ cuối dùng làm các chu kỳ dự báo')
+    args = parser.parse_args()
+
+    df = prepare_dataframe(generate_hourly_frame(args.days * 24, seed=1))
+    values = df[INPUT_FEATURES].values
+    model = get_temp_model('24h')
+    NORMALIZATION['streamingPath'] = tempfile.mkdtemp() + '/streaming_scaler.json'
+
+    # Bundle "huấn luyện" từ nửa đầu lịch sử, các chu kỳ dự báo chạy trên phần sau
+    history = ScalerBundle.fit(values[:len(values) // 2], INPUT_FEATURES, 'synthetic-train')
+    scaler_bundle._bundles[TEMP_MODEL_PATHS['24h']] = history
+
+    parity, drift = 0.0, {'bundle': [], 'streaming': []}
+    for end in range(len(df) - args.cycles, len(df) + 1):
+        upto = df.iloc[:end]
+        window = values[end - 72:end]
+        legacy = legacy_scaled(window, model)
+        results = {mode: fused_scaled(window, model, get_scaler(TEMP_MODEL_PATHS['24h'], upto, INPUT_FEATURES, 72, mode))
+                   for mode in ('window', 'bundle', 'streaming')}
+        parity = max(parity, float(np.abs(results['window'] - legacy).max()))
+        for mode in drift:
+            drift[mode].append(float(np.abs(results[mode][:, 0] - results['window'][:, 0]).mean()))
+
+    window = values[-72:]
+    fit_us = time_call(lambda: StandardScaler().fit(window).transform(window))
+    bundle_us = time_call(lambda: history.transform(window))
+    window_us = time_call(lambda: ScalerBundle.fit(window, INPUT_FEATURES).transform(window))
+
+    print(f"window vs StandardScaler cũ: lệch tối đa {parity:.2e}")
+    print(f"chuẩn hóa mỗi lần gọi: StandardScaler {fit_us:.1f} us, fit numpy {window_us:.1f} us, bundle {bundle_us:.1f} us")
+    for mode, diffs in drift.items():
+        print(f"T2M {mode} vs window: lệch trung bình {np.mean(diffs):.3f} độ (max {np.max(diffs):.3f}) qua {len(diffs)} chu kỳ")
+    assert parity < 1e-6, 'chế độ window phải khớp đường cũ'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Kiểm tra dự báo mưa 7 ngày: lặp lại cho cùng kết quả và đo thời gian theo số mẫu ensemble
+
+Chạy: python -m benchmarks.check_rain_7d --members 1 8 32
+Mỗi lần gọi dùng một WeatherPredictor mới và tắt forecast_memo để chắc chắn là tính lại.
+"""
+import argparse
+import time
+import numpy as np
+
+from benchmarks.synthetic import generate_hourly_frame
+from config.server_config import MEMO, RAIN_7D
+from models.rain_model import WeatherPredictor
+
+
+def legacy_format_7days(pred_times, probs):
+    """Cách tổng hợp cũ (dict ngày -> list) để so sánh với bản reduceat"""
+    daily = {}
+    for pred_time, prob in zip(pred_times, probs * 100):
+        daily.setdefault(pred_time.date(), []).append(prob)
+    return [(date.strftime('%Y-%m-%d'), round(np.mean(p), 1), round(np.max(p), 1)) for date, p in daily.items()]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', type=int, default=400)
+    parser.add_argument('--members', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    MEMO['enabled'] = False
+    data = generate_hourly_frame(args.hours)
+
+    # Tổng hợp theo ngày khớp cách cũ (1 mẫu, cùng xác suất giờ)
+    predictor = WeatherPredictor()
+    pred_times, X = predictor.matrix_7days(predictor.latest_features(data), members=1)
+    probs = predictor.model.predict_proba(X)[:, 1]
+    new = [(d['date'], d['probability'], d['max_probability']) for d in predictor.format_7days(pred_times, probs)]
+    assert new == legacy_format_7days(pred_times, probs), "format_7days khác cách tổng hợp cũ"
+    print(f"format_7days khớp cách cũ trên {len(new)} ngày")
+
+    RAIN_7D['percentiles'] = [10, 90]
+    for members in args.members:
+        RAIN_7D['members'] = members
+        first = WeatherPredictor().predict_7days(data)
+        assert WeatherPredictor().predict_7days(data) == first, f"{members} mẫu: hai lần gọi cho kết quả khác nhau"
+
+        predictor = WeatherPredictor()
+        predictor.predict_7days(data)  # làm nóng bộ đặc trưng
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            predictor.predict_7days(data)
+            times.append((time.perf_counter() - start) * 1000)
+        spread = max(d.get('probability_p90', 0) - d.get('probability_p10', 0) for d in first)
+        print(f"{members:3d} mẫu: lặp lại giống nhau, p50 = {np.percentile(times, 50):6.1f} ms, "
+              f"p99 = {np.percentile(times, 99):6.1f} ms, độ rộng p10-p90 lớn nhất {spread:.1f}%")
+
+
+if __name__ == '__main__':
+    main()
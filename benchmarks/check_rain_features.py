@@ -0,0 +1,96 @@
+"""Kiểm tra RainFeatureEngine khớp với WeatherPredictor.create_features trên chuỗi 1 năm
+
+Chạy: python -m benchmarks.check_rain_features --hours 8760
+Engine chạy tăng dần trên cả chuỗi, mỗi mốc được so với create_features(tail(72)).dropna();
+các cửa sổ không có NaN được tính thêm một lượt bằng window_rows (đường của API simulate) và so như trên;
+series_features (đường của backtest) tính một lần cho cả chuỗi, so từng dòng engine trả về
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generate_hourly_frame
+from models.rain_features import (RainFeatureEngine, FEATURE_BUILDERS, KEEP, LOOKBACK, RAW_COLUMNS, WINDOW,
+                                 series_features, window_rows)
+from models.rain_model import WeatherPredictor
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', type=int, default=24 * 365)
+    parser.add_argument('--stride', type=int, default=1)
+    parser.add_argument('--tolerance', type=float, default=1e-8)
+    args = parser.parse_args()
+
+    data = generate_hourly_frame(args.hours)
+    # Vài lỗ NaN để kiểm tra logic dropna
+    data.loc[data.sample(frac=0.002, random_state=0).index, 'PS'] = np.nan
+
+    features = list(FEATURE_BUILDERS)
+    predictor = WeatherPredictor.__new__(WeatherPredictor)
+    frame = data.copy()
+    frame.index = pd.to_datetime(frame[['YEAR', 'MO', 'DY', 'HR']].rename(
+        columns={'YEAR': 'year', 'MO': 'month', 'DY': 'day', 'HR': 'hour'}))
+    frame = frame[RAW_COLUMNS]
+    engine = RainFeatureEngine(features)
+    start = time.perf_counter()
+    series, valid = series_features(features, frame.index.values, frame.to_numpy(dtype=float))
+    t_series = time.perf_counter() - start
+    worst_series = 0.0
+
+    worst, checked, t_engine, t_pandas = 0.0, 0, 0.0, 0.0
+    clean = []      # (cửa sổ, các dòng create_features) của cửa sổ không có NaN
+    for end in range(WINDOW, len(frame) + 1, args.stride):
+        window = frame.iloc[end - WINDOW:end]
+
+        start = time.perf_counter()
+        rows = engine.update(window)
+        t_engine += time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = predictor.create_features(window.copy()).dropna().iloc[-KEEP:]
+        t_pandas += time.perf_counter() - start
+
+        assert [ts for ts, _ in rows] == list(expected.index), f"Lệch dòng hợp lệ tại {window.index[-1]}"
+        if not rows:
+            continue
+        got = np.array([vector for _, vector in rows])
+        want = expected[features].to_numpy(dtype=float)
+        diff = np.abs(got - want) / np.maximum(1.0, np.abs(want))
+        worst = max(worst, float(diff.max()))
+        checked += 1
+        if not window.isna().any().any():
+            clean.append((window, expected))
+        # Dòng hợp lệ của series_features trong phần cửa sổ có đủ LOOKBACK giờ trước đó
+        positions = np.flatnonzero(valid[end - WINDOW + LOOKBACK:end]) + end - WINDOW + LOOKBACK
+        assert list(frame.index[positions[-KEEP:]]) == list(expected.index), \
+            f"series_features lệch dòng hợp lệ tại {window.index[-1]}"
+        got_series = series[positions[-KEEP:]]
+        worst_series = max(worst_series, float((np.abs(got_series - want) / np.maximum(1.0, np.abs(want))).max()))
+
+    print(f"Đã so {checked} mốc × {len(features)} đặc trưng, sai lệch tương đối lớn nhất = {worst:.3e}")
+    print(f"create_features: {t_pandas * 1000 / checked:.3f} ms/mốc   engine: {t_engine * 1000 / checked:.3f} ms/mốc")
+    assert worst <= args.tolerance, "Engine lệch khỏi create_features"
+    print(f"series_features: {len(frame)} giờ trong {t_series * 1000:.0f} ms, "
+          f"sai lệch tương đối lớn nhất = {worst_series:.3e}")
+    assert worst_series <= args.tolerance, "series_features lệch khỏi create_features"
+
+    times = np.stack([window.index.values for window, _ in clean])
+    values = np.stack([window.to_numpy(dtype=float) for window, _ in clean])
+    start = time.perf_counter()
+    batch = window_rows(features, times, values)
+    t_batch = time.perf_counter() - start
+    worst_batch = 0.0
+    for rows, (window, expected) in zip(batch, clean):
+        assert [ts for ts, _ in rows] == list(expected.index), f"window_rows lệch dòng tại {window.index[-1]}"
+        got = np.array([vector for _, vector in rows])
+        want = expected[features].to_numpy(dtype=float)
+        worst_batch = max(worst_batch, float((np.abs(got - want) / np.maximum(1.0, np.abs(want))).max()))
+    print(f"window_rows: {len(clean)} cửa sổ trong một lượt, {t_batch * 1000 / len(clean):.3f} ms/cửa sổ, "
+          f"sai lệch tương đối lớn nhất = {worst_batch:.3e}")
+    assert worst_batch <= args.tolerance, "window_rows lệch khỏi create_features"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Kiểm tra chế độ nhiều worker: gunicorn -c gunicorn.conf.py app:app trên FakeRTDB
+
+Chạy: python -m benchmarks.check_serving --workers 3
+1. Đúng một worker là leader; chỉ leader load model (so RSS các worker)
+2. Mọi worker trả cùng một body/ETag (đọc file kết quả của leader qua mmap), kể cả bản gzip
+3. POST /api/forecast/simulate qua mọi worker: worker thường chuyển sang leader, không tự load model
+4. kill -9 leader: API vẫn trả kết quả cũ, một worker khác lên làm leader và dự báo lại
+"""
+import argparse
+import gzip
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+import requests
+
+from benchmarks.fake_rtdb import FakeRTDB
+from benchmarks.synthetic import generate_readings, generate_weather_current
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cấu hình gunicorn của repo + thư mục tạm cho cache/kho/khóa, để không đụng data/ thật
+CONFIG = '''
+import sys
+sys.path.insert(0, {repo!r})
+exec(open({conf!r}).read())
+
+def post_worker_init(worker):
+    from config.server_config import SERVING, STORE, SYNC
+    SYNC['cacheDir'] = {tmp!r} + '/cache'
+    STORE['dir'] = {tmp!r} + '/store'
+    SERVING.update(lockFile={tmp!r} + '/leader.lock', resultFile={tmp!r} + '/results.bin',
+                   leaderAddressFile={tmp!r} + '/leader.addr', leaderRetrySeconds=0.5)
+    from app import start_serving
+    start_serving()
+'''
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+
+
+def poll_workers(base, workers, until, timeout=180):
+    """Gọi /ready bằng các kết nối mới cho tới khi gặp đủ `workers` pid và until(trạng thái) đúng"""
+    seen, deadline = {}, time.time() + timeout
+    while time.time() < deadline:
+        try:
+            resp = requests.get(f'{base}/ready', headers={'Connection': 'close'}, timeout=5)
+            state = resp.json()
+            seen[state['pid']] = (resp.status_code, state)
+        except (requests.RequestException, ValueError):
+            pass
+        if len(seen) >= workers and until(seen):
+            return seen
+        time.sleep(0.05)
+    raise TimeoutError(f"Hết giờ chờ worker: {seen}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--hours', type=int, default=400)
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+
+    start = datetime(2025, 1, 1)
+    tree = generate_readings(args.hours, 1, start=start)
+    tree['weather_data'] = generate_weather_current(start + timedelta(hours=args.hours))
+    db = FakeRTDB(tree)
+    url = db.start()
+    tmp = tempfile.mkdtemp(prefix='serving-')
+    conf = os.path.join(tmp, 'gunicorn_check.conf.py')
+    with open(conf, 'w') as f:
+        f.write(CONFIG.format(repo=REPO, conf=os.path.join(REPO, 'gunicorn.conf.py'), tmp=tmp))
+
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    env = {**os.environ, 'FIREBASE_DATABASE_URL': url, 'TF_CPP_MIN_LOG_LEVEL': '3'}
+    log = open(os.path.join(tmp, 'gunicorn.log'), 'w')
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', conf, '-w', str(args.workers),
+                             '-b', f'127.0.0.1:{port}', 'app:app'], cwd=REPO, env=env, stdout=log, stderr=log)
+    try:
+        # 1. Một leader, mọi worker có kết quả để trả
+        started = time.time()
+        seen = poll_workers(base, args.workers, lambda s: all(code == 200 for code, _ in s.values()))
+        leaders = [pid for pid, (_, state) in seen.items() if state['role'] == 'leader']
+        assert len(leaders) == 1, seen
+        leader = leaders[0]
+        print(f"1. {len(seen)} worker, leader pid {leader}, có dự báo sau {time.time() - started:.1f}s")
+        for pid, (_, state) in sorted(seen.items()):
+            print(f"   pid {pid} {state['role']:<8} RSS {rss_mb(pid):6.0f} MB")
+
+        # 2. Cùng body/ETag ở mọi worker
+        etags, bodies, pids, latencies = set(), set(), set(), []
+        for i in range(args.requests):
+            t = time.perf_counter()
+            resp = requests.get(f'{base}/api/forecast/24h', timeout=5,
+                                headers={'Connection': 'close', 'Accept-Encoding': 'identity'})
+            latencies.append(time.perf_counter() - t)
+            assert resp.status_code == 200 and int(resp.headers['Content-Length']) == len(resp.content)
+            etags.add(resp.headers['ETag'])
+            bodies.add(resp.content)
+        for _ in range(10 * args.workers):
+            pids.add(requests.get(f'{base}/ready', headers={'Connection': 'close'}).json()['pid'])
+        raw = requests.get(f'{base}/api/forecast', headers={'Accept-Encoding': 'gzip', 'Connection': 'close'},
+                           stream=True).raw.read()
+        assert json.loads(gzip.decompress(raw)) == requests.get(f'{base}/api/forecast').json()
+        assert len(etags) == 1 and len(bodies) == 1, etags
+        latencies.sort()
+        print(f"2. {args.requests} request qua {len(pids)} worker: 1 ETag, 1 body, gzip khớp; "
+              f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+
+        # 3. simulate: một kết quả dù request vào worker nào, RSS worker thường không tăng (không load model)
+        from benchmarks.bench_simulate import encode, make_windows
+        body = encode(make_windows(4, 168), 'npy')
+        followers = [pid for pid in seen if pid != leader]
+        before = {pid: rss_mb(pid) for pid in followers}
+        results = set()
+        for _ in range(5 * args.workers):
+            resp = requests.post(f'{base}/api/forecast/simulate', data=body['data'], timeout=120,
+                                 headers={'Content-Type': body['content_type'], 'Connection': 'close'})
+            assert resp.status_code == 200, resp.text
+            results.add(json.dumps(resp.json(), sort_keys=True))
+        assert len(results) == 1
+        growth = max(rss_mb(pid) - before[pid] for pid in followers) if followers else 0
+        print(f"3. {5 * args.workers} request simulate: 1 kết quả, RSS worker thường tăng tối đa {growth:.0f} MB")
+
+        # 4. Leader chết: worker khác lên thay, API vẫn trả kết quả cũ trong lúc chờ
+        etag = etags.pop()
+        os.kill(leader, signal.SIGKILL)
+        killed = time.time()
+        resp = requests.get(f'{base}/api/forecast/24h', timeout=5,
+                            headers={'Connection': 'close', 'Accept-Encoding': 'identity'})
+        assert resp.status_code == 200 and resp.headers['ETag'] == etag
+        seen = poll_workers(base, 1, lambda s: any(state['role'] == 'leader' and pid != leader
+                                                    for pid, (_, state) in s.items()))
+        new_leader = next(pid for pid, (_, state) in seen.items() if state['role'] == 'leader' and pid != leader)
+        print(f"4. kill -9 leader {leader}: API vẫn trả ETag cũ; pid {new_leader} lên leader sau "
+              f"{time.time() - killed:.1f}s")
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=30)
+        db.stop()
+        log.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Kiểm tra nhận dữ liệu qua luồng SSE với FakeRTDB: đồng bộ, đóng giờ, mất kết nối rồi resync
+
+Chạy: python -m benchmarks.check_stream --hours 200
+1. Luồng đồng bộ xong -> DataFrame trùng với get_weather_data(incremental=False)
+2. Ghi bản ghi giờ mới lần lượt vào 3 node -> giờ trước đó chỉ đóng (on_hour_closed) khi cả 3 node sang giờ mới
+3. Ngắt mọi luồng, ghi thêm trong lúc mất kết nối -> sau khi kết nối lại không thiếu bản ghi nào
+"""
+import argparse
+import contextlib
+import io
+import queue
+import tempfile
+import time
+from datetime import datetime, timedelta
+import pandas as pd
+
+from benchmarks.fake_rtdb import FakeRTDB
+from benchmarks.synthetic import generate_readings, generate_weather_current
+from config.server_config import HTTP, STORE, SYNC
+import services.loadDataFirebaseServices as firebase
+from services.firebaseStreamServices import SENSOR_NODES, StationStream
+
+
+def wait_for(condition, timeout, what):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError(f"Hết {timeout}s vẫn chưa {what}")
+        time.sleep(0.01)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', type=int, default=200)
+    parser.add_argument('--per-hour', type=int, default=12)
+    parser.add_argument('--timeout', type=float, default=30)
+    args = parser.parse_args()
+
+    SYNC['cacheDir'] = tempfile.mkdtemp(prefix='rtdb-cache-')
+    STORE['dir'] = tempfile.mkdtemp(prefix='hourly-store-')
+    HTTP['backoffSeconds'] = 0.05
+    start = datetime(2025, 1, 1)
+    tree = generate_readings(args.hours, args.per_hour, start=start)
+    tree['weather_data'] = generate_weather_current(start + timedelta(hours=args.hours - 1))
+    db = FakeRTDB(tree, keepalive=0.2)
+    firebase.client.base_url = db.start()
+
+    closed = queue.Queue()
+    stream = StationStream(on_hour_closed=lambda station, hour: closed.put((hour, time.perf_counter())))
+    try:
+        started = time.perf_counter()
+        stream.start()
+        wait_for(stream.is_synced, args.timeout, "đồng bộ xong")
+        print(f"1. Đồng bộ {args.hours} giờ × {args.per_hour} bản ghi qua luồng: "
+              f"{(time.perf_counter() - started) * 1000:.0f} ms")
+        with contextlib.redirect_stdout(io.StringIO()):
+            with stream.lock:
+                streamed = stream.frame()
+            polled = firebase.get_weather_data(incremental=False)
+        pd.testing.assert_frame_equal(streamed.reset_index(drop=True), polled.reset_index(drop=True))
+        print(f"   DataFrame trùng với get_weather_data ({len(streamed)} giờ)")
+
+        # Giờ cuối của lịch sử chỉ đóng khi cả 3 node đã có bản ghi của giờ mới
+        last_hour = start + timedelta(hours=args.hours - 1)
+        next_hour = last_hour + timedelta(hours=1)
+        extra = generate_readings(1, 1, start=next_hour, seed=1)
+        for i, node in enumerate(SENSOR_NODES):
+            time.sleep(0.2)
+            assert closed.empty(), f"giờ đóng sớm khi mới có {i} node sang giờ mới"
+            written = time.perf_counter()
+            with db.lock:
+                db.update(f"/{node}", extra[node])
+        hour, fired = closed.get(timeout=args.timeout)
+        assert hour == last_hour, f"đóng giờ {hour}, cần {last_hour}"
+        print(f"2. Giờ {hour:%Y-%m-%d %H}h đóng {(fired - written) * 1000:.1f} ms sau bản ghi cuối cùng")
+
+        # Mất kết nối: ghi thêm trong lúc các luồng đang kết nối lại
+        reconnects = stream.stats['reconnects']
+        db.drop_streams()
+        missed = generate_readings(3, args.per_hour, start=next_hour + timedelta(hours=1), seed=7)
+        with db.lock:
+            for node in SENSOR_NODES:
+                db.tree[node].update(missed[node])   # ghi thẳng vào cây, không qua sự kiện
+        wait_for(lambda: stream.stats['reconnects'] >= reconnects + 4, args.timeout, "kết nối lại")
+        wait_for(lambda: all(set(missed[node]) <= set(stream.caches[node].records) for node in SENSOR_NODES),
+                 args.timeout, "resync các bản ghi bị lỡ")
+        print(f"3. Sau {stream.stats['reconnects'] - reconnects} lần kết nối lại đã có đủ "
+              f"{sum(len(r) for r in missed.values())} bản ghi ghi trong lúc mất kết nối")
+        print(f"Sự kiện: {stream.stats['events']}, giờ đã đóng: {stream.stats['hours_closed']}")
+    finally:
+        stream.stop()
+        db.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""Server giả lập Firebase Realtime Database REST API để chạy benchmark cục bộ
+
+GET với `Accept: text/event-stream` mở luồng SSE như Firebase: sự kiện `put` đầu tiên là dữ liệu
+của truy vấn, sau đó mỗi lần ghi vào cây là một sự kiện `put`/`patch`, `keep-alive` khi rảnh.
+"""
+import json
+import queue
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class FakeRTDB:
+    def __init__(self, tree=None, latency=0.0, keepalive=1.0):
+        self.tree = tree if tree is not None else {}
+        self.latency = latency   # giây chờ thêm cho mỗi request (mô phỏng mạng tới Firebase)
+        self.keepalive = keepalive
+        self.lock = threading.Lock()
+        self.requests = []       # (method, path, số byte trả về)
+        self.subscribers = []    # (đường dẫn đã chuẩn hóa, hàng đợi sự kiện) của các luồng SSE
+        self.closing = False
+        self.server = None
+        self.thread = None
+
+    # ===== THAO TÁC TRÊN CÂY DỮ LIỆU =====
+    @staticmethod
+    def _split(path):
+        return [p for p in path.strip('/').split('/') if p]
+
+    def _notify(self, sub_parts, events, path, value):
+        """Sự kiện put cho một luồng SSE khi `path` vừa được ghi (gọi sau khi đã ghi, đang giữ lock)"""
+        parts = self._split(path)
+        if parts[:len(sub_parts)] == sub_parts:
+            rel = '/' + '/'.join(parts[len(sub_parts):])
+            events.put(('put', {'path': rel, 'data': value}))
+        elif sub_parts[:len(parts)] == parts:
+            # Ghi vào node cha của luồng: gửi lại toàn bộ dữ liệu tại đường dẫn của luồng
+            events.put(('put', {'path': '/', 'data': json.loads(json.dumps(self.get('/'.join(sub_parts))))}))
+
+    def get(self, path):
+        node = self.tree
+        for part in self._split(path):
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def set(self, path, value, notify=True):
+        parts = self._split(path)
+        if not parts:
+            self.tree = value if isinstance(value, dict) else {}
+        else:
+            node = self.tree
+            for part in parts[:-1]:
+                node = node.setdefault(part, {})
+            if value is None:
+                node.pop(parts[-1], None)
+            else:
+                node[parts[-1]] = value
+        if notify:
+            # Sao chép để sự kiện không dùng chung object với cây (có thể bị sửa sau đó)
+            payload = json.loads(json.dumps(value))
+            for sub_parts, events in self.subscribers:
+                self._notify(sub_parts, events, path, payload)
+
+    def update(self, path, values):
+        # PATCH: mỗi key con có thể là đường dẫn nhiều cấp ("a/b/c")
+        base = path.rstrip('/')
+        for key, value in values.items():
+            self.set(f"{base}/{key}", value, notify=False)
+        parts = self._split(path)
+        payload = json.loads(json.dumps(values))
+        for sub_parts, events in self.subscribers:
+            if sub_parts == parts:
+                # Luồng tại đúng node được PATCH nhận một sự kiện patch cho cả lần ghi
+                events.put(('patch', {'path': '/', 'data': payload}))
+            else:
+                for key, value in payload.items():
+                    self._notify(sub_parts, events, f"{base}/{key}", value)
+
+    def drop_streams(self):
+        """Ngắt mọi luồng SSE đang mở (mô phỏng mất kết nối)"""
+        with self.lock:
+            for _, events in self.subscribers:
+                events.put(None)
+
+    # ===== TRUY VẤN =====
+    @staticmethod
+    def key_order(key):
+        """Thứ tự orderBy="$key" của Firebase: key đọc được thành số nguyên 32 bit đứng trước (theo giá trị), sau đó các key chuỗi"""
+        key = str(key)
+        if re.fullmatch(r'-?(0|[1-9][0-9]*)', key) and -2 ** 31 <= int(key) < 2 ** 31:
+            return (0, int(key), '')
+        return (1, 0, key)
+
+    @staticmethod
+    def query(value, params):
+        if not isinstance(value, dict):
+            return value
+        if 'shallow' in params:
+            return {key: True for key in value}
+        if params.get('orderBy') == '"$key"':
+            order = FakeRTDB.key_order
+            keys = sorted(value, key=order)
+            if 'startAt' in params:
+                start = order(json.loads(params['startAt']))
+                keys = [k for k in keys if order(k) >= start]
+            if 'endAt' in params:
+                end = order(json.loads(params['endAt']))
+                keys = [k for k in keys if order(k) <= end]
+            if 'limitToFirst' in params:
+                keys = keys[:int(params['limitToFirst'])]
+            if 'limitToLast' in params:
+                keys = keys[-int(params['limitToLast']):]
+            return {k: value[k] for k in keys}
+        return value
+
+    # ===== HTTP SERVER =====
+    def start(self, host='127.0.0.1', port=0):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _path_params(self):
+                url = urlparse(self.path)
+                path = url.path[:-len('.json')] if url.path.endswith('.json') else url.path
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                return path, params
+
+            def _body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return json.loads(self.rfile.read(length) or b'null')
+
+            def _reply(self, value):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                body = json.dumps(value).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with fake.lock:
+                    fake.requests.append((self.command, self.path, len(body)))
+
+            def _send_event(self, event, data):
+                body = f"event: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8')
+                # Transfer-Encoding: chunked như Firebase, mỗi sự kiện là một chunk
+                self.wfile.write(f"{len(body):x}\r\n".encode() + body + b"\r\n")
+                self.wfile.flush()
+
+            def _stream(self, path, params):
+                events = queue.Queue()
+                with fake.lock:
+                    initial = json.loads(json.dumps(fake.query(fake.get(path), params)))
+                    subscriber = (fake._split(path), events)
+                    fake.subscribers.append(subscriber)
+                    fake.requests.append(('STREAM', self.path, 0))
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                self.close_connection = True
+                try:
+                    self._send_event('put', {'path': '/', 'data': initial})
+                    while not fake.closing:
+                        try:
+                            item = events.get(timeout=fake.keepalive)
+                        except queue.Empty:
+                            self._send_event('keep-alive', None)
+                            continue
+                        if item is None:
+                            break
+                        self._send_event(*item)
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with fake.lock:
+                        fake.subscribers.remove(subscriber)
+
+            def do_GET(self):
+                path, params = self._path_params()
+                if 'text/event-stream' in self.headers.get('Accept', ''):
+                    return self._stream(path, params)
+                with fake.lock:
+                    value = fake.query(fake.get(path), params)
+                    body = json.loads(json.dumps(value))
+                self._reply(body)
+
+            def do_PUT(self):
+                path, _ = self._path_params()
+                value = self._body()
+                with fake.lock:
+                    fake.set(path, value)
+                self._reply(value)
+
+            def do_PATCH(self):
+                path, _ = self._path_params()
+                values = self._body()
+                with fake.lock:
+                    fake.update(path, values)
+                self._reply(values)
+
+            def do_DELETE(self):
+                path, _ = self._path_params()
+                with fake.lock:
+                    fake.set(path, None)
+                self._reply(None)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return f"http://{host}:{self.server.server_address[1]}"
+
+    def stop(self):
+        self.closing = True
+        self.drop_streams()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = []
+
+    def bytes_sent(self):
+        with self.lock:
+            return sum(size for _, _, size in self.requests)
@@ -0,0 +1,89 @@
+"""Đo thời gian import app.py và thời gian tới khi /health phản hồi
+
+Chạy: python -m benchmarks.profile_import --top 15 --json import_profile.json
+Dùng `python -X importtime` trong tiến trình con, cộng thời gian theo package gốc
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+import requests
+
+
+def import_profile(module='app'):
+    """Chạy `import module` với -X importtime, trả về (tổng giây, {package gốc: giây tự import})"""
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          capture_output=True, text=True, cwd=os.getcwd())
+    wall = time.perf_counter() - started
+    if proc.returncode:
+        raise RuntimeError(proc.stderr[-2000:])
+
+    per_root = defaultdict(float)
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        # Cộng thời gian riêng (self) theo package gốc: không trùng lặp, tổng bằng thời gian import
+        per_root[name.strip().split('.')[0]] += int(self_us) / 1e6
+    return wall, dict(per_root)
+
+
+def time_to_health(port, timeout=120):
+    """Khởi động app.py như production và đo thời gian tới khi /health và /ready trả 200"""
+    env = dict(os.environ, PORT=str(port))
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, 'app.py'], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    result = {'health': None, 'ready': None}
+    try:
+        while time.perf_counter() - started < timeout and result['ready'] is None:
+            for name in ('health', 'ready'):
+                if result[name] is not None:
+                    continue
+                try:
+                    resp = requests.get(f'http://127.0.0.1:{port}/{name}', timeout=1)
+                    if resp.status_code == 200:
+                        result[name] = time.perf_counter() - started
+                except requests.RequestException:
+                    pass
+            time.sleep(0.05)
+    finally:
+        proc.terminate()
+        proc.wait()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--serve', action='store_true', help='đo thêm thời gian tới /health và /ready')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--json', help='ghi kết quả ra file JSON')
+    args = parser.parse_args()
+
+    wall, per_root = import_profile(args.module)
+    ranked = sorted(per_root.items(), key=lambda kv: kv[1], reverse=True)
+    print(f"import {args.module}: {wall:.2f}s (tiến trình con, gồm khởi động Python)")
+    for name, seconds in ranked[:args.top]:
+        print(f"  {name:<30} {seconds * 1000:9.1f} ms")
+
+    report = {'module': args.module, 'wall_seconds': wall,
+              'top': [{'module': n, 'seconds': s} for n, s in ranked[:args.top]]}
+    if args.serve:
+        served = time_to_health(args.port)
+        report.update(served)
+        print(f"/health sau {served['health']}s, /ready sau {served['ready']}s")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Sinh dữ liệu cảm biến giả có dạng giống các node trên Firebase"""
+from datetime import datetime, timedelta
+import numpy as np
+
+
+def generate_readings(hours, readings_per_hour=1, start=None, seed=0, dropout=0.0, jitter=0):
+    """Trả về dict {'data_temp': {...}, 'data_humidity': {...}, 'data_other': {...}}
+
+    dropout: xác suất mất một bản ghi (mỗi node độc lập, giống cảm biến gửi sót)
+    jitter: lệch ngẫu nhiên tối đa (giây) của thời điểm gửi so với lịch đều
+    """
+    rng = np.random.default_rng(seed)
+    start = start or datetime(2025, 1, 1)
+    n = hours * readings_per_hour
+    step = timedelta(seconds=3600 // readings_per_hour)
+
+    t = np.arange(n) / readings_per_hour
+    temp = 27 + 4 * np.sin(2 * np.pi * (t - 9) / 24) + rng.normal(0, 0.5, n)
+    humidity = np.clip(78 - 10 * np.sin(2 * np.pi * (t - 9) / 24) + rng.normal(0, 3, n), 30, 100)
+    pressure = 101000 + 150 * np.sin(2 * np.pi * t / (24 * 5)) + rng.normal(0, 20, n)
+    rain = np.where(rng.random(n) < 0.1, rng.gamma(1.5, 0.6, n), 0.0)
+    par = np.clip(400 * np.sin(2 * np.pi * (t - 6) / 24), 0, None)
+
+    offsets = rng.integers(0, jitter + 1, n) if jitter else np.zeros(n, dtype=int)
+    keep = rng.random((3, n)) >= dropout
+
+    temp_node, humidity_node, other_node = {}, {}, {}
+    for i in range(n):
+        ts = (start + i * step + timedelta(seconds=int(offsets[i]))).strftime("%Y%m%d%H%M%S")
+        if keep[0, i]:
+            temp_node[f"{ts}-temp"] = {'temp': round(float(temp[i]), 2)}
+        if keep[1, i]:
+            humidity_node[f"{ts}-humidity"] = {'humidity': round(float(humidity[i]), 2)}
+        if keep[2, i]:
+            other_node[f"{ts}-other"] = {
+                'PRECTOTCORR': round(float(rain[i]), 3),
+                'PS': round(float(pressure[i]), 1),
+                'ALLSKY_SFC_PAR_TOT': round(float(par[i]), 2)
+            }
+    return {'data_temp': temp_node, 'data_humidity': humidity_node, 'data_other': other_node}
+
+
+def generate_weather_current(dt):
+    return {
+        'last_update': dt.strftime("%Y-%m-%d %H:%M:%S"),
+        'temperature': 28.5,
+        'humidity': 80.0,
+        'pressure': 1009.5
+    }
+
+
+def generate_hourly_frame(hours, start=None, seed=0):
+    """DataFrame theo giờ với 9 cột giống đầu ra của get_weather_data"""
+    from services.loadDataFirebaseServices import merge_sensor_records
+
+    nodes = generate_readings(hours, 1, start=start, seed=seed)
+    return merge_sensor_records(nodes['data_temp'], nodes['data_humidity'], nodes['data_other'], {})
@@ -7,7 +7,172 @@ FIREBASE_PATHS = {
     "data_other": "/data_other"
 }
 
+# Các trạm cảm biến: trạm mặc định dùng đường dẫn gốc trong FIREBASE_PATHS,
+# các trạm khác nằm dưới <root>/<mã trạm>/... (ví dụ /stations/hue/data_temp)
+STATIONS = {
+    "default": "main",
+    "root": "/stations",
+    "stations": {
+        "main": {"name": "Trạm chính"}
+    }
+}
+
 TIMER = {
     "checkIntervalMinutes" : 5,
-    "retryIntervalMinutes" : 1
-}
\ No newline at end of file
+    "retryIntervalMinutes" : 1,
+    "maxRetryIntervalMinutes" : 30
+}
+
+# Đồng bộ tăng dần: chỉ tải các key mới hơn cursor đã lưu của từng node
+SYNC = {
+    "incremental": True,
+    "cacheDir": "data/cache",
+    "nodes": ["data_temp", "data_humidity", "data_other"],
+    "checkpointEvery": 360,         # số lần ghi delta ({node}.log) trước khi ghi lại snapshot {node}.json
+    # Giờ đã vào kho theo giờ thì chỉ giữ bản ghi thô của chừng này giờ gần nhất (để gộp lại giờ có
+    # bản ghi đến muộn); bản ghi trễ hơn bị bỏ qua. Xóa kho theo giờ thì chỉ dựng lại được từ phần này
+    "rawHours": 48
+}
+
+# Nhận dữ liệu qua luồng SSE của Firebase (Accept: text/event-stream) thay vì hỏi định kỳ:
+# dự báo chạy ngay khi một giờ đủ dữ liệu, vòng lặp TIMER chỉ còn là dự phòng
+STREAM = {
+    "enabled": False,
+    "readTimeoutSeconds": 90,       # Firebase gửi keep-alive mỗi ~30s; quá lâu không có gì thì kết nối lại
+    "maxBackoffSeconds": 60,
+    "saveIntervalSeconds": 60       # ghi cache node ra đĩa tối đa mỗi chừng này giây (và khi đóng giờ)
+}
+
+# Kho dữ liệu theo giờ lưu trên đĩa (các segment NumPy chỉ ghi nối tiếp)
+STORE = {
+    "dir": "data/store/hourly",
+    "segmentRows": 2000,
+    "windowHours": 336
+}
+
+# Lưu trữ lịch sử: bản ghi cũ hơn keepHours (tính từ key mới nhất) được gộp theo giờ vào file nén
+# cục bộ rồi xóa khỏi các node cảm biến, để dữ liệu tải về không tăng theo tuổi của hệ thống
+RETENTION = {
+    "enabled": False,
+    "keepHours": 336,               # >= 168h model cần và STORE['windowHours']
+    "archiveDir": "data/archive",
+    "chunkHours": 24,               # mỗi lượt lưu trữ tải và xóa một khúc chừng này giờ (bộ nhớ cố định)
+    "batchSize": 500,               # số key đặt null trong một PATCH nhiều đường dẫn
+    "intervalHours": 24
+}
+
+# HTTP client dùng chung cho Firebase (keep-alive, timeout, thử lại có jitter)
+HTTP = {
+    "connectTimeoutSeconds": 5,
+    "readTimeoutSeconds": 30,
+    "retries": 3,
+    "backoffSeconds": 0.5,
+    "poolSize": 8
+}
+
+# Gộp nhiều số đo trong cùng một giờ ("mean", "last", "max") và lấp giờ thiếu
+AGGREGATION = {
+    "columns": {
+        "T2M": "last",
+        "QV2M": "last",
+        "PS": "last",
+        "PRECTOTCORR": "last",
+        "ALLSKY_SFC_PAR_TOT": "last"
+    },
+    "fillMethod": "interpolate",   # "interpolate", "ffill" hoặc None để không lấp
+    "fillLimitHours": 3,
+    "reportWindows": [72, 168]
+}
+
+# API trả dự báo từ cache trong bộ nhớ
+API = {
+    "gzip": True,
+    "gzipMinBytes": 512
+}
+
+# POST /api/forecast/simulate: dự báo trên các cửa sổ dữ liệu do người gọi gửi lên (JSON hoặc .npy),
+# mọi cửa sổ trong một request được chấm bằng một lần gọi mỗi model
+SIMULATE = {
+    "maxBodyBytes": 32 * 1024 * 1024,
+    "maxWindows": 1024,
+    "maxHours": 336                 # số giờ tối đa của một cửa sổ (24h cần >= 72 giờ, 7 ngày cần >= 168)
+}
+
+# Chạy nhiều worker (gunicorn -c gunicorn.conf.py app:app): worker nào giữ được khóa file là leader,
+# chạy dự báo và ghi kết quả ra resultFile; mọi worker trả API từ file đó qua mmap
+SERVING = {
+    "lockFile": "data/cache/forecast_leader.lock",
+    "resultFile": "data/cache/forecast_results.bin",
+    "leaderRetrySeconds": 5,        # worker thường thử lại khóa sau chừng này giây (leader chết thì thay)
+    # Chỉ leader giữ model: leader mở thêm cổng nội bộ (127.0.0.1, ghi vào file này) và worker thường
+    # chuyển POST /api/forecast/simulate sang đó thay vì tự load TensorFlow và các model
+    "leaderAddressFile": "data/cache/forecast_leader.addr",
+    "forwardTimeoutSeconds": 110    # nhỏ hơn timeout 120 giây của gunicorn
+}
+
+# Backend chạy model LSTM nhiệt độ/độ ẩm: "keras", "tflite" hoặc "onnx"
+INFERENCE = {
+    "backend": "tflite",
+    "quantize": False,              # chỉ áp dụng cho tflite (trọng số int8)
+    "tfliteBatch": 16,              # tflite export thêm bản input (16, T, F) cho batch lớn; 0/1 = chỉ bản batch 1
+    "exportDir": "data/models/temp-humidity/compiled",
+    "tolerance": 1e-4,              # sai số tối đa so với Keras (đơn vị đã chuẩn hóa)
+    "quantizedTolerance": 0.05
+}
+
+# Tiến trình suy luận riêng: giữ model LSTM và model mưa, nhận tensor qua hàng đợi multiprocessing,
+# gom các request đến gần nhau (khác trạm, API gọi theo yêu cầu) thành một lần gọi model
+INFERENCE_WORKER = {
+    "enabled": False,
+    "maxBatch": 256,                # số dòng tối đa trong một lần gọi model
+    "maxWaitMs": 5,                 # chờ thêm tối đa chừng này sau request đầu tiên để gom batch
+    "startTimeoutSeconds": 120,     # load model trong worker
+    "timeoutSeconds": 60
+}
+
+# Chuẩn hóa đầu vào model LSTM: "bundle" (tham số lúc huấn luyện, file .scaler.json cạnh model),
+# "window" (fit lại trên từng cửa sổ như cũ) hoặc "streaming" (thống kê chạy trên toàn bộ lịch sử)
+NORMALIZATION = {
+    "mode": "bundle",
+    "streamingPath": "data/cache/streaming_scaler.json",
+    "minStreamingRows": 168
+}
+
+# Chạy 4 tác vụ dự báo (nhiệt độ 24h/7 ngày, mưa 24h/7 ngày) song song:
+# "thread" (TF/sklearn nhả GIL), "process" (tiến trình spawn riêng) hoặc "serial" (tuần tự, để so sánh)
+FORECAST = {
+    "executor": "thread",
+    "workers": None     # None = min(4, số CPU); máy 1 CPU chỉ còn lợi ích đẩy Firebase chồng lên tính toán
+}
+
+# Dự báo mưa 7 ngày: nhiễu ±noise cho các đặc trưng "mean" sau farHours giờ, lấy trung bình
+# của `members` mẫu (một lần predict_proba); seed cố định + giờ bắt đầu nên cùng dữ liệu cho cùng kết quả
+RAIN_7D = {
+    "members": 8,
+    "noise": 0.02,
+    "farHours": 48,
+    "seed": 2024,
+    "percentiles": []               # ví dụ [10, 90]: thêm probability_p10/p90 theo ngày giữa các mẫu
+}
+
+# Backtest (python -m models.backtest): mỗi giờ trong lịch sử là một mốc dự báo, so với số đo thực tế
+BACKTEST = {
+    "chunkOrigins": 256,            # số mốc trong một lần gọi model (và một tác vụ gửi cho tiến trình con)
+    "workers": None,                # None = min(4, số CPU); mỗi tiến trình load riêng TF và các model
+    "leads": [1, 3, 6, 12, 24, 48, 72, 120, 168]    # số giờ dự báo trước in ra màn hình (--out ghi đủ)
+}
+
+# Nhớ kết quả dự báo theo (model, horizon, cửa sổ đầu vào): dữ liệu không đổi thì không tính lại
+MEMO = {
+    "enabled": True,
+    "maxEntries": 256,
+    "persist": False,               # ghi thêm ra đĩa để dùng lại sau khi khởi động lại
+    "dir": "data/cache/forecast_memo",
+    "maxDiskEntries": 2048
+}
+
+# Số liệu đo từng giai đoạn (span/histogram/counter), xuất ở /metrics theo định dạng Prometheus
+METRICS = {
+    "enabled": True,
+    "buckets": [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]   # giây
+}
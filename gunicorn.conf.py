@@ -0,0 +1,17 @@
+# Chạy nhiều worker: gunicorn -c gunicorn.conf.py app:app
+# Mỗi worker nhận HTTP; chỉ một worker (leader, giữ khóa SERVING['lockFile']) load model, chạy dự báo
+# và ghi kết quả ra SERVING['resultFile'], các worker còn lại đọc file đó qua mmap
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = 120
+# Không preload: TensorFlow chỉ được import trong leader, sau khi fork
+preload_app = False
+
+
+def post_worker_init(worker):
+    from app import start_serving
+    start_serving()
@@ -0,0 +1,381 @@
+"""Backtest dự báo trên lịch sử theo giờ đã lưu (CSV có các cột của get_weather_data hoặc kho theo giờ)
+
+Mỗi giờ (cách nhau --stride) là một mốc: chỉ dùng dữ liệu tới mốc đó để dự báo rồi so với số đo sau đó.
+    python -m models.backtest --csv lich_su.csv
+    python -m models.backtest --from-store --horizons 24h --workers 4 --out backtest.json
+Nhiệt độ/độ ẩm: MAE/RMSE theo số giờ dự báo trước; mưa: Brier/AUC với nhãn PRECTOTCORR > rain_threshold.
+
+Đặc trưng được tính một lần cho cả chuỗi, cửa sổ đầu vào của các mốc là view trượt trên các mảng đó
+(không dựng DataFrame cho từng mốc); mỗi khối chunkOrigins mốc gọi mỗi model một lần, các khối
+chia cho các tiến trình con (spawn). Cách dự báo giống forecast_batch / WeatherPredictor, trừ:
+mốc phải có dữ liệu đủ ở chính giờ đó (dịch vụ thì lùi về giờ hợp lệ gần nhất), chuẩn hóa
+'streaming' tính từ đầu file thay vì từ lúc dịch vụ chạy, và không làm tròn kết quả.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from config.server_config import BACKTEST, NORMALIZATION, RAIN_7D
+from services.hourlyAggregationServices import hourly_index
+from models.rain_features import RAW_COLUMNS, series_features
+
+sliding = np.lib.stride_tricks.sliding_window_view
+HOUR = np.timedelta64(1, 'h')
+
+
+def hourly_series(data):
+    """DataFrame 9 cột -> (giờ liên tục (T,) datetime64[ns], giá trị (T, RAW_COLUMNS)); giờ thiếu là NaN"""
+    frame = data[RAW_COLUMNS].astype(float).set_axis(pd.DatetimeIndex(hourly_index(data)))
+    frame = frame[~frame.index.duplicated(keep='last')].sort_index()
+    grid = pd.date_range(frame.index[0], frame.index[-1], freq='h')
+    return grid.values, frame.reindex(grid).to_numpy()
+
+
+def temp_features(times, values):
+    """Ma trận (T, 9) theo INPUT_FEATURES, giống prepare_dataframe cho cả chuỗi"""
+    from models.temp_humidity_model import INPUT_FEATURES
+    index = pd.DatetimeIndex(times)
+    hour, month = index.hour.to_numpy(), index.month.to_numpy()
+    columns = {col: values[:, RAW_COLUMNS.index(col)] for col in RAW_COLUMNS}
+    columns['hour_sin'] = np.sin(2 * np.pi * hour / 24)
+    columns['hour_cos'] = np.cos(2 * np.pi * hour / 24)
+    columns['month_sin'] = np.sin(2 * np.pi * month / 12)
+    columns['month_cos'] = np.cos(2 * np.pi * month / 12)
+    return np.column_stack([columns[col] for col in INPUT_FEATURES])
+
+
+class Backtester:
+    """Giữ chuỗi và các ma trận đặc trưng của cả chuỗi; run(mốc) dự báo cho một khối mốc"""
+
+    def __init__(self, times, values, horizons, members, mode):
+        from models.rain_model import get_predictor, time_features
+        from models.temp_humidity_model import HORIZONS, TEMP_MODEL_PATHS, get_temp_model
+
+        self.horizons = horizons
+        self.members = members
+        self.mode = mode
+        self.steps = {h: HORIZONS[h][:2] for h in horizons}
+        self.temp_models = {h: get_temp_model(h) for h in horizons}
+        self.temp_paths = TEMP_MODEL_PATHS
+        self.predictor = get_predictor()
+        self.timings = {}
+
+        with self._timed('features'):
+            # Thêm 168 giờ NaN ở cuối để cửa sổ "thực đo" của mốc gần cuối vẫn đủ độ dài
+            pad = np.full((168, values.shape[1]), np.nan)
+            self.values = np.vstack([values, pad])
+            self.temp = temp_features(times, values)
+            self.temp_nan = np.r_[0, np.cumsum(np.isnan(self.temp).any(axis=1))]
+            self.temp_truth = np.vstack([self.temp[:, :2], pad[:, :2]])
+            self.rain, self.rain_valid = series_features(self.predictor.selected_features, times, values)
+            self.rain_valid_sum = np.r_[0, np.cumsum(self.rain_valid)]
+            # Đặc trưng thời gian của mọi giờ dự báo (kể cả 168 giờ sau giờ cuối)
+            future = pd.DatetimeIndex(times[0] + np.arange(len(times) + 168) * HOUR)
+            feats = time_features(future)
+            self.time_cols = [j for j, col in enumerate(self.predictor.selected_features) if col in feats]
+            self.time_values = np.column_stack([feats[self.predictor.selected_features[j]]
+                                                for j in self.time_cols]).astype(float)
+            self.mean_cols = np.array([j for j, col in enumerate(self.predictor.selected_features)
+                                       if 'mean' in col], dtype=int)
+            self.start_seconds = (times + HOUR).astype('datetime64[s]').astype(np.int64)
+            if mode == 'streaming':
+                self._streaming_stats()
+
+    def _timed(self, stage):
+        backtester = self
+
+        class Timer:
+            def __enter__(self):
+                self.start = time.perf_counter()
+
+            def __exit__(self, *exc):
+                backtester.timings[stage] = backtester.timings.get(stage, 0.0) + time.perf_counter() - self.start
+        return Timer()
+
+    # ===== NHIỆT ĐỘ / ĐỘ ẨM =====
+    def _streaming_stats(self):
+        """Trung bình / phương sai cộng dồn từ đầu chuỗi tới từng giờ (bỏ giờ có NaN), như StreamingScaler"""
+        ok = ~np.isnan(self.temp).any(axis=1)
+        ref = self.temp[ok][0]
+        shifted = np.where(ok[:, None], self.temp - ref, 0.0)
+        self.stream_n = np.cumsum(ok)
+        n = np.maximum(self.stream_n, 1)[:, None]
+        self.stream_mean = np.cumsum(shifted, axis=0) / n
+        self.stream_var = np.maximum(np.cumsum(shifted ** 2, axis=0) / n - self.stream_mean ** 2, 0.0)
+        self.stream_mean += ref
+
+    def _scaler(self, horizon, X, origins):
+        """(mean, scale) theo mốc, shape (n, 9) hoặc (9,), theo chế độ chuẩn hóa như get_scaler"""
+        from models.scaler_bundle import _scale_from_var, load_bundle
+        if self.mode == 'bundle':
+            bundle = load_bundle(self.temp_paths[horizon])
+            if bundle is not None:
+                return bundle.mean, bundle.scale
+        mean, var = X.mean(axis=1), X.var(axis=1)
+        scale = _scale_from_var(mean, var, X.shape[1])
+        if self.mode == 'streaming':
+            enough = self.stream_n[origins] >= NORMALIZATION['minStreamingRows']
+            s_mean, s_var, s_n = self.stream_mean[origins], self.stream_var[origins], self.stream_n[origins]
+            s_scale = _scale_from_var(s_mean, s_var, s_n[:, None])
+            mean = np.where(enough[:, None], s_mean, mean)
+            scale = np.where(enough[:, None], s_scale, scale)
+        return mean, scale
+
+    def temp_errors(self, horizon, origins):
+        """Sai số (dự báo - thực đo) (n, output_steps, 2) cho T2M, QV2M; mốc thiếu đầu vào -> NaN"""
+        input_steps, output_steps = self.steps[horizon]
+        errors = np.full((len(origins), output_steps, 2), np.nan, dtype=np.float32)
+        ok = (origins >= input_steps - 1)
+        ok[ok] = self.temp_nan[origins[ok] + 1] == self.temp_nan[origins[ok] + 1 - input_steps]
+        chosen = origins[ok]
+        if not len(chosen):
+            return errors
+
+        with self._timed(f'temp_{horizon} features'):
+            # view (T - S + 1, 9, S): cửa sổ kết thúc ở mốc o bắt đầu tại o - S + 1; chỉ khối mốc này được copy
+            X = sliding(self.temp, input_steps, axis=0)[chosen - input_steps + 1].transpose(0, 2, 1)
+            mean, scale = self._scaler(horizon, X, chosen)
+            mean3, scale3 = np.asarray(mean)[..., None, :], np.asarray(scale)[..., None, :]
+            X = ((X - mean3) / scale3).astype(np.float32)
+        with self._timed(f'temp_{horizon} inference'):
+            y = self.temp_models[horizon].predict(X)
+        y = y.reshape(len(chosen), output_steps, 2) * scale3[..., :2] + mean3[..., :2]
+        truth = sliding(self.temp_truth, output_steps, axis=0)[chosen + 1].transpose(0, 2, 1)
+        errors[ok] = y - truth
+        return errors
+
+    # ===== MƯA =====
+    def rain_probs(self, horizon, origins):
+        """Xác suất mưa (0-1) (n, số giờ) theo giờ dự báo; 7 ngày là trung bình các mẫu như format_7days"""
+        hours = 24 if horizon == '24h' else 168
+        probs = np.full((len(origins), hours), np.nan, dtype=np.float32)
+        # Mốc phải có dòng đặc trưng hợp lệ (7 ngày: 12 dòng cuối, vì matrix_7days dùng rows[-12])
+        need = 1 if horizon == '24h' else 12
+        ok = origins >= need - 1
+        ok[ok] = self.rain_valid_sum[origins[ok] + 1] - self.rain_valid_sum[origins[ok] + 1 - need] == need
+        chosen = origins[ok]
+        if not len(chosen):
+            return probs
+
+        with self._timed(f'rain_{horizon} features'):
+            if horizon == '24h':
+                X = np.repeat(self.rain[chosen][:, None, :], hours, axis=1)
+            else:
+                # 24h đầu lấy dòng ở mốc, ngày thứ 2 lùi 5 giờ, các ngày sau lùi 11 giờ (rows[-1], [-6], [-12])
+                back = np.select([np.arange(hours) < 24, np.arange(hours) < 48], [0, 5], default=11)
+                X = self.rain[chosen[:, None] - back[None, :]]
+            X[:, :, self.time_cols] = sliding(self.time_values, hours, axis=0)[chosen + 1].transpose(0, 2, 1)
+            # Nhiễu chỉ có ở các giờ > farHours: các giờ gần giống nhau ở mọi mẫu nên chỉ chấm một lần
+            far = np.arange(hours) > RAIN_7D['farHours'] if horizon == '7d' and len(self.mean_cols) else \
+                np.zeros(hours, dtype=bool)
+            X_far = self._members(X[:, far], chosen) if far.any() else X[:, far]
+            blocks = [X[:, ~far].reshape(-1, X.shape[-1]), X_far.reshape(-1, X.shape[-1])]
+        with self._timed(f'rain_{horizon} inference'):
+            p = self.predictor.model.predict_proba(np.vstack(blocks))[:, 1]
+        rows = probs[ok]
+        rows[:, ~far] = p[:len(blocks[0])].reshape(len(chosen), -1)
+        if far.any():
+            rows[:, far] = p[len(blocks[0]):].reshape(len(chosen), self.members, -1).mean(axis=1)
+        probs[ok] = rows
+        return probs
+
+    def _members(self, X, origins):
+        """Các giờ xa (n, H, F) -> (n, members, H, F) với nhiễu của matrix_7days (seed theo giờ bắt đầu)"""
+        X = np.repeat(X[:, None], self.members, axis=1)
+        for i, origin in enumerate(origins):
+            rng = np.random.default_rng([RAIN_7D['seed'], int(self.start_seconds[origin])])
+            variation = rng.normal(0, RAIN_7D['noise'], size=(self.members, X.shape[2], len(self.mean_cols)))
+            X[i][:, :, self.mean_cols] *= 1 + variation
+        return X
+
+    def run(self, origins):
+        self.timings = {}
+        origins = np.asarray(origins)
+        result = {}
+        for horizon in self.horizons:
+            result[f'temp_{horizon}'] = self.temp_errors(horizon, origins)
+            result[f'rain_{horizon}'] = self.rain_probs(horizon, origins)
+        return result, dict(self.timings)
+
+
+# ===== TIẾN TRÌNH CON =====
+_backtester = None
+
+THREAD_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+               'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS')
+
+@contextlib.contextmanager
+def thread_limits(threads):
+    """Đặt giới hạn thread trong môi trường khi tạo tiến trình con rồi trả lại như cũ
+
+    Phải có trước khi tiến trình con import numpy / TensorFlow (spawn chép os.environ lúc khởi động),
+    đặt trong initializer thì BLAS và TF đã đọc xong.
+    """
+    saved = {var: os.environ.get(var) for var in THREAD_VARS}
+    os.environ.update({var: str(threads) for var in THREAD_VARS})
+    try:
+        yield
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+def init_worker(times, values, horizons, members, mode):
+    """Mỗi tiến trình con load model và tính đặc trưng của cả chuỗi một lần"""
+    global _backtester
+    _backtester = Backtester(times, values, horizons, members, mode)
+
+def run_chunk(origins):
+    return _backtester.run(origins)
+
+
+def run_backtest(times, values, origins, horizons, members, mode, workers, chunk):
+    """Dự báo cho mọi mốc, trả về ({tên: mảng nối theo mốc}, {giai đoạn: giây cộng qua các tiến trình})"""
+    chunks = [origins[i:i + chunk] for i in range(0, len(origins), chunk)]
+    if workers <= 1:
+        init_worker(times, values, horizons, members, mode)
+        outputs = map(run_chunk, chunks)
+        executor = None
+    else:
+        # Nhiều tiến trình cùng chạy: mỗi tiến trình chỉ dùng phần CPU của nó
+        with thread_limits(max(1, (os.cpu_count() or 1) // workers)):
+            executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                           initializer=init_worker,
+                                           initargs=(times, values, horizons, members, mode))
+            # map gửi mọi khối ngay nên các tiến trình con được tạo trong khối with này
+            outputs = executor.map(run_chunk, chunks)
+    try:
+        parts, timings = {}, {}
+        for result, chunk_timings in outputs:
+            for name, array in result.items():
+                parts.setdefault(name, []).append(array)
+            for stage, seconds in chunk_timings.items():
+                timings[stage] = timings.get(stage, 0.0) + seconds
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return {name: np.concatenate(arrays) for name, arrays in parts.items()}, timings
+
+
+# ===== CHỈ SỐ =====
+def temp_metrics(errors):
+    """Sai số (n, H, 2) -> {cột: {'mae': [H], 'rmse': [H], 'n': [H]}} theo số giờ dự báo trước"""
+    report = {}
+    for k, col in enumerate(['T2M', 'QV2M']):
+        e = errors[:, :, k].astype(np.float64)
+        n = (~np.isnan(e)).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            report[col] = {
+                'mae': (np.nansum(np.abs(e), axis=0) / n).tolist(),
+                'rmse': np.sqrt(np.nansum(e ** 2, axis=0) / n).tolist(),
+                'n': n.tolist(),
+            }
+    return report
+
+def rain_metrics(probs, labels):
+    """Xác suất và nhãn (n, H) -> {'brier': [H], 'auc': [H], 'n': [H]}; AUC là None khi chỉ có một lớp"""
+    from sklearn.metrics import roc_auc_score
+    brier, auc, counts = [], [], []
+    for lead in range(probs.shape[1]):
+        ok = ~np.isnan(probs[:, lead]) & ~np.isnan(labels[:, lead])
+        p, y = probs[ok, lead].astype(np.float64), labels[ok, lead]
+        counts.append(int(ok.sum()))
+        brier.append(float(np.mean((p - y) ** 2)) if len(p) else None)
+        auc.append(float(roc_auc_score(y, p)) if len(np.unique(y)) == 2 else None)
+    return {'brier': brier, 'auc': auc, 'n': counts}
+
+def rain_labels(values, origins, hours, threshold):
+    """Nhãn mưa của các giờ sau mốc: 1 nếu PRECTOTCORR > threshold, NaN nếu thiếu số đo"""
+    rain = np.r_[values[:, RAW_COLUMNS.index('PRECTOTCORR')], np.full(hours, np.nan)]
+    window = sliding(rain, hours)[origins + 1]
+    return np.where(np.isnan(window), np.nan, (window > threshold).astype(float))
+
+
+def print_report(report, leads):
+    for name, metrics in report.items():
+        if name.startswith('temp_'):
+            for col, m in metrics.items():
+                shown = [lead for lead in leads if lead <= len(m['mae'])]
+                print(f"{name} {col}: " + "  ".join(
+                    f"+{lead}h MAE {m['mae'][lead - 1]:.3f} RMSE {m['rmse'][lead - 1]:.3f}" for lead in shown))
+        else:
+            shown = [lead for lead in leads if lead <= len(metrics['brier'])]
+            cells = []
+            for lead in shown:
+                brier, auc = metrics['brier'][lead - 1], metrics['auc'][lead - 1]
+                cells.append(f"+{lead}h Brier {brier:.3f} AUC " + (f"{auc:.3f}" if auc is not None else '-'))
+            print(f"{name}: " + "  ".join(cells))
+
+
+def main():
+    from models.temp_humidity_model import HORIZONS
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--csv', help='lịch sử theo giờ (YEAR, MO, DY, HR và các cột đo)')
+    parser.add_argument('--from-store', action='store_true', help='dùng toàn bộ kho theo giờ trên máy')
+    parser.add_argument('--horizons', nargs='+', default=list(HORIZONS), choices=list(HORIZONS))
+    parser.add_argument('--stride', type=int, default=1, help='số giờ giữa hai mốc')
+    parser.add_argument('--start', help='mốc đầu tiên (YYYY-MM-DD), mặc định ngay khi đủ dữ liệu')
+    parser.add_argument('--end', help='mốc cuối cùng (YYYY-MM-DD)')
+    parser.add_argument('--workers', type=int, default=BACKTEST['workers'] or min(4, os.cpu_count() or 1),
+                        help='số tiến trình con, mỗi tiến trình một bản TF và các model')
+    parser.add_argument('--chunk', type=int, default=BACKTEST['chunkOrigins'])
+    parser.add_argument('--members', type=int, default=RAIN_7D['members'], help='số mẫu nhiễu mưa 7 ngày')
+    parser.add_argument('--normalization', default=NORMALIZATION['mode'], choices=['bundle', 'window', 'streaming'])
+    parser.add_argument('--out', help='ghi đủ chỉ số theo từng giờ dự báo trước ra file JSON')
+    args = parser.parse_args()
+
+    if args.csv:
+        data = pd.read_csv(args.csv)
+    elif args.from_store:
+        from services.loadDataFirebaseServices import get_hourly_store
+        data = get_hourly_store().read_all()
+    else:
+        parser.error('cần --csv hoặc --from-store')
+
+    started = time.perf_counter()
+    times, values = hourly_series(data)
+    first = max(HORIZONS[h][0] for h in args.horizons) - 1
+    origins = np.arange(first, len(times) - 1, args.stride)
+    if args.start:
+        origins = origins[times[origins] >= np.datetime64(args.start)]
+    if args.end:
+        origins = origins[times[origins] < np.datetime64(args.end) + np.timedelta64(1, 'D')]
+    if not len(origins):
+        parser.error('không có mốc nào (chuỗi quá ngắn hoặc --start/--end ngoài phạm vi)')
+    workers = max(1, min(args.workers, -(-len(origins) // args.chunk)))
+    print(f"{len(times)} giờ ({pd.Timestamp(times[0])} -> {pd.Timestamp(times[-1])}), "
+          f"{len(origins)} mốc, {workers} tiến trình")
+
+    outputs, timings = run_backtest(times, values, origins, args.horizons, args.members,
+                                    args.normalization, workers, args.chunk)
+
+    from models.rain_model import get_predictor
+    threshold = get_predictor().rain_threshold
+    report = {}
+    for horizon in args.horizons:
+        report[f'temp_{horizon}'] = temp_metrics(outputs[f'temp_{horizon}'])
+        probs = outputs[f'rain_{horizon}']
+        report[f'rain_{horizon}'] = rain_metrics(probs, rain_labels(values, origins, probs.shape[1], threshold))
+    elapsed = time.perf_counter() - started
+
+    print_report(report, BACKTEST['leads'])
+    print(f"Xong sau {elapsed:.1f}s ({len(origins) / elapsed:.0f} mốc/s); thời gian cộng qua các tiến trình: " +
+          ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in sorted(timings.items())))
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'origins': len(origins), 'stride': args.stride, 'normalization': args.normalization,
+                       'members': args.members, 'seconds': elapsed, 'timings': timings, 'metrics': report},
+                      f, indent=2)
+        print(f"Đã ghi {args.out}")
+
+
+if __name__ == '__main__':
+    main()
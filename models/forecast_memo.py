@@ -0,0 +1,126 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from config.server_config import MEMO
+from services.forecastSchedulerServices import fingerprint
+
+
+def model_id(path, variant=''):
+    """Định danh phiên bản model: tên file + thời điểm sửa (+ backend); đổi file model là đổi khóa"""
+    return f"{os.path.basename(path)}@{os.stat(path).st_mtime_ns}{':' + variant if variant else ''}"
+
+
+def window_key(data, hours, *arrays):
+    """Khóa của cửa sổ đầu vào: dấu vân tay `hours` giờ cuối (gồm thời điểm) + các mảng phụ (tham số chuẩn hóa...)"""
+    key = fingerprint(data, hours)
+    if arrays:
+        digest = hashlib.blake2b(digest_size=8)
+        for array in arrays:
+            digest.update(array.tobytes())
+        key = f"{key}-{digest.hexdigest()}"
+    return key
+
+
+class ForecastMemo:
+    """Bộ nhớ đệm LRU cho kết quả dự báo, khóa (model, horizon, cửa sổ đầu vào)
+
+    Kết quả lưu dạng pickle nên mỗi lần trúng trả về bản sao mới (caller sửa không ảnh hưởng cache);
+    nếu bật persist thì ghi thêm ra đĩa để dùng lại sau khi khởi động lại.
+    """
+
+    def __init__(self, max_entries=None, path=None, max_disk_entries=None):
+        self.max_entries = max_entries or MEMO['maxEntries']
+        self.path = path
+        self.max_disk_entries = max_disk_entries or MEMO['maxDiskEntries']
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        self._writes = 0
+
+    @staticmethod
+    def _name(key):
+        return hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            blob = self.entries.get(key)
+            if blob is not None:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return pickle.loads(blob)
+        blob = self._read_disk(key)
+        with self.lock:
+            if blob is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+            self._remember(key, blob)
+        return pickle.loads(blob)
+
+    def put(self, key, result):
+        blob = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self._remember(key, blob)
+        self._write_disk(key, blob)
+
+    def _remember(self, key, blob):
+        self.entries[key] = blob
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    # ===== LƯU TRÊN ĐĨA (TÙY CHỌN) =====
+    def _read_disk(self, key):
+        if not self.path:
+            return None
+        try:
+            with open(os.path.join(self.path, self._name(key) + '.pkl'), 'rb') as f:
+                stored_key, blob = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return blob if stored_key == key else None
+
+    def _write_disk(self, key, blob):
+        if not self.path:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        file = os.path.join(self.path, self._name(key) + '.pkl')
+        tmp = f"{file}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            pickle.dump((key, blob), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, file)
+        self._writes += 1
+        if self._writes % 64 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Giữ tối đa max_disk_entries file, xóa các file cũ nhất"""
+        files = [os.path.join(self.path, name) for name in os.listdir(self.path) if name.endswith('.pkl')]
+        if len(files) <= self.max_disk_entries:
+            return
+        files.sort(key=os.path.getmtime)
+        for file in files[:len(files) - self.max_disk_entries]:
+            try:
+                os.remove(file)
+            except OSError:
+                pass
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def metrics(self):
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['disk_hits'] + self.stats['misses']
+            return {
+                **self.stats,
+                'entries': len(self.entries),
+                'hit_rate': round((self.stats['hits'] + self.stats['disk_hits']) / lookups, 3) if lookups else None,
+            }
+
+
+forecast_memo = ForecastMemo(path=MEMO['dir'] if MEMO['persist'] else None)
+
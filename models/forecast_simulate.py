@@ -0,0 +1,125 @@
+import io
+import json
+import numpy as np
+import pandas as pd
+from config.server_config import SIMULATE
+from services.hourlyAggregationServices import TIME_COLUMNS, VALUE_COLUMNS
+from services.metricsServices import metrics
+from models.rain_model import get_predictor
+from models.temp_humidity_model import HORIZONS, forecast_batch, get_temp_model
+
+# Một giờ trong cửa sổ gửi lên: cùng 9 cột (và thứ tự) với dữ liệu cảm biến đã gộp theo giờ
+SCHEMA = TIME_COLUMNS + VALUE_COLUMNS
+NPY_TYPES = ('application/x-npy', 'application/octet-stream')
+
+
+class BodyTooLarge(ValueError):
+    """Body vượt SIMULATE['maxBodyBytes'] (HTTP 413)"""
+
+
+def read_body(stream, length, limit=None):
+    """Đọc body tối đa `limit` byte; Content-Length lớn hơn thì từ chối trước khi đọc"""
+    limit = limit or SIMULATE['maxBodyBytes']
+    if length is not None and length > limit:
+        raise BodyTooLarge(f"Body {length} byte, tối đa {limit} byte")
+    body = stream.read(limit + 1)
+    if len(body) > limit:
+        raise BodyTooLarge(f"Body vượt quá {limit} byte")
+    return body
+
+
+def parse_horizons(value):
+    """'24h,7d' -> ['24h', '7d']; None = mọi horizon"""
+    horizons = [h.strip() for h in value.split(',') if h.strip()] if value else list(HORIZONS)
+    unknown = [h for h in horizons if h not in HORIZONS]
+    if unknown or not horizons:
+        raise ValueError(f"Horizon không hỗ trợ: {', '.join(unknown)} (chọn {', '.join(HORIZONS)})")
+    return horizons
+
+
+def parse_windows(body, mimetype):
+    """Body -> danh sách mảng (số giờ, 9) theo SCHEMA
+
+    - JSON: {"windows": [[[YEAR, MO, DY, HR, QV2M, PRECTOTCORR, PS, T2M, ALLSKY_SFC_PAR_TOT], ...], ...]},
+      các cửa sổ được dài ngắn khác nhau
+    - .npy (application/x-npy): mảng (N, số giờ, 9) hoặc (số giờ, 9), không nhận pickle
+    """
+    if mimetype in NPY_TYPES:
+        try:
+            array = np.load(io.BytesIO(body), allow_pickle=False)
+        except (ValueError, OSError, EOFError) as e:
+            raise ValueError(f"File .npy không hợp lệ: {e}") from None
+        if array.dtype.kind not in 'iuf':
+            raise ValueError(f"Mảng .npy phải là số, nhận {array.dtype}")
+        windows = list(array[None] if array.ndim == 2 else array) if array.ndim in (2, 3) else None
+        if windows is None:
+            raise ValueError(f"Mảng .npy phải có shape (N, số giờ, {len(SCHEMA)}), nhận {array.shape}")
+    else:
+        try:
+            payload = json.loads(body)
+        except (ValueError, UnicodeDecodeError) as e:
+            raise ValueError(f"JSON không hợp lệ: {e}") from None
+        windows = payload.get('windows') if isinstance(payload, dict) else None
+        if not isinstance(windows, list):
+            raise ValueError('Cần {"windows": [cửa sổ, ...]}, mỗi cửa sổ là danh sách các giờ '
+                             f"[{', '.join(SCHEMA)}]")
+
+    if not 0 < len(windows) <= SIMULATE['maxWindows']:
+        raise ValueError(f"Cần 1-{SIMULATE['maxWindows']} cửa sổ, nhận {len(windows)}")
+    arrays = []
+    for i, window in enumerate(windows):
+        try:
+            window = np.asarray(window, dtype=float)
+        except (ValueError, TypeError):
+            raise ValueError(f"Cửa sổ {i}: phải là mảng số") from None
+        if window.ndim != 2 or window.shape[1] != len(SCHEMA):
+            raise ValueError(f"Cửa sổ {i}: mỗi giờ cần {len(SCHEMA)} cột {SCHEMA}, nhận shape {window.shape}")
+        if not 0 < len(window) <= SIMULATE['maxHours']:
+            raise ValueError(f"Cửa sổ {i}: cần 1-{SIMULATE['maxHours']} giờ, nhận {len(window)}")
+        if not np.isfinite(window).all():
+            raise ValueError(f"Cửa sổ {i}: có giá trị rỗng / NaN")
+        arrays.append(window)
+    return arrays
+
+
+def build_datas(windows):
+    """Mảng (số giờ, 9) -> {chỉ số: DataFrame} giống dữ liệu một trạm
+
+    Mọi cửa sổ nằm chung một DataFrame (mỗi cửa sổ là một lát cắt), thời gian được kiểm tra một lần
+    cho tất cả: các giờ trong một cửa sổ phải liên tục, cách nhau đúng 1 giờ.
+    """
+    lengths = np.array([len(w) for w in windows])
+    ends = np.cumsum(lengths)
+    frame = pd.DataFrame(np.concatenate(windows), columns=SCHEMA)
+    frame[TIME_COLUMNS] = frame[TIME_COLUMNS].astype(np.int64)
+    try:
+        times = pd.to_datetime(frame[TIME_COLUMNS].rename(
+            columns={'YEAR': 'year', 'MO': 'month', 'DY': 'day', 'HR': 'hour'})).to_numpy()
+    except (ValueError, OverflowError) as e:
+        raise ValueError(f"Thời gian không hợp lệ: {e}") from None
+
+    steps = np.diff(times) != np.timedelta64(1, 'h')
+    steps[ends[:-1] - 1] = False        # chỗ nối giữa hai cửa sổ
+    if steps.any():
+        row = int(np.flatnonzero(steps)[0]) + 1
+        i = int(np.searchsorted(ends, row, side='right'))
+        raise ValueError(f"Cửa sổ {i}: giờ thứ {row - (ends[i - 1] if i else 0)} không liền sau giờ trước")
+    return {i: frame.iloc[end - length:end] for i, (end, length) in enumerate(zip(ends, lengths))}
+
+
+def simulate(datas, horizons):
+    """{id: DataFrame} -> {horizon: {id: (dự báo nhiệt độ, dự báo mưa hoặc exception)}}
+
+    Mỗi model chỉ được gọi một lần cho mọi cửa sổ (forecast_batch / predict_batch với simulated=True:
+    không dùng forecast_memo, không đụng trạng thái tăng dần hay thống kê chuẩn hóa của các trạm).
+    """
+    predictor = get_predictor()
+    rain = {'24h': predictor.predict_24h_batch, '7d': predictor.predict_7days_batch}
+    metrics.inc('simulate_windows_total', len(datas))
+    results = {}
+    with metrics.span('simulate'):
+        for horizon in horizons:
+            temp = forecast_batch(get_temp_model(horizon), datas, horizon, simulated=True)
+            probs = rain[horizon](datas, simulated=True)
+            results[horizon] = {key: (temp[key], probs[key]) for key in datas}
+    return results
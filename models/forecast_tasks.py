@@ -0,0 +1,93 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from config.server_config import FORECAST
+from services.metricsServices import metrics
+from models.rain_model import get_24h_forecast_batch, get_7day_forecast_batch, get_predictor
+from models.temp_humidity_model import forecast_batch, get_temp_model
+
+EXECUTORS = ('thread', 'process', 'serial')
+
+# Các tác vụ là hàm cấp module để gửi được sang tiến trình con (pickle)
+def temp_24h_task(datas):
+    return forecast_batch(get_temp_model('24h'), datas, '24h')
+
+def temp_7d_task(datas):
+    return forecast_batch(get_temp_model('7d'), datas, '7d')
+
+def rain_24h_task(datas):
+    return get_24h_forecast_batch(datas)
+
+def rain_7d_task(datas):
+    return get_7day_forecast_batch(datas)
+
+# Tác vụ 24h đứng trước để kết quả 24h sẵn sàng (và được đẩy lên) sớm nhất
+FORECAST_TASKS = {
+    'temp_24h': temp_24h_task,
+    'rain_24h': rain_24h_task,
+    'temp_7d': temp_7d_task,
+    'rain_7d': rain_7d_task,
+}
+
+def warm_worker():
+    """Mỗi tiến trình con load sẵn mọi model, tác vụ nào rơi vào tiến trình nào cũng không phải chờ"""
+    get_temp_model('24h')
+    get_temp_model('7d')
+    get_predictor()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """Pool dùng chung cho các chu kỳ dự báo, tạo khi cần lần đầu"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            kind = FORECAST['executor']
+            workers = FORECAST['workers'] or min(len(FORECAST_TASKS), os.cpu_count() or 1)
+            if kind not in EXECUTORS:
+                raise ValueError(f"Executor không hỗ trợ: {kind} (chọn {', '.join(EXECUTORS)})")
+            if kind == 'process':
+                # spawn: TensorFlow không an toàn khi fork; mỗi tiến trình tự load model một lần
+                _executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                                initializer=warm_worker)
+            elif kind == 'thread':
+                _executor = ThreadPoolExecutor(workers, thread_name_prefix='forecast')
+        return _executor
+
+def shared_views(datas):
+    """View nông cho mỗi trạm (không copy dữ liệu); các tác vụ chỉ đọc nên dùng chung được"""
+    return {station: df.copy(deep=False) for station, df in datas.items()}
+
+def _observe_task(name, submitted):
+    """Ghi thời gian gửi -> xong của tác vụ ở process chính (span bên trong tiến trình con không về được đây)"""
+    return lambda future: metrics.observe('forecast_task_seconds', time.perf_counter() - submitted, task=name)
+
+def submit_forecasts(datas):
+    """Gửi 4 tác vụ dự báo, trả về {tên tác vụ: Future}"""
+    views = shared_views(datas)
+    executor = get_executor()
+    futures = {}
+    for name, task in FORECAST_TASKS.items():
+        submitted = time.perf_counter()
+        if executor is None:
+            # serial: chạy ngay trong thread hiện tại
+            futures[name] = Future()
+            try:
+                futures[name].set_result(task(views))
+            except Exception as e:
+                futures[name].set_exception(e)
+        else:
+            futures[name] = executor.submit(task, views)
+        futures[name].add_done_callback(_observe_task(name, submitted))
+    return futures
+
+def shutdown_executor():
+    """Đóng pool (khi tắt server hoặc đổi FORECAST['executor'])"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
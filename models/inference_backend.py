@@ -0,0 +1,240 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+try:
+    import fcntl
+except ImportError:
+    # Windows không có flock (và không chạy nhiều worker backtest cùng export): bỏ qua khóa
+    fcntl = None
+from config.server_config import INFERENCE
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('keras', 'tflite', 'onnx')
+
+
+class KerasBackend:
+    """Gọi trực tiếp model Keras qua tf.function đã trace sẵn (bỏ vòng lặp model.predict)"""
+    name = 'keras'
+
+    def __init__(self, model):
+        import tensorflow as tf
+        self.model = model
+        self.input_shape = tuple(model.input_shape[1:])
+        spec = tf.TensorSpec((None,) + self.input_shape, tf.float32)
+        self._call = tf.function(lambda x: model(x, training=False), input_signature=[spec])
+
+    def predict(self, X):
+        return self._call(np.asarray(X, dtype=np.float32)).numpy()
+
+
+def _tflite_interpreter(path):
+    """Ưu tiên runtime nhẹ (ai_edge_litert / tflite_runtime), không có thì dùng tf.lite"""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter(model_path=path)
+
+
+class TFLiteBackend:
+    """Chạy file .tflite đã export (batch cố định 1, gọi invoke cho từng mẫu)
+
+    Có thêm bản export batch cố định B (batched_path) thì các khối đủ B mẫu chạy một invoke;
+    XNNPACK không cho đổi batch của input sau khi export nên phần lẻ vẫn chạy từng mẫu.
+    """
+
+    def __init__(self, path, quantized=False, batched_path=None):
+        self.name = 'tflite-int8' if quantized else 'tflite'
+        self.path = path
+        self.interpreter, self.input, self.output = self._open(path)
+        self.input_shape = tuple(self.input['shape'][1:])
+        self.batched = self._open(batched_path) if batched_path else None
+        self.batch = int(self.batched[1]['shape'][0]) if self.batched else 1
+        # Interpreter không an toàn khi nhiều thread gọi cùng lúc
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _open(path):
+        interpreter = _tflite_interpreter(path)
+        interpreter.allocate_tensors()
+        return interpreter, interpreter.get_input_details()[0], interpreter.get_output_details()[0]
+
+    @staticmethod
+    def export(model, path, quantize=False, batch=1):
+        """Đóng băng trọng số và export với input tĩnh (batch, T, F) -- LSTM cần shape tĩnh để chuyển sang TFLite"""
+        import tensorflow as tf
+        from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
+
+        spec = tf.TensorSpec((batch,) + tuple(model.input_shape[1:]), tf.float32)
+        fn = tf.function(lambda x: model(x, training=False))
+        frozen = convert_variables_to_constants_v2(fn.get_concrete_function(spec))
+        converter = tf.lite.TFLiteConverter.from_concrete_functions([frozen])
+        if quantize:
+            # Lượng tử hóa dynamic-range: trọng số int8, tính toán float
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        content = converter.convert()
+
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        full = len(X) - len(X) % self.batch if self.batched else 0
+        outputs = []
+        with self.lock:
+            if full:
+                interpreter, input, output = self.batched
+                for start in range(0, full, self.batch):
+                    interpreter.set_tensor(input['index'], X[start:start + self.batch])
+                    interpreter.invoke()
+                    outputs.extend(interpreter.get_tensor(output['index']))
+            for sample in X[full:]:
+                self.interpreter.set_tensor(self.input['index'], sample[None])
+                self.interpreter.invoke()
+                outputs.append(self.interpreter.get_tensor(self.output['index'])[0])
+        return np.stack(outputs)
+
+
+class OnnxBackend:
+    """ONNX Runtime trên CPU (cần cài tf2onnx và onnxruntime)"""
+    name = 'onnx'
+
+    def __init__(self, path):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.path = path
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.input_shape = tuple(self.session.get_inputs()[0].shape[1:])
+
+    @staticmethod
+    def export(model, path):
+        import tensorflow as tf
+        import tf2onnx
+        spec = (tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name='input'),)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        tf2onnx.convert.from_keras(model, input_signature=spec, output_path=tmp)
+        os.replace(tmp, path)
+
+    def predict(self, X):
+        return self.session.run(None, {self.input_name: np.asarray(X, dtype=np.float32)})[0]
+
+
+def export_path(model_path, backend, quantize=False, export_dir=None, batch=1):
+    """data/models/temp-humidity/best_model.keras -> <exportDir>/best_model[.b16][.int8].tflite"""
+    export_dir = export_dir or INFERENCE['exportDir']
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    if batch > 1:
+        stem += f'.b{batch}'
+    suffix = {'tflite': '.int8.tflite' if quantize else '.tflite', 'onnx': '.onnx'}[backend]
+    return os.path.join(export_dir, stem + suffix)
+
+
+def check_tolerance(reference, candidate, tolerance, samples=64, seed=0):
+    """Sai số tuyệt đối lớn nhất giữa hai backend trên input ngẫu nhiên (đã chuẩn hóa ~ N(0, 1))"""
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((samples,) + tuple(reference.input_shape)).astype(np.float32)
+    error = float(np.max(np.abs(reference.predict(X) - candidate.predict(X))))
+    if error > tolerance:
+        raise ValueError(f"{candidate.name} lệch {error:.2e} so với Keras (ngưỡng {tolerance:.0e})")
+    return error
+
+
+@contextmanager
+def _export_lock(path, exclusive):
+    """flock trên <path>.lock giữa các process (worker backtest) cùng dùng một file export
+
+    Đọc file đã export giữ khóa chia sẻ; export / kiểm tra / xóa bản lỗi giữ khóa độc quyền,
+    nên không process nào mở file trong lúc process khác đang ghi đè hay xóa nó.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(path + '.lock', 'a+') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _open_exported(backend, path, quantize, batched_path=None):
+    if backend == 'tflite':
+        return TFLiteBackend(path, quantized=quantize, batched_path=batched_path)
+    return OnnxBackend(path)
+
+
+def _load_keras(model_path):
+    from tensorflow.keras.models import load_model
+    return load_model(model_path)
+
+
+def load_backend(model_path, backend=None, quantize=None, export_dir=None):
+    """Trả về đối tượng có .predict(X) cho model Keras tại model_path
+
+    - 'keras': tf.function trên model gốc
+    - 'tflite' / 'onnx': export một lần (kiểm tra sai số với Keras trước khi lưu),
+      các lần sau đọc thẳng file đã export nếu mới hơn file .keras
+    Lỗi export hoặc vượt ngưỡng sai số thì quay về 'keras'.
+    """
+    backend = backend or INFERENCE['backend']
+    quantize = INFERENCE['quantize'] if quantize is None else quantize
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend không hỗ trợ: {backend} (chọn {', '.join(BACKENDS)})")
+
+    if backend == 'keras':
+        return KerasBackend(_load_keras(model_path))
+
+    quantize = quantize and backend == 'tflite'
+    path = export_path(model_path, backend, quantize, export_dir)
+    batch = INFERENCE['tfliteBatch'] if backend == 'tflite' else 1
+    batched_path = export_path(model_path, backend, quantize, export_dir, batch) if batch > 1 else None
+    try:
+        paths = [p for p in (path, batched_path) if p]
+
+        def exported():
+            return all(os.path.exists(p) and os.path.getmtime(p) >= os.path.getmtime(model_path) for p in paths)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with _export_lock(path, exclusive=False):
+            if exported():
+                return _open_exported(backend, path, quantize, batched_path)
+
+        with _export_lock(path, exclusive=True):
+            # Process khác có thể vừa export xong trong lúc chờ khóa
+            if exported():
+                return _open_exported(backend, path, quantize, batched_path)
+
+            reference = KerasBackend(_load_keras(model_path))
+            if backend == 'tflite':
+                TFLiteBackend.export(reference.model, path, quantize=quantize)
+                if batched_path:
+                    TFLiteBackend.export(reference.model, batched_path, quantize=quantize, batch=batch)
+            else:
+                OnnxBackend.export(reference.model, path)
+
+            candidate = _open_exported(backend, path, quantize, batched_path)
+            tolerance = INFERENCE['quantizedTolerance'] if quantize and backend == 'tflite' else INFERENCE['tolerance']
+            try:
+                # Số mẫu lẻ: vừa có khối batch B vừa có mẫu chạy bản batch 1
+                error = check_tolerance(reference, candidate, tolerance, samples=65)
+            except ValueError:
+                # Đang giữ khóa độc quyền nên không process nào đang mở các file này
+                for p in paths:
+                    os.remove(p)
+                raise
+        print(f"Đã export {model_path} -> {path} (lệch tối đa {error:.2e})")
+        return candidate
+    except Exception as e:
+        logger.error(f"Không dùng được backend {backend} cho {model_path}, quay về keras: {e}")
+        return KerasBackend(_load_keras(model_path))
@@ -0,0 +1,237 @@
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from config.server_config import INFERENCE, INFERENCE_WORKER
+from services.metricsServices import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# ===== PHÍA TIẾN TRÌNH SUY LUẬN =====
+def load_worker_models(inference=None):
+    """{tên: hàm X -> mảng} và {tên: tên backend}; chạy trong tiến trình suy luận
+
+    inference: INFERENCE của process chính (spawn đọc lại file cấu hình, không thấy thay đổi lúc chạy)
+    """
+    # Trong worker get_temp_model/get_predictor phải load model thật, không gửi tiếp sang worker
+    INFERENCE_WORKER['enabled'] = False
+    INFERENCE.update(inference or {})
+    from models.rain_model import get_predictor
+    from models.temp_humidity_model import HORIZONS, get_temp_model
+
+    calls, names = {}, {}
+    for horizon in HORIZONS:
+        model = get_temp_model(horizon)
+        calls[f'temp_{horizon}'] = model.predict
+        names[f'temp_{horizon}'] = getattr(model, 'name', '')
+    calls['rain'] = get_predictor().model.predict_proba
+    names['rain'] = ''
+    return calls, names
+
+
+def collect_batch(requests, first, max_rows, max_wait):
+    """Gom thêm request tới khi đủ max_rows dòng hoặc hết max_wait giây kể từ request đầu
+
+    Trả về (các request, có gặp tín hiệu dừng không)
+    """
+    batch, rows = [first], len(first[2])
+    deadline = time.perf_counter() + max_wait
+    while rows < max_rows:
+        timeout = deadline - time.perf_counter()
+        try:
+            item = requests.get(timeout=timeout) if timeout > 0 else requests.get_nowait()
+        except queue.Empty:
+            break
+        if item is None:
+            return batch, True
+        batch.append(item)
+        rows += len(item[2])
+    return batch, False
+
+
+def run_batch(calls, batch, responses):
+    """Mỗi model một lần gọi trên các request đã gom, tách kết quả trả về theo request"""
+    by_model = {}
+    for request in batch:
+        by_model.setdefault(request[1], []).append(request)
+    for name, requests in by_model.items():
+        try:
+            output = calls[name](np.concatenate([X for _, _, X in requests]))
+        except Exception as e:
+            for request_id, _, _ in requests:
+                responses.put(('error', request_id, f"{type(e).__name__}: {e}"))
+            continue
+        responses.put(('batch', name, len(requests)))
+        offset = 0
+        for request_id, _, X in requests:
+            responses.put(('result', request_id, output[offset:offset + len(X)]))
+            offset += len(X)
+
+
+def worker_main(requests, responses, max_rows, max_wait, inference=None):
+    """Vòng lặp của tiến trình suy luận: (id, tên model, X) -> ('result' | 'error', id, ...)"""
+    try:
+        calls, names = load_worker_models(inference)
+    except Exception as e:
+        responses.put(('ready', None, f"{type(e).__name__}: {e}"))
+        return
+    responses.put(('ready', None, names))
+    stop = False
+    while not stop:
+        first = requests.get()
+        if first is None:
+            break
+        batch, stop = collect_batch(requests, first, max_rows, max_wait)
+        run_batch(calls, batch, responses)
+
+
+# ===== PHÍA PROCESS CHÍNH =====
+class InferenceWorker:
+    """Client của tiến trình suy luận: predict(tên, X) gửi qua hàng đợi và chờ kết quả
+
+    Một thread nhận kết quả và trả cho Future tương ứng, nên nhiều thread gọi cùng lúc được
+    (các request đó được worker gom thành một batch). Worker chết thì các request đang chờ
+    báo lỗi và lần gọi sau khởi động worker mới.
+    """
+
+    def __init__(self, max_batch=None, max_wait_ms=None):
+        self.max_batch = max_batch or INFERENCE_WORKER['maxBatch']
+        self.max_wait = (INFERENCE_WORKER['maxWaitMs'] if max_wait_ms is None else max_wait_ms) / 1000
+        self.context = multiprocessing.get_context('spawn')
+        self.lock = threading.Lock()
+        self.process = None
+        self.pending = {}
+        self.names = {}
+        self.ids = itertools.count()
+        self.stats = {'requests': 0, 'batches': 0, 'restarts': 0}
+
+    def start(self):
+        with self.lock:
+            if self.process is not None and self.process.is_alive():
+                return self
+            if self.process is not None:
+                self.stats['restarts'] += 1
+                metrics.inc('inference_worker_restarts_total')
+                logger.warning("Tiến trình suy luận đã dừng, khởi động lại")
+                pending, self.pending = self.pending, {}
+                for future in pending.values():
+                    future.set_exception(RuntimeError("Tiến trình suy luận đã dừng"))
+            # spawn: TensorFlow không an toàn khi fork
+            self.requests, self.responses = self.context.Queue(), self.context.Queue()
+            self.process = self.context.Process(target=worker_main, daemon=True, name='inference-worker',
+                                                args=(self.requests, self.responses, self.max_batch,
+                                                      self.max_wait, dict(INFERENCE)))
+            self.process.start()
+            names = self._wait_ready()
+            if isinstance(names, str):
+                raise RuntimeError(f"Tiến trình suy luận không load được model: {names}")
+            self.names = names
+            threading.Thread(target=self._receive, args=(self.process, self.responses), daemon=True,
+                             name='inference-results').start()
+            logger.info(f"Tiến trình suy luận pid {self.process.pid} đã sẵn sàng: {', '.join(names)}")
+        return self
+
+    def _wait_ready(self):
+        """Chờ worker load xong model; worker chết giữa chừng thì báo lỗi ngay, không chờ hết hạn"""
+        deadline = time.monotonic() + INFERENCE_WORKER['startTimeoutSeconds']
+        while time.monotonic() < deadline:
+            try:
+                return self.responses.get(timeout=0.5)[2]
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError(f"Tiến trình suy luận dừng khi khởi động (exit {self.process.exitcode})") from None
+        self.process.terminate()
+        raise RuntimeError("Tiến trình suy luận không sẵn sàng kịp")
+
+    def _receive(self, process, responses):
+        while True:
+            try:
+                kind, key, value = responses.get(timeout=1)
+            except queue.Empty:
+                if process.is_alive():
+                    continue
+                with self.lock:
+                    # Đã có worker mới thì các request đang chờ thuộc về worker đó
+                    pending, self.pending = (self.pending, {}) if self.process is process else ({}, self.pending)
+                for future in pending.values():
+                    future.set_exception(RuntimeError(f"Tiến trình suy luận đã dừng (exit {process.exitcode})"))
+                return
+            except (EOFError, OSError):
+                return
+            if kind == 'batch':
+                self.stats['batches'] += 1
+                metrics.inc('inference_worker_batches_total', model=key)
+                continue
+            with self.lock:
+                future = self.pending.pop(key, None)
+            if future is None:
+                continue
+            if kind == 'result':
+                future.set_result(value)
+            else:
+                future.set_exception(RuntimeError(value))
+
+    def predict(self, name, X):
+        self.start()
+        request_id, future = next(self.ids), Future()
+        with self.lock:
+            self.pending[request_id] = future
+            self.stats['requests'] += 1
+        metrics.inc('inference_worker_requests_total', model=name)
+        self.requests.put((request_id, name, np.asarray(X)))
+        try:
+            return future.result(timeout=INFERENCE_WORKER['timeoutSeconds'])
+        finally:
+            with self.lock:
+                self.pending.pop(request_id, None)
+
+    def stop(self):
+        with self.lock:
+            process, self.process = self.process, None
+        if process is not None and process.is_alive():
+            self.requests.put(None)
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+
+
+class RemoteModel:
+    """Đứng thay model trong process chính: predict / predict_proba chạy trong tiến trình suy luận"""
+
+    def __init__(self, worker, model_name):
+        self.worker = worker
+        self.model_name = model_name
+        # Cùng tên backend với model thật để khóa forecast_memo không đổi khi bật/tắt worker
+        self.name = worker.names.get(model_name, '')
+
+    def predict(self, X):
+        return self.worker.predict(self.model_name, X)
+
+    predict_proba = predict
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+def get_inference_worker():
+    """Tiến trình suy luận dùng chung, khởi động khi cần lần đầu"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = InferenceWorker()
+    return _worker.start()
+
+def remote_model(name):
+    return RemoteModel(get_inference_worker(), name)
+
+def shutdown_inference_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is not None:
+            _worker.stop()
+            _worker = None
@@ -0,0 +1,359 @@
+from collections import deque
+import threading
+import numpy as np
+import pandas as pd
+
+# Các cột thô mà WeatherPredictor.get_firebase_data giữ lại
+RAW_COLUMNS = ['QV2M', 'PRECTOTCORR', 'PS', 'T2M', 'ALLSKY_SFC_PAR_TOT']
+CORE_COLUMNS = ['T2M', 'QV2M', 'PS']   # các cột có lag/diff/rolling
+
+LOOKBACK = 24       # shift/diff/rolling dài nhất trong create_features
+WINDOW = 72         # get_firebase_data chỉ lấy 72h gần nhất
+KEEP = 12           # predict_7days dùng tới iloc[-12]
+RESYNC_EVERY = 168  # tính lại thống kê trượt từ buffer để tránh sai số cộng dồn
+ROLLING = [('mean', 6), ('mean', 24), ('std', 6)]
+
+
+class _RollingStat:
+    """Trung bình / độ lệch chuẩn trượt cập nhật O(1)
+
+    Cộng dồn x - ref và (x - ref)^2 với ref gần giá trị trung bình (PS ~ 1e5)
+    để tránh mất độ chính xác khi trừ hai số lớn.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.reset()
+
+    def reset(self, ref=None):
+        self.n = 0
+        self.s1 = 0.0
+        self.s2 = 0.0
+        self.ref = ref
+        self.nan_count = 0
+
+    def add(self, x):
+        if np.isnan(x):
+            self.nan_count += 1
+            return
+        if self.ref is None:
+            self.ref = x
+        d = x - self.ref
+        self.n += 1
+        self.s1 += d
+        self.s2 += d * d
+
+    def remove(self, x):
+        if np.isnan(x):
+            self.nan_count -= 1
+            return
+        self.n -= 1
+        if self.n == 0:
+            self.reset()
+            return
+        d = x - self.ref
+        self.s1 -= d
+        self.s2 -= d * d
+
+    def value(self, kind):
+        # Giống pandas rolling(min_periods=size): chỉ có giá trị khi đủ `size` điểm không NaN
+        if self.n < self.size or self.nan_count:
+            return np.nan
+        if kind == 'mean':
+            return self.ref + self.s1 / self.n
+        return np.sqrt(max(self.s2 - self.s1 * self.s1 / self.n, 0.0) / (self.n - 1))
+
+
+def _feature_builders():
+    """Tên đặc trưng -> hàm tính giá trị tại dòng hiện tại, giống hệt create_features
+
+    Chỉ dùng phép toán chạy được cả trên số lẫn mảng numpy (& thay and, * 1 thay int):
+    cùng các hàm này tính cho một trạm (RainFeatureEngine) hoặc N cửa sổ một lúc (window_rows)
+    """
+    b = {}
+
+    # ===== ĐẶC TRƯNG THỜI GIAN =====
+    b['hour_sin'] = lambda e, ts: np.sin(2 * np.pi * ts.hour / 24)
+    b['hour_cos'] = lambda e, ts: np.cos(2 * np.pi * ts.hour / 24)
+    b['month_sin'] = lambda e, ts: np.sin(2 * np.pi * ts.month / 12)
+    b['month_cos'] = lambda e, ts: np.cos(2 * np.pi * ts.month / 12)
+    b['is_monsoon'] = lambda e, ts: ((ts.month >= 9) & (ts.month <= 12)) * 1
+    b['is_typhoon_season'] = lambda e, ts: ((ts.month >= 6) & (ts.month <= 11)) * 1
+
+    # ===== ĐẶC TRƯNG ĐỘ ẨM VÀ ÁP SUẤT =====
+    for lag in [1, 3, 6, 12, 24]:
+        b[f'high_humidity_{lag}h'] = lambda e, ts, lag=lag: (e.x('QV2M', lag) > 85) * 1
+        b[f'pressure_drop_{lag}h'] = lambda e, ts, lag=lag: (e.diff('PS', lag) < -0.5) * 1
+        b[f'pressure_{lag}h'] = lambda e, ts, lag=lag: e.diff('PS', lag)
+
+    # ===== ĐẶC TRƯNG NHIỆT ĐỘ VÀ ĐỘ ẨM =====
+    for lag in [1, 3, 6, 12]:
+        b[f'temp_{lag}h'] = lambda e, ts, lag=lag: e.diff('T2M', lag)
+        b[f'humidity_{lag}h'] = lambda e, ts, lag=lag: e.diff('QV2M', lag)
+
+    # ===== CHỈ SỐ KHÍ QUYỂN =====
+    b['dew_point'] = lambda e, ts: e.dew_point()
+    b['temp_dew_diff'] = lambda e, ts: e.x('T2M') - e.dew_point()
+    b['is_daytime'] = lambda e, ts: (e.x('ALLSKY_SFC_PAR_TOT') > 10) * 1
+    b['rain_conditions'] = lambda e, ts: (
+        (e.x('QV2M') > 80) & (e.x('T2M') - e.dew_point() < 3) & (e.diff('PS', 6) < -0.3)) * 1
+
+    # ===== THỐNG KÊ TRƯỢT VÀ ĐẶC TRƯNG TRỄ =====
+    for param in CORE_COLUMNS:
+        for kind, size in ROLLING:
+            b[f'{param}_{kind}_{size}h'] = lambda e, ts, key=(param, kind, size): e.rolling(*key)
+        for lag in [12, 24]:
+            b[f'{param}_lag_{lag}h'] = lambda e, ts, param=param, lag=lag: e.x(param, lag)
+
+    # ===== ĐẶC TRƯNG TƯƠNG TÁC =====
+    b['temp_humidity_interaction'] = lambda e, ts: e.x('T2M') * e.x('QV2M')
+    b['pressure_temp_interaction'] = lambda e, ts: e.x('PS') * e.x('T2M')
+
+    # Cột thô vẫn nằm trong DataFrame sau create_features
+    for col in RAW_COLUMNS:
+        b[col] = lambda e, ts, col=col: e.x(col)
+    return b
+
+FEATURE_BUILDERS = _feature_builders()
+
+
+class RainFeatureEngine:
+    """Tính tăng dần các đặc trưng của create_features, chỉ cho các cột trong selected_features
+
+    Trạng thái là ring buffer LOOKBACK + KEEP + 1 dòng thô và thống kê trượt O(1),
+    nên mỗi giờ mới chỉ tốn O(số đặc trưng). Đầu ra là KEEP dòng hợp lệ cuối cùng,
+    tương đương create_features(tail(72)).dropna().iloc[-KEEP:].
+    """
+
+    def __init__(self, selected_features, window=WINDOW, keep=KEEP):
+        self.features = list(selected_features)
+        # Đặc trưng không có trong create_features -> 0 (giống latest.get(col, 0))
+        self.builders = [FEATURE_BUILDERS.get(col, lambda e, ts: 0) for col in self.features]
+        self.window = window
+        self.keep = keep
+        self.size = LOOKBACK + keep + 1
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.values = np.full((self.size, len(RAW_COLUMNS)), np.nan)
+        self.times = [None] * self.size
+        self.seq = -1                   # số thứ tự dòng mới nhất
+        self.last_core_nan = -1         # dòng gần nhất có NaN ở T2M/QV2M/PS
+        self.stats = {(param, kind, size): _RollingStat(size)
+                      for param in CORE_COLUMNS for kind, size in ROLLING}
+        self.rows = deque(maxlen=self.keep)  # (seq, thời gian, vector đặc trưng)
+
+    # ===== TRUY CẬP BUFFER =====
+    def x(self, col, lag=0):
+        if lag > self.seq:
+            return np.nan
+        return self.values[(self.seq - lag) % self.size, RAW_COLUMNS.index(col)]
+
+    def diff(self, col, lag):
+        return self.x(col) - self.x(col, lag)
+
+    def dew_point(self):
+        return self.x('T2M') - ((100 - self.x('QV2M')) / 5)
+
+    def rolling(self, param, kind, size):
+        return self.stats[(param, kind, size)].value(kind)
+
+    # ===== CẬP NHẬT =====
+    def push(self, ts, raw):
+        """Thêm một giờ mới (raw theo thứ tự RAW_COLUMNS)"""
+        self.seq += 1
+        slot = self.seq % self.size
+        self.values[slot] = raw
+        self.times[slot] = ts.to_datetime64()
+
+        for (param, kind, size), stat in self.stats.items():
+            j = RAW_COLUMNS.index(param)
+            stat.add(raw[j])
+            if self.seq >= size:
+                stat.remove(self.values[(self.seq - size) % self.size, j])
+        if self.seq and self.seq % RESYNC_EVERY == 0:
+            self._resync_stats()
+
+        core = [RAW_COLUMNS.index(c) for c in CORE_COLUMNS]
+        if np.isnan(raw[core]).any():
+            self.last_core_nan = self.seq
+
+        # dropna: cần đủ LOOKBACK dòng trước đó không NaN và hai cột còn lại không NaN
+        valid = (
+            self.seq >= LOOKBACK
+            and self.last_core_nan < self.seq - LOOKBACK
+            and not np.isnan(raw[RAW_COLUMNS.index('PRECTOTCORR')])
+            and not np.isnan(raw[RAW_COLUMNS.index('ALLSKY_SFC_PAR_TOT')])
+        )
+        if valid:
+            vector = np.array([build(self, ts) for build in self.builders], dtype=float)
+            self.rows.append((self.seq, ts, vector))
+
+    def _resync_stats(self):
+        for (param, kind, size), stat in self.stats.items():
+            j = RAW_COLUMNS.index(param)
+            stat.reset()
+            for lag in range(min(size, self.seq + 1) - 1, -1, -1):
+                stat.add(self.values[(self.seq - lag) % self.size, j])
+
+    def pop(self):
+        """Bỏ dòng mới nhất (khi giờ hiện tại nhận thêm dữ liệu), tối đa KEEP dòng"""
+        slot = self.seq % self.size
+        raw = self.values[slot].copy()
+        for (param, kind, size), stat in self.stats.items():
+            j = RAW_COLUMNS.index(param)
+            stat.remove(raw[j])
+            if self.seq >= size:
+                stat.add(self.values[(self.seq - size) % self.size, j])
+        while self.rows and self.rows[-1][0] >= self.seq:
+            self.rows.pop()
+        self.values[slot] = np.nan
+        self.times[slot] = None
+        self.seq -= 1
+
+        # Dòng NaN chỉ còn ảnh hưởng trong LOOKBACK dòng cuối, tất cả vẫn nằm trong buffer
+        core = [RAW_COLUMNS.index(c) for c in CORE_COLUMNS]
+        self.last_core_nan = -1
+        for back in range(min(LOOKBACK + 1, self.seq + 1)):
+            if np.isnan(self.values[(self.seq - back) % self.size, core]).any():
+                self.last_core_nan = self.seq - back
+                break
+
+    def _rewind_point(self, times, values):
+        """(vị trí dòng cuối đã push trong cửa sổ mới, số dòng cần pop) hoặc None nếu phải tính lại"""
+        if self.seq < 0:
+            return None
+        matches = np.flatnonzero(times == self.times[self.seq % self.size])
+        if not len(matches):
+            return None
+        pos = int(matches[-1])
+
+        changed = 0
+        for back in range(min(self.size, pos + 1, self.seq + 1)):
+            slot = (self.seq - back) % self.size
+            if times[pos - back] != self.times[slot]:
+                return None
+            if not np.array_equal(values[pos - back], self.values[slot], equal_nan=True):
+                changed = back + 1
+        if changed > self.keep:
+            return None
+        return pos, changed
+
+    def update(self, recent_data):
+        """Đồng bộ với cửa sổ dữ liệu (index thời gian, có RAW_COLUMNS) và trả về KEEP dòng cuối"""
+        with self.lock:
+            times = recent_data.index.values
+            values = recent_data[RAW_COLUMNS].to_numpy(dtype=float)
+
+            point = self._rewind_point(times, values)
+            if point is None:
+                # Lần chạy đầu hoặc lịch sử cũ thay đổi: phát lại toàn bộ cửa sổ
+                self.reset()
+                start = 0
+            else:
+                # Chỉ các giờ cuối thay đổi (giờ hiện tại nhận thêm số đo): pop rồi push lại
+                pos, changed = point
+                for _ in range(changed):
+                    self.pop()
+                start = pos + 1 - changed
+            for i in range(start, len(values)):
+                self.push(recent_data.index[i], values[i])
+
+            # Chỉ giữ các dòng có đủ LOOKBACK dòng nằm trong cửa sổ (như khi tính trên tail(72))
+            first_valid = self.seq - min(self.window, len(values)) + 1 + LOOKBACK
+            return [(ts, vector) for seq, ts, vector in self.rows if seq >= first_valid]
+
+
+class _WindowRow:
+    """Cùng giao diện x/diff/dew_point/rolling với RainFeatureEngine nhưng cho dòng r của N cửa sổ"""
+
+    def __init__(self, values, r):
+        self.values = values
+        self.r = r
+
+    def x(self, col, lag=0):
+        if lag > self.r:
+            return np.full(len(self.values), np.nan)
+        return self.values[:, self.r - lag, RAW_COLUMNS.index(col)]
+
+    def diff(self, col, lag):
+        return self.x(col) - self.x(col, lag)
+
+    def dew_point(self):
+        return self.x('T2M') - ((100 - self.x('QV2M')) / 5)
+
+    def rolling(self, param, kind, size):
+        if size > self.r + 1:
+            return np.full(len(self.values), np.nan)
+        block = self.values[:, self.r - size + 1:self.r + 1, RAW_COLUMNS.index(param)]
+        return block.mean(axis=1) if kind == 'mean' else block.std(axis=1, ddof=1)
+
+
+def window_rows(selected_features, times, values, keep=KEEP):
+    """Đặc trưng của N cửa sổ cùng số giờ trong một lượt, không có trạng thái tăng dần để dùng lại
+
+    times (N, L) datetime64, values (N, L, RAW_COLUMNS) không NaN -> mỗi cửa sổ một danh sách
+    [(thời gian, vector)] như RainFeatureEngine(selected_features).update trên cửa sổ đó.
+    Mỗi phép tính chạy trên cả N cửa sổ nên chi phí Python không tăng theo N.
+    """
+    if np.isnan(values).any():
+        raise ValueError("window_rows không nhận cửa sổ có NaN")
+    builders = [FEATURE_BUILDERS.get(col, lambda e, ts: 0) for col in selected_features]
+    positions = range(max(LOOKBACK, times.shape[1] - keep), times.shape[1])
+    out = np.empty((len(times), len(positions), len(builders)))
+    for k, r in enumerate(positions):
+        row, ts = _WindowRow(values, r), pd.DatetimeIndex(times[:, r])
+        for j, build in enumerate(builders):
+            out[:, k, j] = build(row, ts)
+    stamps = [pd.DatetimeIndex(times[:, r]) for r in positions]
+    return [[(stamps[k][i], out[i, k]) for k in range(len(positions))] for i in range(len(times))]
+
+
+class _SeriesRows:
+    """Cùng giao diện x/diff/dew_point/rolling nhưng trả về giá trị tại mọi giờ của một chuỗi liên tục"""
+
+    def __init__(self, values):
+        self.values = values
+
+    def x(self, col, lag=0):
+        column = self.values[:, RAW_COLUMNS.index(col)]
+        if lag == 0:
+            return column
+        return np.concatenate([np.full(min(lag, len(column)), np.nan), column[:-lag]])
+
+    def diff(self, col, lag):
+        return self.x(col) - self.x(col, lag)
+
+    def dew_point(self):
+        return self.x('T2M') - ((100 - self.x('QV2M')) / 5)
+
+    def rolling(self, param, kind, size):
+        column = self.values[:, RAW_COLUMNS.index(param)]
+        out = np.full(len(column), np.nan)
+        if len(column) >= size:
+            # NaN trong cửa sổ -> NaN, giống pandas rolling(min_periods=size)
+            view = np.lib.stride_tricks.sliding_window_view(column, size)
+            out[size - 1:] = view.mean(axis=1) if kind == 'mean' else view.std(axis=1, ddof=1)
+        return out
+
+
+def series_features(selected_features, times, values):
+    """Đặc trưng tại mọi giờ của chuỗi liên tục (times (T,) datetime64, values (T, RAW_COLUMNS))
+
+    Trả về (ma trận (T, F), mặt nạ hợp lệ (T,)). Đặc trưng của một giờ chỉ phụ thuộc LOOKBACK giờ
+    trước đó, nên dòng hợp lệ ở đây trùng với dòng RainFeatureEngine trả về cho cửa sổ 72h chứa giờ đó
+    (dòng đó nằm ở vị trí >= LOOKBACK trong cửa sổ). Dùng cho backtest trên cả năm dữ liệu.
+    """
+    rows, ts = _SeriesRows(values), pd.DatetimeIndex(times)
+    out = np.empty((len(times), len(selected_features)))
+    for j, col in enumerate(selected_features):
+        out[:, j] = FEATURE_BUILDERS.get(col, lambda e, ts: 0)(rows, ts)
+
+    # Như dropna trong RainFeatureEngine.push: đủ LOOKBACK giờ trước không NaN ở T2M/QV2M/PS
+    core = np.isnan(values[:, [RAW_COLUMNS.index(c) for c in CORE_COLUMNS]]).any(axis=1)
+    bad = np.convolve(core, np.ones(LOOKBACK + 1), mode='full')[:len(times)] > 0
+    others = np.isnan(values[:, [RAW_COLUMNS.index('PRECTOTCORR'), RAW_COLUMNS.index('ALLSKY_SFC_PAR_TOT')]])
+    valid = ~bad & ~others.any(axis=1)
+    valid[:LOOKBACK] = False
+    return out, valid
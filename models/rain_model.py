@@ -2,13 +2,47 @@ import pandas as pd
 import numpy as np
 import pickle
 import joblib
+import threading
 from datetime import datetime, timedelta
 import warnings
 from services.loadDataFirebaseServices import get_weather_data
+from models.rain_features import RAW_COLUMNS, RainFeatureEngine, WINDOW, window_rows
+from services.stationServices import check_station
+from services.hourlyAggregationServices import hourly_index
+from models.forecast_memo import forecast_memo, model_id, window_key
+from config.server_config import INFERENCE_WORKER, MEMO, RAIN_7D
+from services.metricsServices import metrics
 warnings.filterwarnings('ignore')
 
+DEFAULT_MODEL_PATH = 'data/models/rain/rain_model.pkl'
+
+# Các đặc trưng thay đổi theo giờ dự báo (không lấy từ dữ liệu nền)
+TIME_FEATURES = ['hour_sin', 'hour_cos', 'month_sin', 'month_cos',
+                 'is_monsoon', 'is_typhoon_season', 'is_daytime']
+
+def time_features(times):
+    """Đặc trưng thời gian cho một DatetimeIndex các giờ dự báo"""
+    hours = np.asarray(times.hour)
+    months = np.asarray(times.month)
+    return {
+        'hour_sin': np.sin(2 * np.pi * hours / 24),
+        'hour_cos': np.cos(2 * np.pi * hours / 24),
+        'month_sin': np.sin(2 * np.pi * months / 12),
+        'month_cos': np.cos(2 * np.pi * months / 12),
+        'is_monsoon': ((months >= 9) & (months <= 12)).astype(int),
+        'is_typhoon_season': ((months >= 6) & (months <= 11)).astype(int),
+        'is_daytime': ((hours >= 6) & (hours <= 18)).astype(int),
+    }
+
+def memo_settings(horizon):
+    """Cấu hình ảnh hưởng tới kết quả của horizon, đưa vào khóa forecast_memo (đổi cấu hình -> không dùng kết quả cũ)"""
+    if horizon != '7d':
+        return ()
+    return (RAIN_7D['members'], RAIN_7D['noise'], RAIN_7D['farHours'], RAIN_7D['seed'],
+            tuple(RAIN_7D['percentiles']))
+
 class WeatherPredictor:
-    def __init__(self, model_path='data/models/rain/rain_model.pkl'):
+    def __init__(self, model_path=DEFAULT_MODEL_PATH):
         # Load model with joblib (for new optimized models)
         try:
             data = joblib.load(model_path)
@@ -26,6 +60,12 @@ class WeatherPredictor:
         self.scaler = data.get('scaler', None)
         self.selector = data.get('selector', None)
         self.feature_cols = data.get('feature_cols', self.selected_features)
+
+        self.model_id = model_id(model_path)
+
+        # Bộ tính đặc trưng tăng dần cho từng trạm, chỉ cho các cột model dùng
+        self.feature_engines = {}
+        self.engines_lock = threading.Lock()
     
     def create_features(self, df):
         """Tạo đặc trưng - BỘ ĐẶC TRƯNG ĐẦY ĐỦ cho model mới"""
@@ -93,55 +133,129 @@ class WeatherPredictor:
         return df
     
     def get_firebase_data(self,dulieu):
-        df = dulieu 
-        # Tạo datetime index
-        df['datetime'] = pd.to_datetime(
-            df['YEAR'].astype(str) + '-' + 
-            df['MO'].astype(str).str.zfill(2) + '-' + 
-            df['DY'].astype(str).str.zfill(2) + ' ' + 
-            df['HR'].astype(str).str.zfill(2) + ':00:00'
-        )
-        df.set_index('datetime', inplace=True)
-        
-        # Lấy 72h gần nhất
-        recent_data = df.tail(72)[['QV2M', 'PRECTOTCORR', 'PS', 'T2M', 'ALLSKY_SFC_PAR_TOT']]
+        # Lấy 72h gần nhất với datetime index; chỉ đọc, không sửa DataFrame dùng chung
+        tail = dulieu.iloc[-72:]
+        recent_data = tail[['QV2M', 'PRECTOTCORR', 'PS', 'T2M', 'ALLSKY_SFC_PAR_TOT']].set_axis(
+            pd.DatetimeIndex(hourly_index(tail), name='datetime'))
         return recent_data
     
-    def predict_24h(self,dulieu):
-        # Lấy dữ liệu
-        recent_data = self.get_firebase_data(dulieu)
-        df = self.create_features(recent_data)
-        df.dropna(inplace=True)
-        
-        latest = df.iloc[-1]
-        start_time = df.index[-1] + timedelta(hours=1)
-        
+    def base_vector(self, row):
+        """Giá trị nền theo thứ tự selected_features (mặc định = 0 nếu không có)"""
+        return np.array([row.get(col, 0) for col in self.selected_features], dtype=float)
+
+    def build_input_matrix(self, base, pred_times):
+        """Ghép ma trận nền (H×F) với đặc trưng thời gian của H giờ dự báo"""
+        X = np.array(base, dtype=float)
+        feats = time_features(pred_times)
+        for j, col in enumerate(self.selected_features):
+            if col in feats:
+                X[:, j] = feats[col]
+        return X
+
+    def feature_engine(self, station=None):
+        station = check_station(station)
+        with self.engines_lock:
+            if station not in self.feature_engines:
+                self.feature_engines[station] = RainFeatureEngine(self.selected_features)
+            return self.feature_engines[station]
+
+    def latest_features(self, dulieu, station=None):
+        """Các dòng đặc trưng hợp lệ cuối cùng [(thời gian, vector theo selected_features)]
+
+        Tương đương create_features(...).dropna() nhưng chỉ tính phần thay đổi từ lần gọi trước
+        """
+        rows = self.feature_engine(station).update(self.get_firebase_data(dulieu))
+        if not rows:
+            raise ValueError("Không đủ dữ liệu để tạo đặc trưng")
+        return rows
+
+    def window_features(self, datas):
+        """{khóa: DataFrame} -> {khóa: dòng đặc trưng như latest_features hoặc exception}
+
+        Cho dữ liệu người gọi gửi lên (không phải trạm): các cửa sổ cùng số giờ được tính chung
+        một lượt bằng window_rows thay vì phát lại từng giờ qua RainFeatureEngine.
+        """
+        groups = {}
+        for key, dulieu in datas.items():
+            recent = self.get_firebase_data(dulieu)
+            groups.setdefault(len(recent), []).append((key, recent))
+        results = {}
+        for items in groups.values():
+            times = np.stack([recent.index.values for _, recent in items])
+            values = np.stack([recent[RAW_COLUMNS].to_numpy(dtype=float) for _, recent in items])
+            try:
+                rows_list = window_rows(self.selected_features, times, values)
+            except ValueError as e:
+                rows_list = [e] * len(items)
+            for (key, _), rows in zip(items, rows_list):
+                results[key] = rows or ValueError("Không đủ dữ liệu để tạo đặc trưng")
+        return results
+
+    def predict_batch(self, datas, build, finish, horizon=None, simulated=False):
+        """Ghép ma trận của nhiều trạm thành một lần predict_proba rồi tách kết quả theo trạm
+
+        build(rows) -> (giờ dự báo, ma trận H×F); finish(giờ dự báo, xác suất) -> kết quả.
+        Trạm lỗi (thiếu dữ liệu...) nhận về exception thay vì làm hỏng cả batch.
+        Kết quả được nhớ theo (model, horizon, 72h cuối, cấu hình RAIN_7D) trong forecast_memo.
+        simulated: khóa của datas không phải trạm -- đặc trưng tính chung qua window_features,
+        không đụng trạng thái tăng dần của các trạm và không dùng forecast_memo.
+        """
+        results, blocks = {}, []
+        use_memo = MEMO['enabled'] and horizon and not simulated
+        with metrics.span('features', model=f'rain_{horizon}'):
+            features = self.window_features(datas) if simulated else {}
+            for station, dulieu in datas.items():
+                key = (self.model_id, horizon, window_key(dulieu, WINDOW), memo_settings(horizon)) if use_memo else None
+                cached = forecast_memo.get(key) if key else None
+                if cached is not None:
+                    results[station] = cached
+                    continue
+                try:
+                    rows = features[station] if simulated else self.latest_features(dulieu, station)
+                    if isinstance(rows, Exception):
+                        raise rows
+                    blocks.append((station, key) + build(rows))
+                except Exception as e:
+                    results[station] = e
+        if blocks:
+            with metrics.span('inference', model=f'rain_{horizon}'):
+                probs = self.model.predict_proba(np.vstack([X for _, _, _, X in blocks]))[:, 1]
+            offset = 0
+            for station, key, pred_times, X in blocks:
+                results[station] = finish(pred_times, probs[offset:offset + len(X)])
+                offset += len(X)
+                if key:
+                    forecast_memo.put(key, results[station])
+        return results
+
+    @staticmethod
+    def _single(results, station):
+        result = results[station]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def predict_24h(self, dulieu, station=None):
+        return self._single(self.predict_24h_batch({station: dulieu}), station)
+
+    def predict_24h_batch(self, datas, simulated=False):
+        """{mã trạm: DataFrame} -> {mã trạm: dự báo 24h}, một predict_proba trên ma trận (N*24)×F"""
+        return self.predict_batch(datas, self.matrix_24h, self.format_24h, '24h', simulated)
+
+    def matrix_24h(self, rows):
+        last_time, latest = rows[-1]
+        start_time = last_time + timedelta(hours=1)
+        pred_times = pd.DatetimeIndex([start_time + timedelta(hours=h) for h in range(24)])
+
+        # ===== TẠO MA TRẬN ĐẶC TRƯNG 24×F - PHƯƠNG PHÁP TRỰC TIẾP =====
+        # Dữ liệu thời tiết gần nhất làm nền, đặc trưng thời gian thay đổi theo từng giờ
+        base = np.tile(latest, (24, 1))
+        return pred_times, self.build_input_matrix(base, pred_times)
+
+    def format_24h(self, pred_times, probs):
+        # probs: xác suất mưa (0-1) của 24 giờ
         predictions = []
-        
-        for hour in range(24):
-            pred_time = start_time + timedelta(hours=hour)
-            
-            # ===== TẠO ĐẶC TRƯNG DỰ BÁO - PHƯƠNG PHÁP TRỰC TIẾP =====
-            input_features = {}
-            
-            # Đặc trưng thời gian (thay đổi theo từng giờ dự báo)
-            input_features['hour_sin'] = np.sin(2 * np.pi * pred_time.hour / 24)              # Chu kỳ giờ
-            input_features['hour_cos'] = np.cos(2 * np.pi * pred_time.hour / 24)              # Phân biệt AM/PM
-            input_features['month_sin'] = np.sin(2 * np.pi * pred_time.month / 12)            # Chu kỳ tháng
-            input_features['month_cos'] = np.cos(2 * np.pi * pred_time.month / 12)            # Phân biệt mùa
-            input_features['is_monsoon'] = int((pred_time.month >= 9) & (pred_time.month <= 12))      # Mùa mưa
-            input_features['is_typhoon_season'] = int((pred_time.month >= 6) & (pred_time.month <= 11)) # Mùa bão
-            input_features['is_daytime'] = int(6 <= pred_time.hour <= 18)                     # Ban ngày/đêm
-            
-            # Sử dụng dữ liệu thời tiết gần nhất làm nền
-            for col in self.selected_features:
-                if col not in input_features:
-                    input_features[col] = latest.get(col, 0)  # Lấy từ dữ liệu cuối hoặc mặc định = 0
-            
-            # Dự đoán trực tiếp với các đặc trưng đã chọn - TỐI ƯU HÓA
-            input_array = np.array([input_features.get(col, 0) for col in self.selected_features]).reshape(1, -1)
-            prob = self.model.predict_proba(input_array)[0, 1]  # Xác suất mưa (0-1)
-            
+        for hour, (pred_time, prob) in enumerate(zip(pred_times, probs)):
             predictions.append({
                 'time': pred_time.strftime('%Y-%m-%d %H:%M:%S'),
                 'hour': hour + 1,
@@ -151,85 +265,97 @@ class WeatherPredictor:
         
         return predictions
     
-    def predict_7days(self,dulieu):        
-        # Lấy dữ liệu
-        recent_data = self.get_firebase_data(dulieu)
-        df = self.create_features(recent_data)
-        df.dropna(inplace=True)
-        
-        start_time = df.index[-1] + timedelta(hours=1)
-        daily_probs = {}
-        
+    def predict_7days(self, dulieu, station=None):
+        return self._single(self.predict_7days_batch({station: dulieu}), station)
+
+    def predict_7days_batch(self, datas, simulated=False):
+        """{mã trạm: DataFrame} -> {mã trạm: dự báo 7 ngày}, một predict_proba trên ma trận (N*members*168)×F"""
+        return self.predict_batch(datas, self.matrix_7days, self.format_7days, '7d', simulated)
+
+    def matrix_7days(self, rows, members=None):
+        """Ma trận (members*168)×F: `members` mẫu nhiễu xếp chồng để chấm trong một lần predict_proba"""
+        members = members or RAIN_7D['members']
+        start_time = rows[-1][0] + timedelta(hours=1)
+        pred_times = pd.date_range(start_time, periods=168, freq='h')
+        hours = np.arange(168)
+
         # Dự báo 168 giờ (7 ngày × 24 giờ/ngày)
-        for hour in range(168):
-            pred_time = start_time + timedelta(hours=hour)
-            date = pred_time.date()
-            
-            # Sử dụng dữ liệu nền khác nhau để tạo biến động tự nhiên
-            if hour < 24:
-                base_data = df.iloc[-1]   # Dữ liệu gần nhất (24h đầu)
-            elif hour < 48:
-                base_data = df.iloc[-6]   # Cách đây 6h (ngày thứ 2)
-            else:
-                base_data = df.iloc[-12]  # Cách đây 12h (các ngày sau)
-            
-            # ===== TẠO ĐẶC TRƯNG DỰ BÁO - PHƯƠNG PHÁP TRỰC TIẾP =====
-            input_features = {}
-            
-            # Đặc trưng thời gian (thay đổi theo từng giờ dự báo)
-            input_features['hour_sin'] = np.sin(2 * np.pi * pred_time.hour / 24)
-            input_features['hour_cos'] = np.cos(2 * np.pi * pred_time.hour / 24)
-            input_features['month_sin'] = np.sin(2 * np.pi * pred_time.month / 12)
-            input_features['month_cos'] = np.cos(2 * np.pi * pred_time.month / 12)
-            input_features['is_monsoon'] = int((pred_time.month >= 9) & (pred_time.month <= 12))
-            input_features['is_typhoon_season'] = int((pred_time.month >= 6) & (pred_time.month <= 11))
-            input_features['is_daytime'] = int(6 <= pred_time.hour <= 18)
-            
-            # Sử dụng dữ liệu nền với biến động nhỏ cho dự báo xa
-            for col in self.selected_features:
-                if col not in input_features:
-                    base_val = base_data.get(col, 0)
-                    # Thêm biến động nhỏ cho dự báo xa (>48h) để tránh quá cứng nhắc
-                    if hour > 48 and 'mean' in col:
-                        variation = np.random.normal(0, 0.02)  # Biến động ±2%
-                        input_features[col] = base_val * (1 + variation)
-                    else:
-                        input_features[col] = base_val
-            
-            # Dự đoán trực tiếp với các đặc trưng đã chọn - TỐI ƯU HÓA
-            input_array = np.array([input_features.get(col, 0) for col in self.selected_features]).reshape(1, -1)
-            prob = self.model.predict_proba(input_array)[0, 1] * 100  # Chuyển sang %
-            
-            if date not in daily_probs:
-                daily_probs[date] = []
-            daily_probs[date].append(prob)
-        
-        # Tổng hợp theo ngày
+        # Sử dụng dữ liệu nền khác nhau để tạo biến động tự nhiên:
+        # 24h đầu lấy dữ liệu gần nhất, ngày thứ 2 lấy cách đây 6h, các ngày sau cách đây 12h
+        base_rows = np.array([rows[i][1] for i in (-1, -6, -12)])
+        base = self.build_input_matrix(base_rows[np.select([hours < 24, hours < 48], [0, 1], default=2)],
+                                       pred_times)
+        X = np.repeat(base[None], members, axis=0)
+
+        # Thêm biến động nhỏ (±noise) cho các đặc trưng "mean" khi dự báo xa (>farHours);
+        # seed theo giờ bắt đầu nên cùng cửa sổ đầu vào luôn cho cùng kết quả
+        mean_cols = np.array([j for j, col in enumerate(self.selected_features) if 'mean' in col], dtype=int)
+        far = np.flatnonzero(hours > RAIN_7D['farHours'])
+        if len(mean_cols):
+            rng = np.random.default_rng([RAIN_7D['seed'], int(start_time.timestamp())])
+            variation = rng.normal(0, RAIN_7D['noise'], size=(members, len(far), len(mean_cols)))
+            X[:, far[:, None], mean_cols] *= 1 + variation
+
+        return pred_times, X.reshape(-1, X.shape[-1])
+
+    def format_7days(self, pred_times, probs):
+        # probs: members*168 xác suất (0-1), mẫu sau nối tiếp mẫu trước
+        members = probs.reshape(-1, len(pred_times)) * 100  # Chuyển sang %
+        hourly = members.mean(axis=0)
+
+        # Tổng hợp theo ngày: các giờ cùng ngày liền nhau nên gộp bằng reduceat theo vị trí đầu ngày
+        days = pred_times.normalize()
+        starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+        counts = np.diff(np.r_[starts, len(days)])
+        avg_probs = np.add.reduceat(hourly, starts) / counts    # Xác suất trung bình trong ngày
+        max_probs = np.maximum.reduceat(hourly, starts)         # Xác suất cao nhất trong ngày
+
+        # Phân loại thời tiết dựa trên xác suất cao nhất
+        weathers = np.select([max_probs > 70, max_probs > 40],
+                             ["🌧️ Rainy",      # Mưa chắc chắn
+                              "⛅ Cloudy"],     # Có thể mưa
+                             "☀️ Sunny")        # Nắng ráo
+
+        # Phân vị giữa các mẫu của xác suất trung bình ngày
+        percentiles = {}
+        if RAIN_7D['percentiles'] and len(members) > 1:
+            member_avgs = np.add.reduceat(members, starts, axis=1) / counts
+            for q, values in zip(RAIN_7D['percentiles'], np.percentile(member_avgs, RAIN_7D['percentiles'], axis=0)):
+                percentiles[f'probability_p{q}'] = values
+
         forecast = []
-        for date, probs in daily_probs.items():
-            avg_prob = np.mean(probs)  # Xác suất trung bình trong ngày
-            max_prob = np.max(probs)   # Xác suất cao nhất trong ngày
-            
-            # Phân loại thời tiết dựa trên xác suất cao nhất
-            if max_prob > 70:
-                weather = "🌧️ Rainy"     # Mưa chắc chắn
-            elif max_prob > 40:
-                weather = "⛅ Cloudy"    # Có thể mưa
-            else:
-                weather = "☀️ Sunny"     # Nắng ráo
-            
-            forecast.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'probability': round(avg_prob, 1),
-                'max_probability': round(max_prob, 1),
-                'weather': weather
-            })
+        for i, start in enumerate(starts):
+            day = {
+                'date': days[start].strftime('%Y-%m-%d'),
+                'probability': round(float(avg_probs[i]), 1),
+                'max_probability': round(float(max_probs[i]), 1),
+                'weather': str(weathers[i])
+            }
+            for name, values in percentiles.items():
+                day[name] = round(float(values[i]), 1)
+            forecast.append(day)
         return forecast
 
+# ============ PREDICTOR DÙNG CHUNG TRONG PROCESS ============
+_predictors = {}
+_predictors_lock = threading.Lock()
+
+def get_predictor(model_path=DEFAULT_MODEL_PATH):
+    """Mỗi process chỉ joblib.load model một lần"""
+    with _predictors_lock:
+        if model_path not in _predictors:
+            predictor = WeatherPredictor(model_path)
+            if INFERENCE_WORKER['enabled'] and model_path == DEFAULT_MODEL_PATH:
+                # Giữ selected_features/threshold ở đây, predict_proba chạy trong tiến trình suy luận
+                from models.inference_worker import remote_model
+                predictor.model = remote_model('rain')
+            _predictors[model_path] = predictor
+        return _predictors[model_path]
+
 # ============ FUNCTIONS CHO FOLDER KHÁC GỌI ============
 def get_24h_forecast(dulieu):
     try:
-        predictor = WeatherPredictor()
+        predictor = get_predictor()
         return predictor.predict_24h(dulieu)
     except Exception as e:
         print(f"❌ Lỗi dự báo 24h: {e}")
@@ -237,15 +363,30 @@ def get_24h_forecast(dulieu):
 
 def get_7day_forecast(dulieu):
     try:
-        predictor = WeatherPredictor()
+        predictor = get_predictor()
         return predictor.predict_7days(dulieu)
     except Exception as e:
         print(f"❌ Lỗi dự báo 7 ngày: {e}")
         return []
 
+def _batch_or_empty(results, label):
+    """Trạm lỗi trả về [] như get_24h_forecast / get_7day_forecast"""
+    for station, result in results.items():
+        if isinstance(result, Exception):
+            print(f"❌ Lỗi dự báo {label} trạm {station}: {result}")
+            results[station] = []
+    return results
+
+def get_24h_forecast_batch(datas):
+    """Dự báo mưa 24h cho nhiều trạm: {mã trạm: DataFrame} -> {mã trạm: danh sách}"""
+    return _batch_or_empty(get_predictor().predict_24h_batch(datas), '24h')
+
+def get_7day_forecast_batch(datas):
+    return _batch_or_empty(get_predictor().predict_7days_batch(datas), '7 ngày')
+
 def get_weather_summary(dulieu):
     try:
-        predictor = WeatherPredictor()
+        predictor = get_predictor()
         
         return {
             'forecast_24h': predictor.predict_24h(dulieu),
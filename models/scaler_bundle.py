@@ -0,0 +1,220 @@
+"""Tham số chuẩn hóa lưu cạnh file model (.scaler.json) thay cho việc fit StandardScaler mỗi lần
+
+Tạo bundle từ dữ liệu huấn luyện (CSV có các cột của get_weather_data) hoặc từ kho theo giờ:
+    python -m models.scaler_bundle --csv du_lieu_huan_luyen.csv
+    python -m models.scaler_bundle --from-store
+"""
+import argparse
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+from config.server_config import NORMALIZATION
+from services.stationServices import check_station, station_dir
+
+SCALER_MODES = ('bundle', 'window', 'streaming')
+
+
+def _scale_from_var(mean, var, n):
+    """Độ lệch chuẩn như StandardScaler: cột hằng (var ~ 0 theo sai số float) -> 1"""
+    eps = np.finfo(np.float64).eps
+    constant = var <= n * eps * var + (n * mean * eps) ** 2
+    scale = np.sqrt(var)
+    scale[constant] = 1.0
+    return scale
+
+
+class ScalerBundle:
+    """mean/scale theo cột, biến đổi bằng một phép affine X * a + b đã gộp sẵn"""
+
+    def __init__(self, features, mean, scale, n_samples=0, source=None):
+        self.features = list(features)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.n_samples = int(n_samples)
+        self.source = source
+        self.a = 1.0 / self.scale
+        self.b = -self.mean * self.a
+
+    @classmethod
+    def fit(cls, data, features, source=None):
+        data = np.asarray(data, dtype=np.float64)
+        mean = data.mean(axis=0)
+        var = data.var(axis=0)
+        return cls(features, mean, _scale_from_var(mean, var, len(data)), len(data), source)
+
+    def transform(self, data):
+        return data * self.a + self.b
+
+    def inverse(self, values, columns=None):
+        """Đưa đầu ra model (các cột đầu tiên hoặc `columns`) về đơn vị gốc"""
+        k = values.shape[-1] if columns is None else columns
+        return values * self.scale[:k] + self.mean[:k]
+
+    def to_dict(self):
+        return {
+            'features': self.features,
+            'mean': self.mean.tolist(),
+            'scale': self.scale.tolist(),
+            'n_samples': self.n_samples,
+            'source': self.source,
+        }
+
+    def save(self, path):
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            d = json.load(f)
+        return cls(d['features'], d['mean'], d['scale'], d.get('n_samples', 0), d.get('source'))
+
+
+class StreamingScaler:
+    """Thống kê chạy (Welford) trên mọi giờ đã thấy, lưu ra đĩa để giữ qua các lần khởi động"""
+
+    def __init__(self, features, path=None):
+        self.features = list(features)
+        self.path = path
+        self.n = 0
+        self.mean = np.zeros(len(self.features))
+        self.m2 = np.zeros(len(self.features))
+        self.last_time = None
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                d = json.load(f)
+            if d['features'] == self.features:
+                self.n = d['n']
+                self.mean = np.asarray(d['mean'])
+                self.m2 = np.asarray(d['m2'])
+                self.last_time = pd.Timestamp(d['last_time']) if d['last_time'] else None
+
+    def update(self, df):
+        """Thêm các giờ mới hơn lần cập nhật trước (df có index thời gian)"""
+        with self.lock:
+            if self.last_time is not None:
+                df = df[df.index > self.last_time]
+            if df.empty:
+                return 0
+            batch = df[self.features].to_numpy(dtype=np.float64)
+            # Gộp thống kê của cả batch (Chan et al.) thay vì cộng từng dòng
+            n_b = len(batch)
+            mean_b = batch.mean(axis=0)
+            m2_b = ((batch - mean_b) ** 2).sum(axis=0)
+            n = self.n + n_b
+            delta = mean_b - self.mean
+            self.mean = self.mean + delta * n_b / n
+            self.m2 = self.m2 + m2_b + delta ** 2 * self.n * n_b / n
+            self.n = n
+            self.last_time = df.index[-1]
+            self._save()
+            return n_b
+
+    def _save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'features': self.features, 'n': self.n, 'mean': self.mean.tolist(),
+                       'm2': self.m2.tolist(), 'last_time': str(self.last_time)}, f)
+        os.replace(tmp, self.path)
+
+    def bundle(self):
+        with self.lock:
+            var = self.m2 / self.n
+            return ScalerBundle(self.features, self.mean, _scale_from_var(self.mean, var, self.n),
+                                self.n, 'streaming')
+
+
+def bundle_path(model_path):
+    """data/models/temp-humidity/best_model.keras -> data/models/temp-humidity/best_model.scaler.json"""
+    return os.path.splitext(model_path)[0] + '.scaler.json'
+
+
+_bundles = {}
+_streaming = {}
+_missing_warned = set()
+_lock = threading.Lock()
+
+
+def load_bundle(model_path):
+    """Đọc bundle một lần cho mỗi model; None nếu chưa có file"""
+    with _lock:
+        if model_path not in _bundles:
+            path = bundle_path(model_path)
+            _bundles[model_path] = ScalerBundle.load(path) if os.path.exists(path) else None
+        return _bundles[model_path]
+
+
+def streaming_scaler(features, station=None):
+    """Thống kê chạy riêng cho từng trạm"""
+    station = check_station(station)
+    with _lock:
+        key = (station, tuple(features))
+        if key not in _streaming:
+            base, name = os.path.split(NORMALIZATION['streamingPath'])
+            _streaming[key] = StreamingScaler(features, os.path.join(station_dir(base, station), name))
+        return _streaming[key]
+
+
+def get_scaler(model_path, df, features, window, mode=None, station=None):
+    """Chọn tham số chuẩn hóa theo NORMALIZATION['mode']
+
+    - 'window': fit lại trên `window` dòng cuối như cách cũ (để so sánh)
+    - 'bundle': tham số lúc huấn luyện lưu cạnh model, chưa có file thì dùng 'window'
+    - 'streaming': thống kê chạy trên toàn bộ lịch sử, chưa đủ minStreamingRows thì dùng 'window'
+    """
+    mode = mode or NORMALIZATION['mode']
+    if mode not in SCALER_MODES:
+        raise ValueError(f"Chế độ chuẩn hóa không hỗ trợ: {mode} (chọn {', '.join(SCALER_MODES)})")
+
+    if mode == 'bundle':
+        bundle = load_bundle(model_path)
+        if bundle is not None:
+            if bundle.features != list(features):
+                raise ValueError(f"Bundle {bundle_path(model_path)} có cột {bundle.features}, cần {list(features)}")
+            return bundle
+        if model_path not in _missing_warned:
+            _missing_warned.add(model_path)
+            print(f"Chưa có {bundle_path(model_path)}, chuẩn hóa theo cửa sổ")
+
+    elif mode == 'streaming':
+        scaler = streaming_scaler(features, station)
+        scaler.update(df)
+        if scaler.n >= NORMALIZATION['minStreamingRows']:
+            return scaler.bundle()
+
+    return ScalerBundle.fit(df[features].values[-window:], features, 'window')
+
+
+def main():
+    from models.temp_humidity_model import INPUT_FEATURES, TEMP_MODEL_PATHS, prepare_dataframe
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--csv', help='dữ liệu huấn luyện theo giờ (YEAR, MO, DY, HR và các cột đo)')
+    parser.add_argument('--from-store', action='store_true', help='dùng toàn bộ kho theo giờ trên máy')
+    args = parser.parse_args()
+
+    if args.csv:
+        data, source = pd.read_csv(args.csv), os.path.basename(args.csv)
+    elif args.from_store:
+        from services.loadDataFirebaseServices import get_hourly_store
+        data, source = get_hourly_store().read_all(), 'hourly-store'
+    else:
+        parser.error('cần --csv hoặc --from-store')
+
+    df = prepare_dataframe(data.copy()).dropna(subset=INPUT_FEATURES)
+    bundle = ScalerBundle.fit(df[INPUT_FEATURES].values, INPUT_FEATURES, source)
+    for model_path in TEMP_MODEL_PATHS.values():
+        bundle.save(bundle_path(model_path))
+        print(f"Đã ghi {bundle_path(model_path)} ({bundle.n_samples} giờ)")
+
+
+if __name__ == '__main__':
+    main()
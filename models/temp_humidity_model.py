@@ -1,42 +1,78 @@
 from datetime import datetime, timedelta
+import threading
 import numpy as np
 import pandas as pd
 from services.loadDataFirebaseServices import get_weather_data
-from sklearn.preprocessing import StandardScaler
-
-def prepare_dataframe(data):
-    df_all = data
-    if df_all.empty:
+from models.inference_backend import load_backend
+from models.scaler_bundle import ScalerBundle, get_scaler, load_bundle
+from models.forecast_memo import forecast_memo, model_id, window_key
+from config.server_config import INFERENCE_WORKER, MEMO, NORMALIZATION
+from services.metricsServices import metrics
+from services.hourlyAggregationServices import hourly_index
+
+TEMP_MODEL_PATHS = {
+    '24h': "data/models/temp-humidity/best_model.keras",
+    '7d': "data/models/temp-humidity/best_model_7d.keras",
+}
+INPUT_FEATURES = ['T2M', 'QV2M', 'PRECTOTCORR', 'PS', 'ALLSKY_SFC_PAR_TOT',
+                  'hour_sin', 'hour_cos', 'month_sin', 'month_cos']
+OUTPUT_FEATURES = ['T2M', 'QV2M']
+_temp_models = {}
+_temp_models_lock = threading.Lock()
+
+def get_temp_model(horizon):
+    """Load model khi cần lần đầu qua backend trong INFERENCE (TensorFlow chỉ được import tại đây)"""
+    with _temp_models_lock:
+        if horizon not in _temp_models:
+            if INFERENCE_WORKER['enabled']:
+                # Model chạy trong tiến trình suy luận riêng, process này chỉ giữ proxy
+                from models.inference_worker import remote_model
+                _temp_models[horizon] = remote_model(f'temp_{horizon}')
+            else:
+                _temp_models[horizon] = load_backend(TEMP_MODEL_PATHS[horizon])
+        return _temp_models[horizon]
+
+def temp_models_loaded():
+    return all(horizon in _temp_models for horizon in TEMP_MODEL_PATHS)
+
+def prepare_dataframe(data, hours=None):
+    """DataFrame mới có index thời gian và đặc trưng chu kỳ cho `hours` giờ cuối (None = tất cả)
+
+    Không sửa `data`: nhiều tác vụ dự báo chạy song song cùng đọc một DataFrame
+    """
+    if data.empty:
         return None
 
-    df_all['thoigian'] = pd.to_datetime(df_all[['YEAR', 'MO', 'DY', 'HR']].rename(
-        columns={'YEAR': 'year', 'MO': 'month', 'DY': 'day', 'HR': 'hour'}))
-    df_all.set_index('thoigian', inplace=True)
+    src = data if hours is None else data.iloc[-hours:]
+    index = pd.DatetimeIndex(hourly_index(src), name='thoigian')
+    hour, month = index.hour.to_numpy(), index.month.to_numpy()
 
-    df_all['hour_sin'] = np.sin(2 * np.pi * df_all.index.hour / 24)
-    df_all['hour_cos'] = np.cos(2 * np.pi * df_all.index.hour / 24)
-    df_all['month_sin'] = np.sin(2 * np.pi * df_all.index.month / 12)
-    df_all['month_cos'] = np.cos(2 * np.pi * df_all.index.month / 12)
+    # Dựng DataFrame một lần từ các mảng (nhanh gấp đôi set_index rồi gán từng cột)
+    columns = {col: src[col].to_numpy() for col in src.columns}
+    columns['hour_sin'] = np.sin(2 * np.pi * hour / 24)
+    columns['hour_cos'] = np.cos(2 * np.pi * hour / 24)
+    columns['month_sin'] = np.sin(2 * np.pi * month / 12)
+    columns['month_cos'] = np.cos(2 * np.pi * month / 12)
 
-    return df_all
+    return pd.DataFrame(columns, index=index)
 
-def predict_weather(df, model, input_features, output_features, input_steps, output_steps):
+def scale_window(df, input_features, input_steps, scaler=None):
+    """Cửa sổ input_steps giờ cuối đã chuẩn hóa, kèm scaler đã dùng"""
     data = df[input_features].values
     if data.shape[0] < input_steps:
         raise ValueError(f"Không đủ {input_steps} giờ dữ liệu")
 
-    scaler = StandardScaler()
-    data_scaled = scaler.fit_transform(data)
+    # Không truyền scaler thì fit trên chính cửa sổ đầu vào như trước
+    if scaler is None:
+        scaler = ScalerBundle.fit(data, input_features, 'window')
+    return scaler.transform(data[-input_steps:]), scaler
 
-    X_input = np.expand_dims(data_scaled[-input_steps:], axis=0)
-    y_pred = model.predict(X_input)
+def decode_prediction(y_pred, scaler, last_time, output_features, output_steps):
+    """Đầu ra model (đã chuẩn hóa) -> {thời gian: {cột: giá trị}}"""
     y_pred = y_pred.reshape(output_steps, len(output_features))
+    # Các cột đầu ra là các cột đầu tiên của input_features
+    y_pred_inv = scaler.inverse(y_pred)
 
-    dummy = np.zeros((output_steps, len(input_features)))
-    dummy[:, :len(output_features)] = y_pred
-    y_pred_inv = scaler.inverse_transform(dummy)[:, :len(output_features)]
-
-    last_time = df.index[-1]
     future_times = [last_time + timedelta(hours=i + 1) for i in range(output_steps)]
 
     results = {
@@ -49,10 +85,16 @@ def predict_weather(df, model, input_features, output_features, input_steps, out
 
     return results
 
+def predict_weather(df, model, input_features, output_features, input_steps, output_steps, scaler=None):
+    window, scaler = scale_window(df, input_features, input_steps, scaler)
+    y_pred = model.predict(np.expand_dims(window, axis=0))
+    return decode_prediction(y_pred, scaler, df.index[-1], output_features, output_steps)
+
 def convert_24h_output(prediction_dict):
     forecast = []
     for i, (timestamp, values) in enumerate(prediction_dict.items()):
-        date_obj = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+        # fromisoformat đọc đúng dạng "%Y-%m-%d %H:%M:%S", nhanh hơn strptime nhiều lần
+        date_obj = datetime.fromisoformat(timestamp)
         forecast.append({
             'time': date_obj,
             'temp': values['T2M'],
@@ -60,46 +102,89 @@ def convert_24h_output(prediction_dict):
     return forecast
 
 def convert_7d_output(prediction_dict):
-    df = pd.DataFrame([
-        {"time": datetime.strptime(k, "%Y-%m-%d %H:%M:%S"), "temp": v["T2M"]}
-        for k, v in prediction_dict.items()
-    ])
-    df['date'] = df['time'].dt.strftime("%Y-%m-%d")
-
-    daily = df.groupby("date")["temp"].agg(temp_max='max', temp_min='min').reset_index()
+    # Khóa dạng "%Y-%m-%d %H:%M:%S" nên 10 ký tự đầu là ngày; gộp max/min theo ngày
+    # bằng dict thay vì DataFrame + groupby (API simulate gọi hàm này cho từng cửa sổ)
+    daily = {}
+    for timestamp, values in prediction_dict.items():
+        temp = values['T2M']
+        low_high = daily.get(timestamp[:10])
+        daily[timestamp[:10]] = (min(low_high[0], temp), max(low_high[1], temp)) if low_high else (temp, temp)
 
     forecast = []
-    for _, row in daily.iterrows():
+    for date in sorted(daily):
+        temp_min, temp_max = daily[date]
         forecast.append({
-            'date': row['date'],
-            'temp_max': round(row['temp_max'], 2),
-            'temp_min': round(row['temp_min'], 2)
+            'date': date,
+            'temp_max': round(temp_max, 2),
+            'temp_min': round(temp_min, 2)
         })
     return forecast
 
-def forecast_24h(model_24h, data):
-    df_all = prepare_dataframe(data)
-    if df_all is None or len(df_all) < 72:
-        return {"error": "Không đủ dữ liệu cho 24h"}
-
-    input_features = ['T2M', 'QV2M', 'PRECTOTCORR', 'PS', 'ALLSKY_SFC_PAR_TOT',
-                      'hour_sin', 'hour_cos', 'month_sin', 'month_cos']
-    output_features = ['T2M', 'QV2M']
-
-    df_24h = df_all.tail(72)
-    pred_24h = predict_weather(df_24h, model_24h, input_features, output_features, 72, 24)
-    return convert_24h_output(pred_24h)
-
-
-def forecast_7d(model_7d,data):
-    df_all = prepare_dataframe(data)
-    if df_all is None or len(df_all) < 168:
-        return {"error": "Không đủ dữ liệu cho 7 ngày"}
+# horizon -> (số giờ đầu vào, số giờ dự báo, hàm định dạng, tên trong thông báo lỗi)
+HORIZONS = {
+    '24h': (72, 24, convert_24h_output, '24h'),
+    '7d': (168, 168, convert_7d_output, '7 ngày'),
+}
+
+def memo_key(model, horizon, data, input_steps, scaler=None):
+    """(model, horizon, cửa sổ đầu vào, tham số chuẩn hóa) -> khóa trong forecast_memo"""
+    arrays = () if scaler is None else (scaler.mean, scaler.scale)
+    return (model_id(TEMP_MODEL_PATHS[horizon], getattr(model, 'name', '')), horizon,
+            NORMALIZATION['mode'], window_key(data, input_steps, *arrays))
+
+def forecast_batch(model, datas, horizon, simulated=False):
+    """Dự báo cho nhiều trạm bằng một lần gọi model trên tensor (N, input_steps, 9)
+
+    datas: {mã trạm: DataFrame}; trả về {mã trạm: kết quả hoặc {"error": ...}}.
+    Trạm có cửa sổ đầu vào đã dự báo trước đó lấy kết quả từ forecast_memo.
+    simulated: dữ liệu do người gọi gửi lên (khóa không phải trạm) -- không dùng forecast_memo
+    và không cập nhật thống kê chuẩn hóa streaming của trạm nào (dùng bundle thay thế).
+    """
+    input_steps, output_steps, convert, label = HORIZONS[horizon]
+    streaming = NORMALIZATION['mode'] == 'streaming' and not simulated
+    scaler_mode = 'bundle' if simulated and NORMALIZATION['mode'] == 'streaming' else None
+    use_memo = MEMO['enabled'] and not simulated
+    results, windows, pending = {}, [], []
+    with metrics.span('features', model=f'temp_{horizon}'):
+        for station, data in datas.items():
+            key = None
+            if use_memo and not streaming:
+                # Tham số chuẩn hóa chỉ phụ thuộc cửa sổ (window) hoặc bundle cố định: kiểm tra trước khi tính gì
+                key = memo_key(model, horizon, data, input_steps, load_bundle(TEMP_MODEL_PATHS[horizon]))
+                cached = forecast_memo.get(key)
+                if cached is not None:
+                    results[station] = cached
+                    continue
+
+            # Chế độ streaming cần cả lịch sử để cập nhật thống kê, các chế độ khác chỉ cần cửa sổ cuối
+            df_all = prepare_dataframe(data, None if streaming else input_steps)
+            if df_all is None or len(df_all) < input_steps:
+                results[station] = {"error": f"Không đủ dữ liệu cho {label}"}
+                continue
+            scaler = get_scaler(TEMP_MODEL_PATHS[horizon], df_all, INPUT_FEATURES, input_steps,
+                                mode=scaler_mode, station=station)
+            if use_memo and streaming:
+                key = memo_key(model, horizon, data, input_steps, scaler)
+                cached = forecast_memo.get(key)
+                if cached is not None:
+                    results[station] = cached
+                    continue
+
+            window, scaler = scale_window(df_all.tail(input_steps), INPUT_FEATURES, input_steps, scaler)
+            windows.append(window)
+            pending.append((station, key, scaler, df_all.index[-1]))
+
+    if windows:
+        with metrics.span('inference', model=f'temp_{horizon}'):
+            y_pred = model.predict(np.stack(windows))
+        for (station, key, scaler, last_time), y_row in zip(pending, y_pred):
+            results[station] = convert(decode_prediction(y_row, scaler, last_time, OUTPUT_FEATURES, output_steps))
+            if key is not None:
+                forecast_memo.put(key, results[station])
+    return results
 
-    input_features = ['T2M', 'QV2M', 'PRECTOTCORR', 'PS', 'ALLSKY_SFC_PAR_TOT',
-                      'hour_sin', 'hour_cos', 'month_sin', 'month_cos']
-    output_features = ['T2M', 'QV2M']
+def forecast_24h(model_24h, data, station=None):
+    return forecast_batch(model_24h, {station: data}, '24h')[station]
 
-    df_7d = df_all.tail(168)
-    pred_7d = predict_weather(df_7d, model_7d, input_features, output_features, 168, 168)
-    return convert_7d_output(pred_7d)
+def forecast_7d(model_7d, data, station=None):
+    return forecast_batch(model_7d, {station: data}, '7d')[station]
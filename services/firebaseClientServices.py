@@ -0,0 +1,109 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from config.server_config import HTTP
+from services.metricsServices import metrics
+
+# Lỗi tạm thời của Firebase / mạng thì thử lại
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class FirebaseClient:
+    """HTTP client dùng chung: một Session (keep-alive), timeout, thử lại có jitter và đo độ trễ"""
+
+    def __init__(self, base_url, auth, pool_size=None):
+        self.base_url = base_url
+        self.auth = auth
+        self.timeout = (HTTP['connectTimeoutSeconds'], HTTP['readTimeoutSeconds'])
+        self.retries = HTTP['retries']
+        self.backoff = HTTP['backoffSeconds']
+
+        pool_size = pool_size or HTTP['poolSize']
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='firebase')
+
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+    # ===== ĐO ĐỘ TRỄ =====
+    def _record(self, name, elapsed, size=0, retries=0, error=False):
+        with self.stats_lock:
+            s = self.stats.setdefault(name, {
+                'count': 0, 'errors': 0, 'retries': 0, 'bytes': 0,
+                'last_ms': 0.0, 'max_ms': 0.0, 'total_ms': 0.0
+            })
+            ms = elapsed * 1000
+            s['count'] += 1
+            s['errors'] += int(error)
+            s['retries'] += retries
+            s['bytes'] += size
+            s['last_ms'] = ms
+            s['max_ms'] = max(s['max_ms'], ms)
+            s['total_ms'] += ms
+        metrics.observe('firebase_request_seconds', elapsed, request=name)
+        metrics.inc('firebase_requests_total', request=name, outcome='error' if error else 'ok')
+        if retries:
+            metrics.inc('firebase_retries_total', retries, request=name)
+        if size:
+            metrics.inc('firebase_bytes_total', size, request=name)
+
+    def latency_report(self):
+        with self.stats_lock:
+            return {name: dict(s) for name, s in self.stats.items()}
+
+    # ===== REQUEST =====
+    def request(self, method, path, params=None, body=None, name=None):
+        """Gửi request tới {base_url}{path}.json, trả về JSON đã giải mã"""
+        url = f"{self.base_url}/{path.strip('/')}.json"
+        params = dict(params or {})
+        params['auth'] = self.auth
+        data = json.dumps(body) if body is not None else None
+        headers = {'Content-Type': 'application/json'} if data is not None else None
+        name = name or f"{method} {path}"
+
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                resp = self.session.request(method, url, params=params, data=data,
+                                            headers=headers, timeout=self.timeout)
+                if resp.status_code in RETRY_STATUSES and attempt < self.retries:
+                    self._sleep(attempt)
+                    continue
+                resp.raise_for_status()
+                # Giải mã thẳng từ bytes của body, không qua resp.text (đoán charset + thêm một bản sao str)
+                raw = resp.content
+                value = json.loads(raw) if raw else None
+                self._record(name, time.perf_counter() - start, len(raw), attempt)
+                return value
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    self._record(name, time.perf_counter() - start, retries=attempt, error=True)
+                    raise
+                self._sleep(attempt)
+            except requests.HTTPError:
+                self._record(name, time.perf_counter() - start, retries=attempt, error=True)
+                raise
+
+    def _sleep(self, attempt):
+        # Backoff lũy thừa với full jitter để các worker không thử lại cùng lúc
+        time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    def get(self, path, params=None, name=None):
+        return self.request('GET', path, params=params, name=name)
+
+    def patch(self, path, body, name=None):
+        return self.request('PATCH', path, body=body, name=name)
+
+    def delete(self, path, name=None):
+        return self.request('DELETE', path, name=name)
+
+    def run_concurrently(self, tasks):
+        """Chạy song song {tên: hàm không tham số} trên pool của client, trả về {tên: kết quả}"""
+        futures = {name: self.executor.submit(fn) for name, fn in tasks.items()}
+        return {name: future.result() for name, future in futures.items()}
@@ -0,0 +1,259 @@
+import json
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+import requests
+from config.server_config import HTTP, RETENTION, STREAM, SYNC
+from services.metricsServices import metrics
+from services.stationServices import check_station, list_stations, station_label, station_path
+import services.loadDataFirebaseServices as firebase
+
+logger = logging.getLogger(__name__)
+
+SENSOR_NODES = SYNC['nodes']
+WEATHER_NODE = 'weather_data'
+
+
+def parse_events(lines):
+    """Các dòng text/event-stream -> (tên sự kiện, data); sự kiện kết thúc ở dòng trống"""
+    event, data = None, []
+    for line in lines:
+        if not line:
+            if event is not None or data:
+                yield event or 'message', '\n'.join(data)
+            event, data = None, []
+            continue
+        if line.startswith(':'):
+            continue
+        field, _, value = line.partition(':')
+        value = value[1:] if value.startswith(' ') else value
+        if field == 'event':
+            event = value
+        elif field == 'data':
+            data.append(value)
+
+
+def apply_event(records, path, data, patch=False):
+    """Áp một sự kiện put/patch của Firebase vào dict records của node, trả về tập key cấp 1 đã đổi
+
+    put tại '/' là dữ liệu của truy vấn (các key >= startAt) nên được gộp vào, không thay cả node.
+    """
+    parts = [p for p in path.split('/') if p]
+    if patch:
+        changed = set()
+        for child, value in (data or {}).items():
+            changed |= apply_event(records, '/'.join(parts + [child]), value)
+        return changed
+    if not parts:
+        if isinstance(data, dict):
+            records.update(data)
+            return set(data)
+        return set()
+
+    node = records
+    for part in parts[:-1]:
+        child = node.get(part)
+        if not isinstance(child, dict):
+            child = node[part] = {}
+        node = child
+    if data is None:
+        node.pop(parts[-1], None)
+    else:
+        node[parts[-1]] = data
+    return {parts[0]}
+
+
+class StationStream:
+    """Nghe luồng SSE của 4 node một trạm, cập nhật kho theo giờ và báo khi một giờ đã đủ dữ liệu
+
+    - Mỗi node một thread giữ kết nối `Accept: text/event-stream` (node cảm biến dùng startAt=cursor)
+    - Mất kết nối / cancel / auth_revoked: kết nối lại sau backoff; startAt=cursor nên sự kiện put
+      đầu tiên chứa đủ các bản ghi bị lỡ (resync)
+    - Giờ H "đóng" khi cả 3 node cảm biến đã có bản ghi của giờ sau H -> gọi on_hour_closed(trạm, H)
+    """
+
+    def __init__(self, station=None, on_hour_closed=None):
+        self.station = check_station(station)
+        self.on_hour_closed = on_hour_closed
+        self.caches = {node: firebase.load_node_cache(node, self.station) for node in SENSOR_NODES}
+        self.weather = {}
+        self.pending = {node: set() for node in SENSOR_NODES}
+        self.synced = {node: threading.Event() for node in SENSOR_NODES + [WEATHER_NODE]}
+        self.latest_hour = {node: max(cache.records)[:10] if cache.records else None
+                            for node, cache in self.caches.items()}
+        self.closed_through = None
+        self.last_save = time.monotonic()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.threads = []
+        self.stats = {'events': 0, 'reconnects': 0, 'hours_closed': 0, 'last_event': None}
+
+    # ===== KẾT NỐI =====
+    def start(self):
+        for node in SENSOR_NODES + [WEATHER_NODE]:
+            thread = threading.Thread(target=self._run, args=(node,), daemon=True,
+                                      name=f"stream-{self.station}-{node}")
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        self.stopping.set()
+
+    def is_synced(self):
+        return all(event.is_set() for event in self.synced.values())
+
+    def _params(self, node):
+        params = {'auth': firebase.client.auth}
+        cursor = self.caches[node].cursor if node in self.caches else None
+        if cursor is None and node in self.caches and RETENTION['enabled']:
+            cursor = firebase.retention_start_key(node, self.station)
+        if cursor is not None:
+            params['orderBy'] = json.dumps("$key")
+            params['startAt'] = json.dumps(cursor)
+        return params
+
+    def _run(self, node):
+        session = requests.Session()
+        label = station_label(node, self.station)
+        attempt = 0
+        while not self.stopping.is_set():
+            url = f"{firebase.client.base_url}/{station_path(node, self.station).strip('/')}.json"
+            try:
+                with session.get(url, params=self._params(node), headers={'Accept': 'text/event-stream'},
+                                 stream=True, timeout=(HTTP['connectTimeoutSeconds'],
+                                                       STREAM['readTimeoutSeconds'])) as resp:
+                    resp.raise_for_status()
+                    metrics.inc('firebase_stream_connects_total', node=node)
+                    # chunk_size=None: nhận từng chunk ngay khi tới, không chờ đủ bộ đệm
+                    for event, data in parse_events(resp.iter_lines(chunk_size=None, decode_unicode=True)):
+                        if self.stopping.is_set():
+                            return
+                        if event in ('put', 'patch'):
+                            payload = json.loads(data)
+                            self._apply(node, payload['path'], payload['data'], event == 'patch')
+                            attempt = 0
+                        elif event in ('cancel', 'auth_revoked'):
+                            logger.warning(f"Luồng {label} bị đóng ({event}): {data}")
+                            break
+                    logger.info(f"Luồng {label} kết thúc, kết nối lại")
+            except (requests.RequestException, ValueError, KeyError) as e:
+                logger.warning(f"Luồng {label} lỗi: {e}")
+
+            self.stats['reconnects'] += 1
+            metrics.inc('firebase_stream_reconnects_total', node=node)
+            # Backoff lũy thừa có jitter; resync bằng startAt=cursor khi kết nối lại
+            delay = min(STREAM['maxBackoffSeconds'], HTTP['backoffSeconds'] * 2 ** attempt)
+            attempt += 1
+            self.stopping.wait(random.uniform(delay / 2, delay))
+
+    # ===== ÁP DỤNG SỰ KIỆN =====
+    def _apply(self, node, path, data, patch):
+        with self.lock:
+            self.stats['events'] += 1
+            self.stats['last_event'] = time.time()
+            if node == WEATHER_NODE:
+                if path.strip('/') or patch:
+                    apply_event(self.weather, path, data, patch)
+                else:
+                    # weather_data là một bản ghi duy nhất: put tại gốc thay toàn bộ
+                    self.weather = data if isinstance(data, dict) else {}
+            else:
+                cache = self.caches[node]
+                changed = apply_event(cache.records, path, data, patch)
+                self.pending[node] |= changed
+                if changed:
+                    cache.mark(changed)
+                    cache.cursor = max(changed if cache.cursor is None else changed | {cache.cursor})
+                metrics.inc('firebase_records_fetched_total', len(changed), node=node)
+            self.synced[node].set()
+            if self.is_synced():
+                closed = self._ingest()
+            else:
+                closed = None
+        if closed and self.on_hour_closed:
+            self.on_hour_closed(self.station, closed)
+
+    def _ingest(self):
+        """Đưa các bản ghi mới vào kho theo giờ; trả về giờ vừa đóng (nếu có). Đang giữ self.lock"""
+        new = {node: {key: self.caches[node].records[key] for key in keys if key in self.caches[node].records}
+               for node, keys in self.pending.items()}
+        weather = {'current': self.weather} if 'last_update' in self.weather else {}
+        with metrics.span('merge'):
+            firebase.update_hourly_store(self.station, *(self.caches[n].records for n in SENSOR_NODES),
+                                         weather, tuple(new[n] for n in SENSOR_NODES))
+        for node, records in new.items():
+            if records:
+                self.latest_hour[node] = max([max(records)[:10]] + [self.latest_hour[node] or ''])
+        self.pending = {node: set() for node in SENSOR_NODES}
+
+        closed = None
+        if all(self.latest_hour.values()):
+            # Giờ mở sớm nhất trong 3 node; mọi giờ trước nó đã đủ dữ liệu
+            open_hour = min(self.latest_hour.values())
+            if self.closed_through is not None and open_hour > self.closed_through:
+                closed = datetime.strptime(open_hour, '%Y%m%d%H') - timedelta(hours=1)
+                self.stats['hours_closed'] += 1
+            self.closed_through = open_hour
+
+        if closed and RETENTION['enabled']:
+            for cache in self.caches.values():
+                firebase.prune_records(cache, cache.cursor)
+
+        if closed or time.monotonic() - self.last_save >= STREAM['saveIntervalSeconds']:
+            self.save()
+        return closed
+
+    def save(self):
+        for node, cache in self.caches.items():
+            firebase.save_node_cache(node, cache, self.station)
+        self.last_save = time.monotonic()
+
+    def frame(self):
+        """DataFrame theo giờ hiện tại của trạm (giống get_weather_data nhưng không gọi Firebase)"""
+        return firebase.complete_hours(firebase.get_hourly_store(self.station).read_last())
+
+
+_streams = {}
+_streams_lock = threading.Lock()
+
+
+def start_streams(on_hour_closed=None, stations=None):
+    """Mở luồng cho các trạm (mặc định mọi trạm đã đăng ký), mỗi trạm một lần"""
+    with _streams_lock:
+        for station in stations or list_stations():
+            if station not in _streams:
+                _streams[station] = StationStream(station, on_hour_closed).start()
+        return dict(_streams)
+
+
+def stop_streams():
+    with _streams_lock:
+        for stream in _streams.values():
+            stream.stop()
+            with stream.lock:
+                stream.save()
+        _streams.clear()
+
+
+def get_streams_data():
+    """{mã trạm: DataFrame} của các trạm đã đồng bộ xong, dùng thay get_stations_data ở chế độ stream"""
+    with _streams_lock:
+        streams = dict(_streams)
+    datas = {}
+    for station, stream in streams.items():
+        if not stream.is_synced():
+            continue
+        with stream.lock:
+            datas[station] = stream.frame()
+    if not datas:
+        raise RuntimeError("Chưa có luồng dữ liệu nào đồng bộ xong")
+    return datas
+
+
+def stream_status():
+    with _streams_lock:
+        return {station: {**stream.stats, 'synced': stream.is_synced(), 'closed_through': stream.closed_through}
+                for station, stream in _streams.items()}
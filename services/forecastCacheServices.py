@@ -0,0 +1,265 @@
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+from email.utils import format_datetime, parsedate_to_datetime
+from datetime import datetime, timezone
+from flask import Response
+from config.server_config import API
+from services.stationServices import DEFAULT_STATION, check_station
+
+# Các view của dự báo: tên -> hàm lấy phần dữ liệu từ kết quả du_bao
+VIEWS = {
+    'all': lambda result: result,
+    '24h': lambda result: result['forecast_24h'],
+    '7d': lambda result: result['forecast_7d'],
+}
+
+class CachedBody:
+    """Một biểu diễn đã mã hóa sẵn: JSON, bản gzip (nếu đủ lớn) và ETag tương ứng"""
+
+    def __init__(self, payload):
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.etag = hashlib.blake2b(self.body, digest_size=12).hexdigest()
+        self.gzip_body = None
+        if API['gzip'] and len(self.body) >= API['gzipMinBytes']:
+            self.gzip_body = gzip.compress(self.body, compresslevel=6)
+
+class ForecastSnapshot:
+    """Kết quả một lần du_bao, bất biến sau khi tạo"""
+
+    def __init__(self, result, generated_at=None):
+        self.generated_at = (generated_at or datetime.now(timezone.utc)).replace(microsecond=0)
+        self.last_modified = format_datetime(self.generated_at, usegmt=True)
+        self.views = {name: CachedBody(get(result)) for name, get in VIEWS.items()}
+
+class ForecastCache:
+    """Giữ snapshot dự báo mới nhất; publish thay cả snapshot bằng một phép gán (atomic)"""
+
+    def __init__(self):
+        self._snapshot = None
+        self._publish_lock = threading.Lock()
+
+    def publish(self, result, generated_at=None):
+        snapshot = ForecastSnapshot(result, generated_at)
+        with self._publish_lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    def snapshot(self):
+        return self._snapshot
+
+forecast_cache = ForecastCache()
+# Cache riêng cho từng trạm; trạm mặc định dùng chung forecast_cache
+_station_caches = {DEFAULT_STATION: forecast_cache}
+_station_caches_lock = threading.Lock()
+
+def get_station_cache(station=None):
+    station = check_station(station)
+    with _station_caches_lock:
+        return _station_caches.setdefault(station, ForecastCache())
+
+# ===== KẾT QUẢ DÙNG CHUNG GIỮA CÁC WORKER =====
+# File: MAGIC + độ dài header (uint32) + header JSON {trạm: {generated_at, views}} + các body nối liền
+MAGIC = b'WFC1'
+_HEADER = struct.Struct('<4sI')
+
+def write_snapshots(path, snapshots):
+    """Ghi {trạm: ForecastSnapshot} ra một file; offset trong header tính từ đầu phần body
+
+    Ghi file tạm rồi os.replace: worker đang mmap file cũ vẫn đọc được cho tới khi chuyển sang file mới.
+    """
+    blobs, offset, index = [], 0, {}
+    for station, snapshot in snapshots.items():
+        views = {}
+        for name, cached in snapshot.views.items():
+            views[name] = {'etag': cached.etag}
+            for field in ('body', 'gzip_body'):
+                data = getattr(cached, field)
+                if data is not None:
+                    views[name][field] = [offset, len(data)]
+                    blobs.append(data)
+                    offset += len(data)
+        index[station] = {'generated_at': snapshot.generated_at.isoformat(), 'views': views}
+    header = json.dumps(index, separators=(',', ':')).encode('utf-8')
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, len(header)))
+        f.write(header)
+        for data in blobs:
+            f.write(data)
+    os.replace(tmp_path, path)
+
+class MappedBody:
+    """Như CachedBody nhưng body/gzip_body là memoryview trỏ vào file đã mmap (không copy)"""
+    __slots__ = ('body', 'gzip_body', 'etag', 'offsets', 'source')
+
+    def __init__(self, body, gzip_body, etag, offsets, source):
+        self.body = body
+        self.gzip_body = gzip_body
+        self.etag = etag
+        self.offsets = offsets
+        self.source = source
+
+    def open_at(self, field):
+        """Mở lại file kết quả, đặt vị trí ở đầu body; None nếu leader đã thay file sau lần mmap này"""
+        path, version = self.source
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            return None
+        st = os.fstat(f.fileno())
+        if (st.st_ino, st.st_mtime_ns) != version:
+            f.close()
+            return None
+        f.seek(self.offsets[field])
+        return f
+
+class MappedSnapshot:
+    def __init__(self, generated_at, views):
+        self.generated_at = generated_at
+        self.last_modified = format_datetime(generated_at, usegmt=True)
+        self.views = views
+
+class SharedForecastFile:
+    """Đọc file kết quả do leader ghi; mỗi request chỉ tốn một os.stat để biết file đã đổi chưa"""
+
+    def __init__(self, path):
+        self.path = path
+        self._version = None
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if (st.st_ino, st.st_mtime_ns) == self._version:
+            return
+        with self._lock:
+            with open(self.path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                if (st.st_ino, st.st_mtime_ns) == self._version:
+                    return
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, header_len = _HEADER.unpack_from(mapped)
+            if magic != MAGIC:
+                raise ValueError(f"File kết quả không hợp lệ: {self.path}")
+            index = json.loads(mapped[_HEADER.size:_HEADER.size + header_len])
+            start = _HEADER.size + header_len
+            data = memoryview(mapped)
+            version = (st.st_ino, st.st_mtime_ns)
+
+            def body(entry, field):
+                offset, length = entry[field]
+                return data[start + offset:start + offset + length]
+
+            def mapped_body(entry):
+                fields = [field for field in ('body', 'gzip_body') if field in entry]
+                return MappedBody(body(entry, 'body'), body(entry, 'gzip_body') if 'gzip_body' in fields else None,
+                                  entry['etag'], {field: start + entry[field][0] for field in fields},
+                                  (self.path, version))
+
+            # mmap cũ được giải phóng khi không còn response nào giữ memoryview của nó
+            self._snapshots = {
+                station: MappedSnapshot(datetime.fromisoformat(item['generated_at']),
+                                        {name: mapped_body(entry) for name, entry in item['views'].items()})
+                for station, item in index.items()
+            }
+            self._version = version
+
+    def snapshot(self, station=None):
+        self._refresh()
+        return self._snapshots.get(check_station(station))
+
+class SharedStationCache:
+    """Giao diện snapshot() như ForecastCache, đọc từ file dùng chung"""
+
+    def __init__(self, shared, station):
+        self.shared = shared
+        self.station = station
+
+    def snapshot(self):
+        return self.shared.snapshot(self.station)
+
+_shared_file = None
+
+def use_shared_file(path):
+    """Chế độ nhiều worker: API đọc từ file của leader, leader ghi file sau mỗi lần publish"""
+    global _shared_file
+    _shared_file = SharedForecastFile(path)
+
+def publish_shared():
+    """Ghi snapshot mới nhất của mọi trạm trong process này ra file dùng chung (nếu đang bật)"""
+    if _shared_file is None:
+        return
+    with _station_caches_lock:
+        caches = dict(_station_caches)
+    snapshots = {station: cache.snapshot() for station, cache in caches.items() if cache.snapshot() is not None}
+    if snapshots:
+        write_snapshots(_shared_file.path, snapshots)
+
+def response_cache(station=None):
+    """Cache để trả API: file dùng chung ở chế độ nhiều worker, nếu không thì cache trong process"""
+    station = check_station(station)
+    if _shared_file is not None:
+        return SharedStationCache(_shared_file, station)
+    return get_station_cache(station)
+
+def _not_modified(request, etag, snapshot):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag) or request.if_none_match.star_tag
+    since = request.headers.get('If-Modified-Since')
+    if since:
+        try:
+            return parsedate_to_datetime(since) >= snapshot.generated_at
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def forecast_response(request, view='all', cache=None):
+    """Response cho GET /api/forecast/<view>: ETag/Last-Modified, 304 và gzip"""
+    if view not in VIEWS:
+        return Response(json.dumps({'error': f"Không có view '{view}'"}), status=404,
+                        mimetype='application/json')
+    snapshot = (cache or response_cache()).snapshot()
+    if snapshot is None:
+        return Response(json.dumps({'error': 'Chưa có dự báo'}), status=503,
+                        mimetype='application/json', headers={'Retry-After': '60'})
+
+    cached = snapshot.views[view]
+    use_gzip = cached.gzip_body is not None and 'gzip' in request.headers.get('Accept-Encoding', '')
+    # Mỗi cách mã hóa là một biểu diễn riêng nên có ETag riêng
+    etag = f"{cached.etag}-gz" if use_gzip else cached.etag
+    headers = {
+        'ETag': f'"{etag}"',
+        'Last-Modified': snapshot.last_modified,
+        'Cache-Control': 'no-cache',
+        'Vary': 'Accept-Encoding',
+    }
+    if _not_modified(request, etag, snapshot):
+        return Response(status=304, headers=headers)
+
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+        return _body_response(request, cached, 'gzip_body', headers)
+    return _body_response(request, cached, 'body', headers)
+
+def _body_response(request, cached, field, headers):
+    body = getattr(cached, field)
+    if not isinstance(body, memoryview):
+        return Response(body, mimetype='application/json', headers=headers)
+    headers['Content-Length'] = str(len(body))
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    f = cached.open_at(field) if file_wrapper else None
+    if f is not None:
+        # gunicorn gửi bằng sendfile đúng Content-Length byte: kernel đọc thẳng từ page cache ra socket
+        return Response(file_wrapper(f), mimetype='application/json', headers=headers, direct_passthrough=True)
+    # WSGI chỉ nhận bytes: copy body (vài KB) từ vùng mmap
+    return Response(bytes(body), mimetype='application/json', headers=headers)
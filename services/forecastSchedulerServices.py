@@ -0,0 +1,104 @@
+import hashlib
+import logging
+import threading
+import time
+import numpy as np
+from config.server_config import TIMER
+from services.metricsServices import metrics
+
+logger = logging.getLogger(__name__)
+
+# Số giờ cuối mà các model thực sự đọc (forecast_7d dùng 168h, các model khác ít hơn)
+INPUT_HOURS = 168
+
+def fingerprint(df, hours=INPUT_HOURS):
+    """Dấu vân tay của cửa sổ đầu vào: thời điểm cuối + hash các giá trị
+
+    Với dữ liệu nhiều trạm ({mã trạm: DataFrame}) là dấu vân tay của từng trạm ghép lại
+    """
+    if isinstance(df, dict):
+        parts = [f"{station}:{fingerprint(data, hours)}" for station, data in sorted(df.items())]
+        return "|".join(parts) or None
+    if df is None or df.empty:
+        return None
+    window = df.tail(hours)
+    values = np.ascontiguousarray(window.to_numpy(dtype=np.float64))
+    digest = hashlib.blake2b(values.tobytes(), digest_size=16).hexdigest()
+    last = window.iloc[-1]
+    last_time = f"{int(last['YEAR']):04d}{int(last['MO']):02d}{int(last['DY']):02d}{int(last['HR']):02d}"
+    return f"{last_time}-{len(window)}-{digest}"
+
+class ForecastScheduler:
+    """Chạy dự báo định kỳ, bỏ qua nếu dữ liệu đầu vào không đổi
+
+    - Mỗi checkIntervalMinutes lấy dữ liệu và so dấu vân tay với lần chạy thành công trước
+    - Lỗi thì thử lại sau retryIntervalMinutes, tăng gấp đôi tới maxRetryIntervalMinutes
+    """
+
+    def __init__(self, fetch, run, check_interval=None, retry_interval=None, max_retry_interval=None):
+        self.fetch = fetch
+        self.run = run
+        self.check_interval = (check_interval or TIMER['checkIntervalMinutes']) * 60
+        self.retry_interval = (retry_interval or TIMER['retryIntervalMinutes']) * 60
+        self.max_retry_interval = (max_retry_interval or TIMER['maxRetryIntervalMinutes']) * 60
+        self.last_fingerprint = None
+        self.failures = 0
+        self.lock = threading.Lock()
+        # Đánh thức vòng lặp trước hạn (ví dụ khi luồng Firebase báo một giờ vừa đủ dữ liệu)
+        self.wake = threading.Event()
+        self.metrics = {
+            'executed': 0,
+            'skipped': 0,
+            'failed': 0,
+            'last_run': None,
+            'last_check': None,
+            'last_error': None,
+        }
+
+    def tick(self, force=False):
+        """Một lần kiểm tra; trả về 'executed', 'skipped' hoặc 'failed'"""
+        with self.lock:
+            self.metrics['last_check'] = time.time()
+            try:
+                with metrics.span('collect'):
+                    data = self.fetch()
+                current = fingerprint(data)
+                if not force and current is not None and current == self.last_fingerprint:
+                    self.metrics['skipped'] += 1
+                    self.failures = 0
+                    metrics.inc('forecast_cycles_total', status='skipped')
+                    return 'skipped'
+
+                with metrics.span('forecast'):
+                    self.run(data)
+                self.last_fingerprint = current
+                self.metrics['executed'] += 1
+                self.metrics['last_run'] = time.time()
+                self.failures = 0
+                metrics.inc('forecast_cycles_total', status='executed')
+                return 'executed'
+            except Exception as e:
+                self.failures += 1
+                self.metrics['failed'] += 1
+                metrics.inc('forecast_cycles_total', status='failed')
+                self.metrics['last_error'] = str(e)
+                logger.error(f"Chu kỳ dự báo lỗi (lần {self.failures}): {e}")
+                return 'failed'
+
+    def next_delay(self):
+        if self.failures:
+            delay = self.retry_interval * 2 ** (self.failures - 1)
+            return min(delay, self.max_retry_interval)
+        return self.check_interval
+
+    def trigger(self):
+        """Chạy chu kỳ tiếp theo ngay thay vì chờ hết check_interval"""
+        self.wake.set()
+
+    def run_forever(self):
+        while True:
+            self.wake.clear()
+            status = self.tick()
+            m = self.metrics
+            logger.info(f"Chu kỳ: {status} (chạy {m['executed']}, bỏ qua {m['skipped']}, lỗi {m['failed']})")
+            self.wake.wait(self.next_delay())
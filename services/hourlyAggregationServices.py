@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+from config.server_config import AGGREGATION
+from services.metricsServices import metrics
+
+TIME_COLUMNS = ['YEAR', 'MO', 'DY', 'HR']
+VALUE_COLUMNS = ['QV2M', 'PRECTOTCORR', 'PS', 'T2M', 'ALLSKY_SFC_PAR_TOT']
+AGGREGATORS = ('mean', 'last', 'max')
+
+def aggregate_hourly(frame, policy=None):
+    """Gộp các số đo (cột 'hour' + cột giá trị, theo thứ tự đến) thành một dòng mỗi giờ
+
+    "last" giữ nguyên bản ghi đến sau cùng (kể cả khi giá trị rỗng) như trước đây;
+    "mean"/"max" bỏ qua giá trị rỗng.
+    """
+    policy = policy or AGGREGATION['columns']
+    columns = [col for col in frame.columns if col != 'hour']
+    last = frame.drop_duplicates('hour', keep='last').set_index('hour')
+
+    needs_group = [col for col in columns if policy.get(col, 'last') != 'last']
+    grouped = frame.groupby('hour', sort=False)[needs_group] if needs_group else None
+
+    result = pd.DataFrame(index=last.index)
+    for col in columns:
+        how = policy.get(col, 'last')
+        if how not in AGGREGATORS:
+            raise ValueError(f"Cách gộp '{how}' của cột {col} không hợp lệ, chọn một trong {AGGREGATORS}")
+        result[col] = last[col] if how == 'last' else grouped[col].agg(how)
+    return result
+
+def hourly_index(df):
+    """Cột YEAR/MO/DY/HR -> Series datetime64[ns] cùng index với df
+
+    Tính bằng số học datetime64 của numpy (pd.to_datetime ghép cột tốn vài ms mỗi lần gọi);
+    ngày giờ không hợp lệ hoặc rỗng thì để pd.to_datetime xử lý / báo lỗi như trước.
+    """
+    values = df[TIME_COLUMNS].to_numpy()
+    if values.dtype.kind in 'iu' or (values.dtype.kind == 'f' and np.isfinite(values).all()):
+        year, month, day, hour = values.astype(np.int64).T
+        months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+        days = months.astype('datetime64[D]') + (day - 1)
+        # Ngày vượt số ngày của tháng (31/4...) bị tràn sang tháng sau: kiểm tra lại tháng
+        if ((month >= 1) & (month <= 12) & (day >= 1) & (hour >= 0) & (hour <= 23)
+                & (days.astype('datetime64[M]') == months)).all():
+            times = (days.astype('datetime64[h]') + hour).astype('datetime64[ns]')
+            return pd.Series(times, index=df.index)
+    return pd.to_datetime(df[TIME_COLUMNS].rename(
+        columns={'YEAR': 'year', 'MO': 'month', 'DY': 'day', 'HR': 'hour'}))
+
+def window_completeness(observed, complete, windows=None):
+    """Tỉ lệ giờ đo đủ / được lấp / còn thiếu trong mỗi cửa sổ cuối (72h, 168h, ...)"""
+    report = {}
+    for hours in windows or AGGREGATION['reportWindows']:
+        obs = observed[-hours:]
+        comp = complete[-hours:]
+        report[hours] = {
+            'hours': int(len(obs)),
+            'observed': round(float(obs.mean()) if len(obs) else 0.0, 3),
+            'filled': round(float((comp & ~obs).mean()) if len(obs) else 0.0, 3),
+            'missing': int((~comp).sum() + max(hours - len(obs), 0)),
+        }
+    return report
+
+def fill_gaps(df, method=None, limit=None):
+    """Đưa dữ liệu về lưới giờ liên tục, lấp lỗ ngắn rồi bỏ các giờ vẫn thiếu cột
+
+    Trả về (DataFrame 9 cột chỉ gồm giờ đầy đủ, báo cáo độ đầy đủ của cửa sổ)
+    """
+    method = AGGREGATION['fillMethod'] if method is None else method
+    limit = AGGREGATION['fillLimitHours'] if limit is None else limit
+    if df is None or df.empty:
+        return df, window_completeness(np.zeros(0, bool), np.zeros(0, bool))
+
+    frame = df[VALUE_COLUMNS].astype(float).set_index(hourly_index(df))
+    frame = frame[~frame.index.duplicated(keep='last')].sort_index()
+    grid = pd.date_range(frame.index[0], frame.index[-1], freq='h')
+    frame = frame.reindex(grid)
+    observed = frame.notna().all(axis=1).to_numpy()
+
+    if method == 'interpolate' and limit:
+        frame = frame.interpolate(method='time', limit=limit, limit_area='inside')
+    elif method == 'ffill' and limit:
+        frame = frame.ffill(limit=limit)
+    elif method not in ('interpolate', 'ffill', None, ''):
+        raise ValueError(f"Cách lấp '{method}' không hợp lệ")
+
+    complete = frame.notna().all(axis=1).to_numpy()
+    report = window_completeness(observed, complete)
+    # Gauge, không phải counter: mỗi lần đọc đều thấy lại các giờ cũ nên cộng dồn sẽ đếm trùng
+    metrics.set('sensor_rows_incomplete', int((~complete).sum()), step='fill_gaps')
+
+    frame = frame[complete]
+    frame['YEAR'], frame['MO'], frame['DY'], frame['HR'] = (
+        frame.index.year, frame.index.month, frame.index.day, frame.index.hour)
+    result = frame[TIME_COLUMNS + VALUE_COLUMNS].reset_index(drop=True)
+    return result, report
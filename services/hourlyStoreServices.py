@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+from config.server_config import STORE
+
+COLUMNS = ['YEAR', 'MO', 'DY', 'HR', 'QV2M', 'PRECTOTCORR', 'PS', 'T2M', 'ALLSKY_SFC_PAR_TOT']
+TIME_COLUMNS = ['YEAR', 'MO', 'DY', 'HR']
+
+class HourlyStore:
+    """Kho dữ liệu theo giờ dạng cột, mỗi dòng = [hour_key, 9 cột] (float64)
+
+    - Các segment đã đầy là file .npy bất biến, đọc bằng mmap
+    - Segment cuối được ghi lại (nhỏ, tối đa segmentRows dòng) cho đến khi đầy
+    - Cập nhật một giờ cũ = ghi nối thêm dòng mới, dòng sau cùng được ưu tiên khi đọc
+    """
+
+    def __init__(self, path=None, segment_rows=None):
+        self.path = path or STORE['dir']
+        self.segment_rows = segment_rows or STORE['segmentRows']
+        self.lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        self.index = self._load_index()
+
+    # ===== CHỈ MỤC SEGMENT =====
+    def _index_path(self):
+        return os.path.join(self.path, 'index.json')
+
+    def _load_index(self):
+        if not os.path.exists(self._index_path()):
+            return {'segments': []}
+        with open(self._index_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_index(self):
+        tmp_path = f"{self._index_path()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self._index_path())
+
+    def _segment_file(self, name):
+        return os.path.join(self.path, name)
+
+    def _read_segment(self, segment):
+        return np.load(self._segment_file(segment['name']), mmap_mode='r')
+
+    # ===== GHI =====
+    @staticmethod
+    def hour_keys(df):
+        times = pd.to_datetime(df[TIME_COLUMNS].rename(
+            columns={'YEAR': 'year', 'MO': 'month', 'DY': 'day', 'HR': 'hour'}))
+        return (times.values.astype('datetime64[h]').astype(np.int64)).astype(np.float64)
+
+    def append(self, df):
+        """Ghi nối các dòng của df (9 cột) vào cuối kho"""
+        if df is None or df.empty:
+            return 0
+        rows = np.column_stack([self.hour_keys(df), df[COLUMNS].to_numpy(dtype=np.float64)])
+
+        with self.lock:
+            segments = self.index['segments']
+            while len(rows):
+                if segments and segments[-1]['rows'] < self.segment_rows:
+                    tail_meta = segments[-1]
+                    tail = np.load(self._segment_file(tail_meta['name']))
+                else:
+                    tail_meta = {'name': f"seg-{len(segments):06d}.npy", 'rows': 0}
+                    segments.append(tail_meta)
+                    tail = np.empty((0, len(COLUMNS) + 1))
+
+                take = self.segment_rows - len(tail)
+                chunk, rows = rows[:take], rows[take:]
+                tail = np.concatenate([tail, chunk])
+
+                # Ghi file tạm rồi thay thế để người đọc mmap không thấy file ghi dở
+                tmp_path = self._segment_file(f"{tail_meta['name']}.tmp")
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, tail)
+                os.replace(tmp_path, self._segment_file(tail_meta['name']))
+
+                tail_meta['rows'] = len(tail)
+                tail_meta['min_hour'] = float(tail[:, 0].min())
+                tail_meta['max_hour'] = float(tail[:, 0].max())
+            self._save_index()
+        return len(df)
+
+    def upsert(self, df):
+        """Chỉ ghi các giờ mới hoặc có giá trị thay đổi so với kho"""
+        if df is None or df.empty:
+            return 0
+        keys = self.hour_keys(df)
+        current = self._rows_since(keys.min())
+        stored = {row[0]: row[1:] for row in current}
+        values = df[COLUMNS].to_numpy(dtype=np.float64)
+
+        changed = [
+            i for i, (key, row) in enumerate(zip(keys, values))
+            if key not in stored or not np.array_equal(stored[key], row, equal_nan=True)
+        ]
+        return self.append(df.iloc[changed]) if changed else 0
+
+    # ===== ĐỌC =====
+    def _rows_since(self, min_hour=None, limit=None):
+        """Đọc ngược từ segment mới nhất, mỗi giờ chỉ giữ dòng được ghi sau cùng"""
+        with self.lock:
+            segments = list(self.index['segments'])
+
+        # upsert ghi nối cả giờ cũ nên max_hour không tăng dần theo segment: dừng khi giờ lớn nhất
+        # của segment này và mọi segment ghi trước nó đều nhỏ hơn mốc cần đọc
+        latest = np.maximum.accumulate([segment['max_hour'] for segment in segments]) if segments else []
+        chunks = []
+        keys = np.empty(0)
+        for i in reversed(range(len(segments))):
+            if min_hour is not None and latest[i] < min_hour:
+                break
+            if limit is not None and len(keys) >= limit and latest[i] < keys[-limit]:
+                break
+            segment = segments[i]
+            chunks.append(np.asarray(self._read_segment(segment)))
+            keys = np.union1d(keys, chunks[-1][:, 0])
+
+        if not chunks:
+            return np.empty((0, len(COLUMNS) + 1))
+
+        # Ghép theo thứ tự ghi, đảo ngược để np.unique lấy dòng ghi sau cùng của mỗi giờ
+        rows = np.concatenate(chunks[::-1])[::-1]
+        _, last = np.unique(rows[:, 0], return_index=True)
+        rows = rows[last]
+        if min_hour is not None:
+            rows = rows[rows[:, 0] >= min_hour]
+        return rows[-limit:] if limit is not None else rows
+
+    def read_last(self, hours=None):
+        """Trả về DataFrame gồm `hours` giờ gần nhất, đã sắp xếp theo thời gian"""
+        rows = self._rows_since(limit=hours or STORE['windowHours'])
+        df = pd.DataFrame(rows[:, 1:], columns=COLUMNS)
+        df[TIME_COLUMNS] = df[TIME_COLUMNS].astype(int)
+        return df
+
+    def read_all(self):
+        """Toàn bộ lịch sử trong kho (mỗi giờ một dòng)"""
+        rows = self._rows_since()
+        df = pd.DataFrame(rows[:, 1:], columns=COLUMNS)
+        df[TIME_COLUMNS] = df[TIME_COLUMNS].astype(int)
+        return df
+
+    def is_empty(self):
+        return not self.index['segments']
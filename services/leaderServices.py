@@ -0,0 +1,56 @@
+import os
+import threading
+try:
+    import fcntl
+except ImportError:
+    # Windows không có flock (và không chạy gunicorn): process duy nhất luôn là leader
+    fcntl = None
+
+
+class LeaderLock:
+    """Bầu leader giữa các worker trên cùng máy bằng flock không chờ trên một file
+
+    Worker nào khóa được là leader cho tới khi thoát; kernel tự nhả khóa khi process chết
+    (kể cả bị kill -9) nên một worker khác thử lại sẽ lên thay. File ghi pid của leader.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Thử khóa một lần, trả về True nếu process này là leader"""
+        with self.lock:
+            if self.file is not None or fcntl is None:
+                return True
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            f = open(self.path, 'a+', encoding='utf-8')
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False
+            f.seek(0)
+            f.truncate()
+            f.write(str(os.getpid()))
+            f.flush()
+            self.file = f
+            return True
+
+    def is_leader(self):
+        return self.file is not None or fcntl is None
+
+    def leader_pid(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return int(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+    def release(self):
+        with self.lock:
+            if self.file is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+                self.file.close()
+                self.file = None
@@ -1,21 +1,138 @@
-import requests
+import numpy as np
 import pandas as pd
-from datetime import datetime
 import os
 import json
-from config.server_config import FIREBASE_PATHS
+import threading
+from datetime import datetime, timedelta
+from config.server_config import RETENTION, SYNC, STORE
+from services.hourlyStoreServices import HourlyStore
+from services.nodeCacheServices import get_node_cache
+from services.stationServices import check_station, list_stations, station_dir, station_label, station_path
+from services.firebaseClientServices import FirebaseClient
+from services.hourlyAggregationServices import aggregate_hourly, fill_gaps
+from services.metricsServices import metrics
  # Cấu hình firebase
 base_url = os.getenv("FIREBASE_DATABASE_URL", "https://weather2-b2bc4-default-rtdb.firebaseio.com")
 auth = os.getenv("FIREBASE_AUTH","MWgOuA7M7wkxdVvHXs25RFTFz6Lj3ARVeeKO7JgA")
+# Client dùng chung (đổi client.base_url để trỏ sang server khác, ví dụ khi benchmark)
+client = FirebaseClient(base_url, auth)
+_hourly_stores = {}
+# Báo cáo độ đầy đủ của cửa sổ 72h/168h ở lần lấy dữ liệu gần nhất
+last_completeness = {}
 
-def get_weather_data():
-    print("Đang lấy dữ liệu từ firebase ...")
+def get_hourly_store(station=None):
+    station = check_station(station)
+    if station not in _hourly_stores:
+        _hourly_stores[station] = HourlyStore(station_dir(STORE['dir'], station))
+    return _hourly_stores[station]
 
-    # Lấy dữ liệu từ firebase
-    temp_data = requests.get(f"{base_url}{FIREBASE_PATHS['data_temp']}.json?auth={auth}").json() or {}
-    humidity_data = requests.get(f"{base_url}{FIREBASE_PATHS['data_humidity']}.json?auth={auth}").json() or {}
-    other_data = requests.get(f"{base_url}{FIREBASE_PATHS['data_other']}.json?auth={auth}").json() or {}
-    weather_data = requests.get(f"{base_url}{FIREBASE_PATHS['weather_data']}.json?auth={auth}").json() or {}
+def _node_cache_path(node, station=None):
+    return os.path.join(station_dir(SYNC['cacheDir'], station), node)
+
+def load_node_cache(node, station=None):
+    """Bản lưu cục bộ của node (NodeCache: cursor = key cuối đã thấy, records); chỉ đọc đĩa lần đầu"""
+    return get_node_cache(_node_cache_path(node, station))
+
+def save_node_cache(node, cache, station=None):
+    """Ghi phần thay đổi của cache từ lần ghi trước (delta), không ghi lại cả lịch sử"""
+    cache.save()
+
+def fetch_node(node, start_at=None, station=None):
+    """Lấy một node của trạm; nếu có start_at thì chỉ lấy các key >= start_at (orderBy="$key")"""
+    params = {}
+    if start_at is not None:
+        params['orderBy'] = json.dumps("$key")
+        params['startAt'] = json.dumps(start_at)
+    return client.get(station_path(node, station), params=params, name=station_label(node, station)) or {}
+
+def fetch_edge_key(node, station=None, last=False, start_at=None):
+    """Key đầu (hoặc cuối) của node, chỉ tải một bản ghi (limitToFirst/limitToLast=1)"""
+    params = {'orderBy': json.dumps("$key"), 'limitToLast' if last else 'limitToFirst': 1}
+    if start_at is not None:
+        params['startAt'] = json.dumps(start_at)
+    records = client.get(station_path(node, station), params=params,
+                         name=f"{station_label(node, station)} {'last' if last else 'first'}") or {}
+    return next(iter(records), None) if isinstance(records, dict) else None
+
+def shift_hour(hour, hours):
+    """Giờ dạng %Y%m%d%H cộng thêm `hours` giờ"""
+    return (datetime.strptime(hour[:10], '%Y%m%d%H') + timedelta(hours=hours)).strftime('%Y%m%d%H')
+
+def hour_start_key(hour):
+    """Cận dưới (startAt) cho các key của giờ %Y%m%d%H: thêm phút giây 0000
+
+    Không dùng thẳng 10 chữ số của giờ: chuỗi đó đọc được thành số nguyên 32 bit, mà khi
+    orderBy="$key" Firebase xếp mọi key dạng số nguyên trước các key chuỗi, nên startAt đó
+    đứng trước toàn bộ key thật và truy vấn tải về cả node.
+    """
+    return hour[:10] + '0000'
+
+def retention_start_key(node, station=None):
+    """Khởi động lạnh khi bật RETENTION: chỉ tải keepHours giờ trước key mới nhất thay vì cả node"""
+    latest = fetch_edge_key(node, station, last=True)
+    return hour_start_key(shift_hour(latest, -RETENTION['keepHours'])) if latest else None
+
+def prune_records(cache, cursor):
+    """Bỏ khỏi cache (NodeCache) các bản ghi cũ hơn keepHours so với cursor, trả về số bản ghi đã bỏ"""
+    if not cursor:
+        return 0
+    cutoff = shift_hour(cursor, -RETENTION['keepHours'])
+    old = [key for key in cache.records if key < cutoff]
+    cache.remove(old)
+    return len(old)
+
+def sync_node(node, station=None):
+    """Đồng bộ tăng dần một node, trả về (toàn bộ records, records mới)"""
+    cache = load_node_cache(node, station)
+    start_at = cache.cursor
+    if start_at is None and RETENTION['enabled']:
+        start_at = retention_start_key(node, station)
+    new_records = fetch_node(node, start_at=start_at, station=station)
+    if not isinstance(new_records, dict):
+        return cache.records, {}
+
+    # startAt bao gồm cả key cursor nên key đó được tải lại; bỏ qua nếu không đổi
+    new_records = {
+        key: val for key, val in new_records.items()
+        if cache.records.get(key) != val
+    }
+    if new_records:
+        cache.update(new_records)
+        if RETENTION['enabled']:
+            # Cache giữ đúng cửa sổ keepHours, không lớn dần theo thời gian chạy
+            prune_records(cache, cache.cursor)
+        save_node_cache(node, cache, station)
+    return cache.records, new_records
+
+def get_weather_data(incremental=None, station=None):
+    station = check_station(station)
+    print(f"Đang lấy dữ liệu từ firebase ({station_label('trạm', station)}) ...")
+    if incremental is None:
+        incremental = SYNC['incremental']
+
+    # Lấy song song 4 node từ firebase; weather_data chỉ là bản ghi hiện tại nên luôn lấy toàn bộ
+    source = sync_node if incremental else fetch_node
+    nodes = ['data_temp', 'data_humidity', 'data_other']
+    with metrics.span('fetch'):
+        results = client.run_concurrently({
+            **{node: (lambda node=node: source(node, station=station)) for node in nodes},
+            'weather_data': lambda: fetch_node('weather_data', station=station)
+        })
+    weather_data = results['weather_data']
+    if incremental:
+        (temp_data, new_temp), (humidity_data, new_humidity), (other_data, new_other) = (results[n] for n in nodes)
+        fetched = dict(zip(nodes, (new_temp, new_humidity, new_other)))
+        print(f"Dữ liệu mới: {len(new_temp)} temp, {len(new_humidity)} humidity, {len(new_other)} other")
+    else:
+        temp_data, humidity_data, other_data = (results[n] for n in nodes)
+        fetched = dict(zip(nodes, (temp_data, humidity_data, other_data)))
+    for node, records in fetched.items():
+        metrics.inc('firebase_records_fetched_total', len(records), node=node)
+
+    latency = client.latency_report()
+    labels = [station_label(n, station) for n in nodes + ['weather_data']]
+    print("Thời gian lấy: " + ", ".join(
+        f"{n} {latency[n]['last_ms']:.0f}ms" for n in labels if n in latency))
 
     # Xử lý trường hợp weather_data là đối tượng đơn
     if isinstance(weather_data, dict) and 'last_update' in weather_data:
@@ -23,110 +140,272 @@ def get_weather_data():
 
     print(f"Dữ liệu đã lấy về: {len(temp_data)} temp, {len(humidity_data)} humidity, {len(other_data)} other, {len(weather_data)} weather")
 
-    combined = {}
+    with metrics.span('merge'):
+        if not incremental:
+            raw = merge_sensor_records(temp_data, humidity_data, other_data, weather_data, complete_only=False)
+        else:
+            update_hourly_store(station, temp_data, humidity_data, other_data, weather_data,
+                                (new_temp, new_humidity, new_other))
+            raw = get_hourly_store(station).read_last()
+        return complete_hours(raw)
 
-    # Xử lý dữ liệu nhiệt độ
-    for key, val in temp_data.items():
-        if not isinstance(val, dict) or 'temp' not in val:
-            continue
-        try:
-            ts = key.replace("-temp","")
-            dt = datetime.strptime(ts,"%Y%m%d%H%M%S")
-            time_key = dt.strftime("%Y%m%d%H")
-            combined[time_key] = combined.get(time_key, {})
-            combined[time_key].update({
-                'YEAR': dt.year, 'MO': dt.month, 'DY': dt.day, 'HR': dt.hour,
-                'T2M': val['temp']
-            })
-        except:
-            continue
+def update_hourly_store(station, temp_data, humidity_data, other_data, weather_data, new_records):
+    """Đưa các bản ghi đã đồng bộ vào kho theo giờ; new_records = (temp, humidity, other) mới"""
+    store = get_hourly_store(station)
+    caches = [load_node_cache(node, station) for node in SYNC['nodes']]
+    cutoff = raw_cutoff(caches)
+    if store.is_empty():
+        # Khởi động lạnh: dựng kho theo giờ từ toàn bộ lịch sử đã đồng bộ
+        store.upsert(merge_sensor_records(temp_data, humidity_data, other_data, weather_data,
+                                          complete_only=False))
+        trim_raw_records(caches, cutoff)
+        return
+    # Khởi động ấm / chu kỳ ổn định: chỉ tính lại các giờ có bản ghi mới
+    hours = touched_hours(*new_records, weather_data)
+    late = {hour for hour in hours if cutoff and hour < cutoff}
+    if late:
+        # Bản ghi thô của các giờ này đã bỏ khỏi cache: gộp lại chỉ từ bản ghi mới sẽ ghi đè giờ đã có
+        print(f"⚠️ Bỏ qua bản ghi đến trễ hơn {SYNC['rawHours']} giờ: {', '.join(sorted(late))}")
+        hours -= late
+    if hours:
+        store.upsert(merge_sensor_records(
+            records_in_hours(temp_data, hours),
+            records_in_hours(humidity_data, hours),
+            records_in_hours(other_data, hours),
+            weather_data,
+            complete_only=False
+        ))
+    trim_raw_records(caches, cutoff)
 
-    # Xử lý dữ liệu độ ẩm
-    for key, val in humidity_data.items():
-        if not isinstance(val, dict) or 'humidity' not in val:
-            continue
+def raw_cutoff(caches):
+    """Giờ (%Y%m%d%H) cũ nhất còn giữ bản ghi thô: rawHours giờ trước cursor mới nhất của các node"""
+    cursors = [cache.cursor for cache in caches if cache.cursor]
+    return shift_hour(max(cursors), -SYNC['rawHours']) if cursors else None
+
+def trim_raw_records(caches, cutoff):
+    """Các giờ cũ đã nằm trong kho theo giờ: bỏ bản ghi thô của chúng khỏi cache node
+
+    Cache chỉ còn O(rawHours) bản ghi nên khởi động ấm không phải đọc cả lịch sử và
+    records_in_hours không phải duyệt cả lịch sử mỗi chu kỳ
+    """
+    if not cutoff:
+        return
+    for cache in caches:
+        old = [key for key in cache.records if key < cutoff]
+        if old:
+            cache.remove(old)
+            cache.save()
+
+def complete_hours(raw):
+    """Lấp các lỗ ngắn để cửa sổ 72h/168h liên tục, bỏ các giờ vẫn thiếu"""
+    df, report = fill_gaps(raw)
+    last_completeness.clear()
+    last_completeness.update(report)
+    print("Độ đầy đủ: " + ", ".join(
+        f"{h}h đo {r['observed']:.0%} lấp {r['filled']:.0%} thiếu {r['missing']}" for h, r in report.items()))
+    print(f" Trả về {len(df)} records với 9 columns")
+    return df
+
+def get_stations_data(stations=None, incremental=None):
+    """Lấy dữ liệu của nhiều trạm: {mã trạm: DataFrame}; trạm lỗi được bỏ qua và báo lại"""
+    datas = {}
+    # Tuần tự từng trạm: mỗi trạm đã lấy song song 4 node trên pool của client
+    for station in stations or list_stations():
         try:
-            ts = key.replace("-humidity", "")
-            dt = datetime.strptime(ts, "%Y%m%d%H%M%S")
-            time_key = dt.strftime("%Y%m%d%H")
-            if time_key in combined:
-                combined[time_key]['QV2M'] = val['humidity']
-        except:
-            continue
+            datas[station] = get_weather_data(incremental, station=station)
+        except Exception as e:
+            print(f"❌ Lỗi lấy dữ liệu trạm {station}: {e}")
+    if not datas:
+        raise RuntimeError("Không lấy được dữ liệu của trạm nào")
+    return datas
+
+def touched_hours(*nodes):
+    """Tập các giờ (dạng %Y%m%d%H) có bản ghi mới"""
+    hours = set()
+    for records in nodes:
+        for key, val in records.items():
+            if isinstance(val, dict) and 'last_update' in val:
+                hours.add(str(val['last_update'])[:13].replace('-', '').replace(' ', ''))
+            else:
+                hours.add(key[:10])
+    return hours
 
-    # Xử lý dữ liệu khác
-    for key, val in other_data.items():
-        if not isinstance(val, dict):
+def records_in_hours(records, hours):
+    return {key: val for key, val in records.items() if key[:10] in hours}
+
+COLUMN_ORDER = ['YEAR', 'MO', 'DY', 'HR', 'QV2M', 'PRECTOTCORR', 'PS', 'T2M', 'ALLSKY_SFC_PAR_TOT']
+OTHER_FIELDS = ['PRECTOTCORR', 'PS', 'ALLSKY_SFC_PAR_TOT']
+
+def parse_key_hours(keys, suffix):
+    """Key dạng %Y%m%d%H%M%S + suffix -> giờ (đã làm tròn), NaT nếu key sai định dạng
+
+    Tách chữ số trực tiếp trên mảng byte thay vì strptime từng key
+    """
+    arr = np.array(keys, dtype=str)
+    width = 14
+    valid = (np.char.str_len(arr) == width + len(suffix)) & np.char.endswith(arr, suffix)
+    try:
+        digits = np.frombuffer(arr.astype(f'S{width}').tobytes(), dtype=np.uint8).reshape(-1, width) - ord('0')
+    except UnicodeEncodeError:
+        # Có key không phải ASCII: dùng đường chậm nhưng chắc chắn
+        return pd.to_datetime(pd.Series(keys).str.replace(suffix, '', regex=False),
+                              format="%Y%m%d%H%M%S", errors='coerce').dt.floor('h')
+    valid &= (digits <= 9).all(axis=1)
+    digits = digits.astype(np.int64)
+
+    def number(start, end):
+        return (digits[:, start:end] * 10 ** np.arange(end - start - 1, -1, -1)).sum(axis=1)
+
+    parts = pd.DataFrame({'year': number(0, 4), 'month': number(4, 6), 'day': number(6, 8), 'hour': number(8, 10)})
+    valid &= (number(10, 12) < 60) & (number(12, 14) <= 61)
+    parts[~valid] = 0  # ngày 0 không hợp lệ -> NaT
+    return pd.to_datetime(parts, errors='coerce')
+
+def parse_sensor_node(records, suffix, fields, required=None, policy=None):
+    """Chuyển một node {key thời gian: {...}} thành DataFrame theo giờ trong một lượt
+
+    fields: {tên cột: tên trường trong bản ghi}. Các số đo trong cùng giờ được gộp theo
+    AGGREGATION (mặc định giữ bản ghi đến sau cùng như vòng lặp dict trước đây);
+    key không đúng định dạng được đếm và báo lại.
+    """
+    keys, values = [], []
+    for key, val in records.items():
+        if isinstance(val, dict) and (required is None or required in val):
+            keys.append(key)
+            values.append(val)
+    if not keys:
+        return pd.DataFrame(columns=list(fields), index=pd.DatetimeIndex([], name='hour'))
+
+    frame = pd.DataFrame({
+        col: pd.to_numeric(pd.Series([val.get(field) for val in values], dtype=object), errors='coerce')
+        for col, field in fields.items()
+    })
+    frame['hour'] = parse_key_hours(keys, suffix)
+
+    invalid = frame['hour'].isna()
+    if invalid.any():
+        print(f"⚠️ Bỏ qua {int(invalid.sum())} key sai định dạng trong node {suffix.strip('-')}")
+        frame = frame[~invalid]
+
+    return aggregate_hourly(frame, policy)
+
+def merge_sensor_records(temp_data, humidity_data, other_data, weather_data, complete_only=True, policy=None):
+    """Gộp các node cảm biến thành DataFrame theo giờ với 9 cột
+
+    complete_only=True: chỉ giữ giờ có đủ 9 cột (như trước đây, nhiệt độ quyết định các giờ có mặt).
+    complete_only=False: giữ mọi giờ có số đo, cột thiếu để NaN cho bước lấp lỗ.
+    """
+    temp = parse_sensor_node(temp_data, "-temp", {'T2M': 'temp'}, required='temp', policy=policy)
+    humidity = parse_sensor_node(humidity_data, "-humidity", {'QV2M': 'humidity'}, required='humidity', policy=policy)
+    other = parse_sensor_node(other_data, "-other", {col: col for col in OTHER_FIELDS}, policy=policy)
+
+    how = 'left' if complete_only else 'outer'
+    df = temp.join(humidity, how=how).join(other, how=how)
+    # Cột "có mặt" kể cả khi giá trị là None (như len(data) == 9 trước đây)
+    present = pd.DataFrame({
+        'T2M': df.index.isin(temp.index),
+        'QV2M': df.index.isin(humidity.index),
+        **{col: df.index.isin(other.index) for col in OTHER_FIELDS}
+    }, index=df.index)
+
+    # Xử lý dữ liệu thời tiết hiện tại (ghi đè giá trị của giờ tương ứng)
+    weather_fields = {'temperature': 'T2M', 'humidity': 'QV2M', 'ALLSKY_SFC_PAR_TOT': 'ALLSKY_SFC_PAR_TOT',
+                      'PRECTOTCORR': 'PRECTOTCORR', 'pressure': 'PS'}
+    for val in (weather_data.values() if isinstance(weather_data, dict) else []):
+        if not isinstance(val, dict) or 'last_update' not in val:
             continue
-        try:
-            ts = key.replace("-other", "")
-            dt = datetime.strptime(ts, "%Y%m%d%H%M%S")
-            time_key = dt.strftime("%Y%m%d%H")
-            if time_key in combined:
-                combined[time_key].update({
-                    'PRECTOTCORR': val.get('PRECTOTCORR'),
-                    'PS': val.get('PS'),
-                    'ALLSKY_SFC_PAR_TOT': val.get('ALLSKY_SFC_PAR_TOT')
-                })
-        except:
+        hour = pd.to_datetime(val['last_update'], format="%Y-%m-%d %H:%M:%S", errors='coerce')
+        if pd.isna(hour):
+            print(f"⚠️ Bỏ qua weather_data có last_update sai định dạng: {val['last_update']}")
             continue
+        hour = hour.floor('h')  # Làm tròn phút giây về 0
+        if hour not in df.index:
+            df.loc[hour] = np.nan
+            present.loc[hour] = False
+        for field, col in weather_fields.items():
+            if isinstance(val.get(field), (int, float)):
+                # Chuyển đổi hPa sang Pa
+                df.loc[hour, col] = val[field] * 100 if field == 'pressure' else val[field]
+                present.loc[hour, col] = True
+
+    if complete_only:
+        # Chỉ giữ các giờ có đủ 9 cột
+        complete = present.all(axis=1)
+        metrics.inc('sensor_rows_dropped_total', int((~complete).sum()), step='merge')
+        df = df[complete]
+    else:
+        df = df.where(present)
+    df = df.sort_index()
 
-    # Xử lý dữ liệu thời tiết hiện tại
-    if isinstance(weather_data, dict):
-        for key, val in weather_data.items():
-            if not isinstance(val, dict) or 'last_update' not in val:
-                continue
-            try:
-                dt = datetime.strptime(val['last_update'], "%Y-%m-%d %H:%M:%S")
-                dt = dt.replace(minute=0, second=0)  # Làm tròn phút giây về 0
-                time_key = dt.strftime("%Y%m%d%H")
-                
-                if time_key not in combined:
-                    combined[time_key] = {
-                        'YEAR': dt.year, 'MO': dt.month, 'DY': dt.day, 'HR': dt.hour
-                    }
-                
-                # Cập nhật với giá trị từ weather_data
-                if 'temperature' in val and isinstance(val['temperature'], (int, float)):
-                    combined[time_key]['T2M'] = val['temperature']
-                if 'humidity' in val and isinstance(val['humidity'], (int, float)):
-                    combined[time_key]['QV2M'] = val['humidity']
-                if 'ALLSKY_SFC_PAR_TOT' in val and isinstance(val['ALLSKY_SFC_PAR_TOT'], (int, float)):
-                    combined[time_key]['ALLSKY_SFC_PAR_TOT'] = val['ALLSKY_SFC_PAR_TOT']
-                if 'PRECTOTCORR' in val and isinstance(val['PRECTOTCORR'], (int, float)):
-                    combined[time_key]['PRECTOTCORR'] = val['PRECTOTCORR']
-                if 'pressure' in val and isinstance(val['pressure'], (int, float)):
-                    combined[time_key]['PS'] = val['pressure'] * 100  # Chuyển đổi hPa sang Pa
-            except:
-                continue
-
-    # Tạo DataFrame
-    records = [data for data in combined.values() if len(data) == 9]
-    df = pd.DataFrame(records)
-        
     if df.empty:
         print("⚠️ Không có dữ liệu!")
-        return df
-        
-    # Sắp xếp và định thứ tự cột
-    df = df.sort_values(['YEAR', 'MO', 'DY', 'HR'])
-    column_order = ['YEAR', 'MO', 'DY', 'HR', 'QV2M', 'PRECTOTCORR', 'PS', 'T2M', 'ALLSKY_SFC_PAR_TOT']
-    df = df[column_order]
-        
+        return pd.DataFrame(columns=COLUMN_ORDER)
+
+    df['YEAR'], df['MO'], df['DY'], df['HR'] = df.index.year, df.index.month, df.index.day, df.index.hour
+    df = df[COLUMN_ORDER].reset_index(drop=True)
+
     print(f" Trả về {len(df)} records với 9 columns")
     return df
+
 def delete_data_from_firebase( node):
-    url = f"{base_url}/{node}.json?auth={auth}"
-    resp = requests.delete(url)
-    resp.raise_for_status()
-    return resp.json()
+    return client.delete(node)
 
 def push_data_to_firebase( node, data):
     # Xóa dữ liệu cũ trước
     delete_data_from_firebase(node)
 
-    url = f"{base_url}/{node}.json?auth={auth}"
-    headers = {'Content-Type': 'application/json'}
-    resp = requests.patch(url, data=json.dumps(data), headers=headers)
-    resp.raise_for_status()
-    return resp.json()
\ No newline at end of file
+    return client.patch(node, data)
+
+# ===== GHI THEO DIFF =====
+# Bản dữ liệu đã đẩy lần trước của từng node, dùng để chỉ gửi phần thay đổi
+_pushed_snapshots = {}
+_snapshot_lock = threading.Lock()
+
+def fetch_node_keys(node):
+    """Lấy danh sách key hiện có của node (shallow=true, không tải giá trị)"""
+    keys = client.get(node, params={'shallow': 'true'}, name=f"{node} shallow") or {}
+    return list(keys) if isinstance(keys, dict) else []
+
+def build_forecast_update(nodes):
+    """Tạo multi-path update tối thiểu: key mới/đổi được ghi, key hết hạn được đặt null"""
+    updates = {}
+    for node, data in nodes.items():
+        previous = _pushed_snapshots.get(node)
+        if previous is None:
+            # Lần đầu sau khi khởi động: chưa biết giá trị cũ nên ghi lại toàn bộ, xóa key thừa
+            previous = {key: None for key in fetch_node_keys(node)}
+            for key, value in data.items():
+                updates[f"{node}/{key}"] = value
+        else:
+            for key, value in data.items():
+                if previous.get(key) != value:
+                    updates[f"{node}/{key}"] = value
+        for key in previous:
+            if key not in data:
+                updates[f"{node}/{key}"] = None
+    return updates
+
+def push_forecasts_to_firebase(nodes):
+    """Đẩy nhiều node trong một PATCH tại gốc (atomic), không có lúc node bị trống
+
+    Lock chỉ giữ khi tính diff, PATCH chạy ngoài lock. PATCH lỗi thì trả lại snapshot cũ.
+    """
+    with _snapshot_lock:
+        updates = build_forecast_update(nodes)
+        previous = {node: _pushed_snapshots.get(node) for node in nodes}
+        for node, data in nodes.items():
+            _pushed_snapshots[node] = json.loads(json.dumps(data))
+    if updates:
+        try:
+            with metrics.span('push'):
+                client.patch('', updates, name='forecast update')
+        except Exception:
+            with _snapshot_lock:
+                for node, data in previous.items():
+                    if data is None:
+                        _pushed_snapshots.pop(node, None)
+                    else:
+                        _pushed_snapshots[node] = data
+            raise
+        metrics.inc('forecast_keys_pushed_total', len(updates))
+    return len(updates)
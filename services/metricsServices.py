@@ -0,0 +1,169 @@
+import bisect
+import threading
+import time
+from config.server_config import METRICS
+
+# Mô tả cho dòng # HELP của Prometheus
+METRIC_HELP = {
+    'weather_stage_seconds': 'Thời gian từng giai đoạn của chu kỳ dự báo',
+    'forecast_task_seconds': 'Thời gian từ lúc gửi tới lúc xong của từng tác vụ dự báo',
+    'forecast_cycles_total': 'Số chu kỳ dự báo theo kết quả',
+    'firebase_request_seconds': 'Độ trễ request tới Firebase (kể cả thử lại)',
+    'firebase_requests_total': 'Số request tới Firebase theo kết quả',
+    'firebase_retries_total': 'Số lần thử lại request tới Firebase',
+    'firebase_bytes_total': 'Số byte nhận từ Firebase',
+    'firebase_records_fetched_total': 'Số bản ghi cảm biến lấy về (mới, nếu đồng bộ tăng dần)',
+    'sensor_rows_dropped_total': 'Số giờ có số đo nhưng bị bỏ vì thiếu cột khi gộp với complete_only (trước đây là lọc len(data) == 9)',
+    'sensor_rows_incomplete': 'Số giờ vẫn thiếu cột sau khi lấp lỗ (bị bỏ) trong lần đọc gần nhất',
+    'forecast_keys_pushed_total': 'Số key được ghi (hoặc xóa) trên Firebase',
+    'forecast_memo_lookups_total': 'Số lần tra forecast_memo theo kết quả',
+    'firebase_stream_connects_total': 'Số lần mở luồng SSE tới Firebase',
+    'firebase_stream_reconnects_total': 'Số lần luồng SSE bị ngắt và phải kết nối lại',
+    'inference_worker_requests_total': 'Số request suy luận gửi sang tiến trình suy luận',
+    'inference_worker_batches_total': 'Số lần gọi model trong tiến trình suy luận (mỗi lần gồm một hoặc nhiều request)',
+    'inference_worker_restarts_total': 'Số lần tiến trình suy luận chết và được khởi động lại',
+    'simulate_windows_total': 'Số cửa sổ dữ liệu đã dự báo qua /api/forecast/simulate',
+    'retention_hours_archived_total': 'Số giờ đã gộp vào kho lưu trữ cục bộ',
+    'retention_records_deleted_total': 'Số bản ghi cảm biến cũ đã xóa khỏi Firebase sau khi lưu trữ',
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+class Histogram:
+    """Histogram tích lũy kiểu Prometheus: đếm theo bucket (giây), tổng và số lần"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Span:
+    """with metrics.span('fetch'): ... -> ghi thời gian vào weather_stage_seconds{stage="fetch"}"""
+    __slots__ = ('registry', 'name', 'labels', 'start')
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_no_span = _NoSpan()
+
+
+class MetricsRegistry:
+    """Counter và histogram trong bộ nhớ của process, xuất ra dạng text của Prometheus
+
+    Khóa là (tên, các nhãn đã sắp xếp); tắt METRICS['enabled'] thì mọi lệnh ghi thành no-op.
+    """
+
+    def __init__(self, buckets=None):
+        self.buckets = sorted(buckets or METRICS['buckets'])
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        if not METRICS['enabled']:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Gauge: giá trị mới nhất (tên không kết thúc bằng _total)"""
+        if not METRICS['enabled']:
+            return
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, seconds, **labels):
+        if not METRICS['enabled']:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def span(self, stage, **labels):
+        if not METRICS['enabled']:
+            return _no_span
+        return Span(self, 'weather_stage_seconds', {'stage': stage, **labels})
+
+    def add_collector(self, collect):
+        """collect() -> {(tên, (nhãn...)): giá trị} đọc lúc render (số liệu đã có ở nơi khác)"""
+        self.collectors.append(collect)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render(self):
+        """Text format 0.0.4 của Prometheus"""
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: (list(h.counts), h.sum, h.count) for key, h in self.histograms.items()}
+        for collect in self.collectors:
+            counters.update(collect())
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+            for (key_name, labels), value in sorted(counters.items()):
+                if key_name == name:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for (key_name, labels), (counts, total, count) in sorted(histograms.items()):
+                if key_name != name:
+                    continue
+                cumulative = 0
+                for bound, n in zip(self.buckets + [float('inf')], counts):
+                    cumulative += n
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{name}_bucket{_labels(labels, ('le', le))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {total}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+from config.server_config import SYNC
+
+
+class NodeCache:
+    """Bản lưu cục bộ của một node cảm biến, giữ trong bộ nhớ giữa các chu kỳ đồng bộ
+
+    - {node}.json: snapshot {'cursor', 'records'}, chỉ đọc một lần khi khởi động
+    - {node}.log: mỗi dòng một delta {'cursor', 'records': {key: giá trị hoặc null = đã xóa}} ghi nối
+      sau snapshot, nên mỗi chu kỳ chỉ ghi phần thay đổi
+    - Sau SYNC['checkpointEvery'] delta (hoặc khi delta lớn hơn nửa cache) thì ghi lại snapshot
+      và xóa log (checkpoint)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.cursor = None
+        self.records = {}
+        self.dirty = set()
+        self.deltas = 0
+        self._load()
+
+    def _snapshot_path(self):
+        return f"{self.path}.json"
+
+    def _log_path(self):
+        return f"{self.path}.log"
+
+    def _load(self):
+        try:
+            with open(self._snapshot_path(), 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            self.cursor = snapshot.get('cursor')
+            self.records = snapshot.get('records') or {}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Bỏ qua cache hỏng {self._snapshot_path()}: {e}")
+        try:
+            with open(self._log_path(), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        delta = json.loads(line)
+                    except ValueError:
+                        # Dòng cuối ghi dở khi process bị dừng giữa chừng
+                        break
+                    self._apply(delta)
+                    self.deltas += 1
+        except FileNotFoundError:
+            pass
+
+    def _apply(self, delta):
+        for key, val in delta['records'].items():
+            if val is None:
+                self.records.pop(key, None)
+            else:
+                self.records[key] = val
+        self.cursor = delta.get('cursor', self.cursor)
+
+    # ===== THAY ĐỔI =====
+    def update(self, records):
+        """Thêm / ghi đè bản ghi, dời cursor tới key lớn nhất"""
+        if not records:
+            return
+        self.records.update(records)
+        self.dirty.update(records)
+        self.cursor = max(records) if self.cursor is None else max(self.cursor, max(records))
+
+    def mark(self, keys):
+        """Báo các key đã được sửa trực tiếp trên self.records (luồng SSE)"""
+        self.dirty.update(keys)
+
+    def remove(self, keys):
+        for key in keys:
+            self.records.pop(key, None)
+        self.dirty.update(keys)
+
+    # ===== GHI ĐĨA =====
+    def save(self):
+        """Ghi nối delta của các key đã đổi từ lần trước; đủ checkpointEvery delta thì ghi lại snapshot"""
+        with self.lock:
+            if not self.dirty:
+                return
+            # Delta lớn (khởi động lạnh tải cả node) thì ghi thẳng snapshot
+            if self.deltas + 1 >= SYNC['checkpointEvery'] or 2 * len(self.dirty) > len(self.records):
+                self._checkpoint()
+                return
+            delta = {'cursor': self.cursor, 'records': {key: self.records.get(key) for key in self.dirty}}
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self._log_path(), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(delta, ensure_ascii=False, separators=(',', ':')) + '\n')
+            self.dirty.clear()
+            self.deltas += 1
+
+    def _checkpoint(self):
+        # Ghi snapshot ra file tạm rồi thay thế, sau đó mới xóa log (chết giữa chừng thì log được áp lại,
+        # cùng kết quả vì delta ghi giá trị cuối của key)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self._snapshot_path()}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'cursor': self.cursor, 'records': self.records}, f,
+                      ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self._snapshot_path())
+        if os.path.exists(self._log_path()):
+            os.remove(self._log_path())
+        self.dirty.clear()
+        self.deltas = 0
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_node_cache(path):
+    """NodeCache dùng chung theo đường dẫn: đọc đĩa lần đầu, các chu kỳ sau dùng bản trong bộ nhớ"""
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = NodeCache(path)
+        return _caches[path]
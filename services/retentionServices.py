@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+from config.server_config import RETENTION, SYNC
+from services.hourlyAggregationServices import VALUE_COLUMNS, hourly_index
+from services.metricsServices import metrics
+from services.stationServices import check_station, list_stations, station_dir, station_path
+import services.loadDataFirebaseServices as firebase
+
+SENSOR_NODES = SYNC['nodes']
+
+
+def epoch_hours(times):
+    return (pd.DatetimeIndex(times).asi8 // 3_600_000_000_000).astype(np.int64)
+
+
+class HourlyArchive:
+    """Kho lưu trữ lịch sử đã gộp theo giờ của một trạm, mỗi tháng một file .npz nén
+
+    - hour: giờ tính từ epoch (int64), values: VALUE_COLUMNS (float32), readings: số bản ghi
+      gốc của từng node cảm biến trong giờ đó (uint16)
+    - Ghi file tạm rồi thay thế: bản ghi chỉ bị xóa trên Firebase sau khi file đã ghi xong
+    - Một giờ được lưu lại lần nữa thì bản mới thay bản cũ
+    """
+
+    def __init__(self, station=None, path=None):
+        self.path = path or station_dir(RETENTION['archiveDir'], check_station(station))
+        self.lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def _month_file(self, month):
+        return os.path.join(self.path, f"{month}.npz")
+
+    def _read_month(self, month):
+        path = self._month_file(month)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as f:
+            return f['hour'], f['values'], f['readings']
+
+    def append(self, df, readings):
+        """df: DataFrame theo giờ (TIME_COLUMNS + VALUE_COLUMNS); readings: mảng (len(df), số node)"""
+        if df.empty:
+            return 0
+        hours = epoch_hours(hourly_index(df))
+        values = df[VALUE_COLUMNS].to_numpy(dtype=np.float32)
+        readings = np.minimum(readings, np.iinfo(np.uint16).max).astype(np.uint16)
+        months = pd.to_datetime(hours * 3600, unit='s').strftime('%Y-%m').to_numpy()
+        with self.lock:
+            for month in np.unique(months):
+                rows = months == month
+                new_hours, new_values, new_readings = hours[rows], values[rows], readings[rows]
+                old = self._read_month(month)
+                if old is not None:
+                    keep = ~np.isin(old[0], new_hours)
+                    new_hours = np.concatenate([old[0][keep], new_hours])
+                    new_values = np.concatenate([old[1][keep], new_values])
+                    new_readings = np.concatenate([old[2][keep], new_readings])
+                order = np.argsort(new_hours, kind='stable')
+                tmp_path = f"{self._month_file(month)}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    np.savez_compressed(f, hour=new_hours[order], values=new_values[order],
+                                        readings=new_readings[order])
+                os.replace(tmp_path, self._month_file(month))
+        return len(hours)
+
+    def months(self):
+        return sorted(name[:-4] for name in os.listdir(self.path) if name.endswith('.npz'))
+
+    def read(self, start=None, end=None):
+        """DataFrame theo giờ (time + VALUE_COLUMNS + số bản ghi mỗi node) trong [start, end)"""
+        frames = []
+        for month in self.months():
+            if (start is not None and month < pd.Timestamp(start).strftime('%Y-%m')) or \
+                    (end is not None and month > pd.Timestamp(end).strftime('%Y-%m')):
+                continue
+            hours, values, readings = self._read_month(month)
+            frame = pd.DataFrame(values.astype(np.float64), columns=VALUE_COLUMNS)
+            frame[[f"{node}_readings" for node in SENSOR_NODES]] = readings
+            frame.insert(0, 'time', pd.to_datetime(hours * 3600, unit='s'))
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame(columns=['time'] + VALUE_COLUMNS + [f"{node}_readings" for node in SENSOR_NODES])
+        df = pd.concat(frames, ignore_index=True)
+        if start is not None:
+            df = df[df['time'] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df['time'] < pd.Timestamp(end)]
+        return df.reset_index(drop=True)
+
+
+def retention_cutoff(station=None):
+    """Giờ đầu tiên được giữ lại: keepHours trước key mới nhất của các node cảm biến
+
+    Tính theo dữ liệu chứ không theo đồng hồ: trạm ngừng gửi một thời gian thì lịch sử
+    gần nhất vẫn còn đủ cho model.
+    """
+    latest = [firebase.fetch_edge_key(node, station, last=True) for node in SENSOR_NODES]
+    latest = [key for key in latest if key]
+    return firebase.shift_hour(max(latest), -RETENTION['keepHours']) if latest else None
+
+
+def fetch_chunk(node, station, start_hour, end_hour):
+    """Các bản ghi có giờ trong [start_hour, end_hour) (key bắt đầu bằng %Y%m%d%H)"""
+    params = {'orderBy': json.dumps("$key"), 'startAt': json.dumps(firebase.hour_start_key(start_hour)),
+              'endAt': json.dumps(firebase.shift_hour(end_hour, -1) + '\uf8ff')}
+    records = firebase.client.get(station_path(node, station), params=params, name=f"{node} archive")
+    return records if isinstance(records, dict) else {}
+
+
+def readings_per_hour(records, hours):
+    """Số bản ghi gốc của node trong từng giờ (theo thứ tự `hours`, dạng %Y%m%d%H)"""
+    counts = pd.Series([key[:10] for key in records], dtype=object).value_counts()
+    return counts.reindex(hours, fill_value=0).to_numpy()
+
+
+def delete_records(station, keys_by_node, batch_size=None):
+    """Xóa các key bằng PATCH nhiều đường dẫn tại gốc (giá trị null), mỗi PATCH tối đa batch_size key"""
+    batch_size = batch_size or RETENTION['batchSize']
+    paths = [f"{station_path(node, station).strip('/')}/{key}"
+             for node, keys in keys_by_node.items() for key in keys]
+    for i in range(0, len(paths), batch_size):
+        firebase.client.patch('', dict.fromkeys(paths[i:i + batch_size]), name='retention delete')
+    metrics.inc('retention_records_deleted_total', len(paths))
+    return len(paths)
+
+
+def archive_station(station=None, dry_run=False):
+    """Lưu trữ rồi xóa các bản ghi cũ hơn cutoff của một trạm, từng khúc chunkHours giờ
+
+    Mỗi khúc chỉ giữ bản ghi của chunkHours giờ trong bộ nhớ nên đợt lưu trữ đầu tiên trên một
+    hệ thống đã chạy lâu cũng không tải cả lịch sử. Lỗi giữa chừng: các khúc trước đã xong, khúc
+    đang làm được làm lại ở lần sau (lưu lại một giờ thì bản mới thay bản cũ).
+    """
+    station = check_station(station)
+    report = {'station': station, 'cutoff': retention_cutoff(station), 'hours': 0, 'deleted': 0, 'chunks': 0}
+    cutoff = report['cutoff']
+    if cutoff is None:
+        return report
+    archive = HourlyArchive(station)
+
+    def next_start(start_at=None):
+        # Giờ của key cũ nhất (từ start_at) trong cả 3 node
+        keys = [firebase.fetch_edge_key(node, station, start_at=start_at) for node in SENSOR_NODES]
+        keys = [key[:10] for key in keys if key and key[:10].isdigit()]
+        return min(keys) if keys else None
+
+    start = next_start()
+    while start is not None and start < cutoff:
+        end = min(firebase.shift_hour(start, RETENTION['chunkHours']), cutoff)
+        with metrics.span('retention'):
+            records = firebase.client.run_concurrently(
+                {node: (lambda node=node: fetch_chunk(node, station, start, end)) for node in SENSOR_NODES})
+            df = firebase.merge_sensor_records(*(records[node] for node in SENSOR_NODES), {},
+                                               complete_only=False)
+            if not df.empty and not dry_run:
+                hours = hourly_index(df).dt.strftime('%Y%m%d%H')
+                readings = np.column_stack([readings_per_hour(records[node], hours) for node in SENSOR_NODES])
+                archive.append(df, readings)
+            if not dry_run:
+                report['deleted'] += delete_records(station, records)
+        report['hours'] += len(df)
+        report['chunks'] += 1
+        # Khúc trống: nhảy thẳng tới key cũ nhất sau khúc thay vì đi qua từng khúc của khoảng trống
+        start = end if any(records.values()) else next_start(end)
+        del records, df
+    metrics.inc('retention_hours_archived_total', report['hours'])
+    return report
+
+
+def run_retention(stations=None, dry_run=False):
+    """Lưu trữ mọi trạm đã đăng ký; trạm lỗi được bỏ qua và báo lại"""
+    reports = {}
+    for station in stations or list_stations():
+        try:
+            reports[station] = archive_station(station, dry_run)
+            r = reports[station]
+            print(f"🗄️ Lưu trữ {station}: {r['hours']} giờ trước {r['cutoff']}, xóa {r['deleted']} bản ghi")
+        except Exception as e:
+            print(f"❌ Lỗi lưu trữ trạm {station}: {e}")
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lưu trữ và xóa bản ghi cảm biến cũ trên Firebase")
+    parser.add_argument('--station', nargs='*', help='mặc định mọi trạm đã đăng ký')
+    parser.add_argument('--dry-run', action='store_true', help='chỉ đếm, không ghi file và không xóa')
+    parser.add_argument('--keep-hours', type=int, default=RETENTION['keepHours'])
+    args = parser.parse_args()
+    RETENTION['keepHours'] = args.keep_hours
+    run_retention(args.station, args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+import os
+from config.server_config import FIREBASE_PATHS, STATIONS
+
+DEFAULT_STATION = STATIONS['default']
+
+def list_stations():
+    return list(STATIONS['stations'])
+
+def check_station(station=None):
+    """Trả về mã trạm (None -> trạm mặc định), báo lỗi nếu trạm chưa đăng ký"""
+    station = station or DEFAULT_STATION
+    if station not in STATIONS['stations']:
+        raise ValueError(f"Trạm không tồn tại: {station}")
+    return station
+
+def station_path(node, station=None):
+    """Đường dẫn Firebase của node cho một trạm; trạm mặc định giữ nguyên đường dẫn cũ"""
+    station = check_station(station)
+    if station == DEFAULT_STATION:
+        return FIREBASE_PATHS[node]
+    return f"{STATIONS['root']}/{station}{FIREBASE_PATHS[node]}"
+
+def station_dir(base, station=None):
+    """Thư mục dữ liệu cục bộ của trạm (cache, kho theo giờ...)"""
+    station = check_station(station)
+    if station == DEFAULT_STATION:
+        return base
+    return os.path.join(base, 'stations', station)
+
+def station_label(name, station=None):
+    """Tên dùng trong log/thống kê độ trễ: 'data_temp' hoặc 'hue/data_temp'"""
+    station = station or DEFAULT_STATION
+    return name if station == DEFAULT_STATION else f"{station}/{name}"